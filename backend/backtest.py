@@ -0,0 +1,57 @@
+import argparse
+import json
+import time
+
+import main
+
+# Rolling-origin backtest of the forecasting models, outside the API server.
+# Long runs can be stopped and continued from their checkpoints:
+#   python backtest.py --origins 12
+#   python backtest.py --resume <run_id>
+# Results are in the backtest_* tables and at GET /api/backtest/<run_id>.
+
+def run():
+    parser = argparse.ArgumentParser(description="Backtest forecasts against past sales")
+    parser.add_argument("--product-id", type=int, action="append", dest="product_ids",
+                        help="Only backtest this product (repeatable, default all)")
+    parser.add_argument("--horizon", type=int, default=30, help="Days forecast from each origin")
+    parser.add_argument("--origins", type=int, default=6, help="Forecast origins per product")
+    parser.add_argument("--step", type=int, help="Days between origins (default: horizon)")
+    parser.add_argument("--min-train-days", type=int, default=60,
+                        help="Least history before the first origin")
+    parser.add_argument("--strategy", choices=main.ARIMA_SEARCH_STRATEGIES)
+    parser.add_argument("--model", choices=("auto", *main.FORECAST_MODELS))
+    parser.add_argument("--resume", metavar="RUN_ID", help="Continue an interrupted run")
+    args = parser.parse_args()
+
+    main.init_db()
+    with main.db_pool.connection() as conn:
+        if args.resume:
+            run_id = args.resume
+        else:
+            product_ids = args.product_ids or [row[0] for row in conn.execute("SELECT id FROM products ORDER BY id")]
+            request = main.BacktestRequest(horizon=args.horizon, origins=args.origins, step=args.step,
+                                           min_train_days=args.min_train_days, strategy=args.strategy,
+                                           model=args.model)
+            run_id = main.create_backtest_run(conn, product_ids, request, runner="cli")
+    print(f"Backtest run {run_id}")
+
+    started = time.time()
+    try:
+        status = main.run_backtest(run_id)
+    finally:
+        main.shutdown_backtest_pool()
+        main.shutdown_arima_pool()
+
+    with main.db_pool.connection() as conn:
+        run = conn.execute("SELECT * FROM backtest_runs WHERE id = ?", (run_id,)).fetchone()
+        if run is None:
+            print("No such run")
+            return
+        result = main.backtest_run_to_dict(conn, run)
+    print(f"{status} in {time.time() - started:.1f}s: {result['products_done']}/{result['products_total']} products")
+    print(json.dumps(result["summary"], indent=2))
+    main.db_pool.close_all()
+
+if __name__ == "__main__":
+    run()
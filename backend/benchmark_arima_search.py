@@ -0,0 +1,58 @@
+import argparse
+import time
+
+import main
+
+# ARIMA order search strategies compared on the products in the database:
+# candidate fits, wall time, and how often (and by how much AIC) each
+# strategy's order differs from the exhaustive search's.
+#
+#   python benchmark_arima_search.py --products 50
+
+def main_benchmark():
+    parser = argparse.ArgumentParser(description="Compare ARIMA search strategies")
+    parser.add_argument("--products", type=int, default=20, help="Products to search (most history first)")
+    parser.add_argument("--parallel", action="store_true", help="Fit candidates on the ARIMA pool")
+    args = parser.parse_args()
+
+    conn = main.db_pool.acquire()
+    product_ids = [row[0] for row in conn.execute("""
+        SELECT product_id FROM demand_stats WHERE n_rows >= 10
+        ORDER BY n_rows DESC LIMIT ?
+    """, (args.products,))]
+    series = main.load_daily_sales_matrix(conn, product_ids)
+    main.db_pool.release(conn)
+
+    totals = {strategy: {"fits": 0, "seconds": 0.0, "same": 0, "aic_gap": 0.0}
+              for strategy in main.ARIMA_SEARCH_STRATEGIES}
+    print(f"{'product':>8}  " + "  ".join(f"{strategy:>22}" for strategy in main.ARIMA_SEARCH_STRATEGIES))
+    for product_id in product_ids:
+        data = series[product_id][0].values
+        orders = {}
+        for strategy in main.ARIMA_SEARCH_STRATEGIES:
+            started = time.perf_counter()
+            order, _, fits = main.find_best_arima_params(data, parallel=args.parallel, strategy=strategy)
+            totals[strategy]["seconds"] += time.perf_counter() - started
+            totals[strategy]["fits"] += fits
+            orders[strategy] = (order, fits)
+
+        best = main._fit_arima(data, orders["exhaustive"][0])
+        for strategy, (order, _) in orders.items():
+            if order == orders["exhaustive"][0]:
+                totals[strategy]["same"] += 1
+            elif best is not None:
+                fitted_model = main._fit_arima(data, order)
+                totals[strategy]["aic_gap"] += (fitted_model.aic - best.aic) if fitted_model is not None else 0.0
+        print(f"{product_id:>8}  " + "  ".join(f"{str(order):>12} {fits:>3} fits" for order, fits in orders.values()))
+
+    n = len(product_ids)
+    print(f"\n{n} products")
+    for strategy, total in totals.items():
+        print(f"  {strategy:<11} {total['fits']:5d} fits  {total['seconds']:7.1f} s  "
+              f"same order as exhaustive {total['same']}/{n}  "
+              f"mean AIC above exhaustive {total['aic_gap'] / n:6.2f}")
+    main.shutdown_arima_pool()
+    main.db_pool.close_all()
+
+if __name__ == "__main__":
+    main_benchmark()
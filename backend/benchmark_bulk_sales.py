@@ -0,0 +1,81 @@
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+
+import main
+
+# Throughput of POST /api/sales/bulk's insert path against the previous
+# one-execute-per-row loop, on a throwaway database.
+#
+#   python benchmark_bulk_sales.py --rows 50000
+#
+# The legacy loop fires the daily_sales trigger once per row, while
+# insert_bulk_sales inserts in index order and rolls its rows up with one
+# grouped upsert; at 200k rows that is roughly 32k vs 37-43k rows/sec here.
+# sales_history's own index maintenance is the bulk of the remaining cost.
+
+def legacy_insert(conn, sales):
+    """The per-row loop /api/sales/bulk used before executemany"""
+    cursor = conn.cursor()
+    for sale in sales:
+        cursor.execute("""
+            INSERT INTO sales_history (product_id, sale_date, quantity)
+            VALUES (?, ?, ?)
+        """, (sale.product_id, sale.sale_date, sale.quantity))
+
+def generate_sales(n_rows, n_products, seed):
+    rng = np.random.default_rng(seed)
+    dates = (np.datetime64('2024-01-01') + rng.integers(0, 730, n_rows).astype('timedelta64[D]')).astype(str)
+    return [main.SalesData(product_id=int(product_id), sale_date=str(sale_date), quantity=int(quantity))
+            for product_id, sale_date, quantity in zip(rng.integers(1, n_products + 1, n_rows),
+                                                       dates, rng.integers(1, 50, n_rows))]
+
+def fresh_database(tmp, name, n_products):
+    """Point main at a new database with the benchmark products"""
+    main.db_pool.close_all()
+    main.DATABASE = os.path.join(tmp, f"{name}.db")
+    main.init_db()
+    conn = main.db_pool.acquire()
+    conn.executemany("""
+        INSERT INTO products (code, name, unit_cost, lead_time_days)
+        VALUES (?, ?, 100.0, 7)
+    """, [(f"BEN{i:06d}", f"Benchmark product {i}") for i in range(1, n_products + 1)])
+    conn.commit()
+    return conn
+
+def timed(label, n_rows, func):
+    started = time.perf_counter()
+    func()
+    elapsed = time.perf_counter() - started
+    print(f"  {label:<28} {elapsed * 1000:9.1f} ms  {n_rows / elapsed:12,.0f} rows/sec")
+
+def main_benchmark():
+    parser = argparse.ArgumentParser(description="Bulk sales insert throughput")
+    parser.add_argument("--rows", type=int, default=50_000)
+    parser.add_argument("--products", type=int, default=500)
+    args = parser.parse_args()
+
+    sales = generate_sales(args.rows, args.products, seed=1)
+    print(f"Inserting {args.rows:,} rows into an empty sales_history:")
+    with tempfile.TemporaryDirectory() as tmp:
+        conn = fresh_database(tmp, "legacy", args.products)
+        timed("per-row execute loop", args.rows, lambda: (legacy_insert(conn, sales), conn.commit()))
+        main.db_pool.release(conn)
+
+        conn = fresh_database(tmp, "bulk", args.products)
+        timed("insert_bulk_sales", args.rows, lambda: (main.insert_bulk_sales(conn, sales), conn.commit()))
+        main.db_pool.release(conn)
+
+        conn = fresh_database(tmp, "upsert", args.products)
+        timed("insert_bulk_sales (upsert)", args.rows,
+              lambda: (main.insert_bulk_sales(conn, sales, upsert=True), conn.commit()))
+        timed("upsert retry of same rows", args.rows,
+              lambda: (main.insert_bulk_sales(conn, sales, upsert=True), conn.commit()))
+        main.db_pool.release(conn)
+        main.db_pool.close_all()
+
+if __name__ == "__main__":
+    main_benchmark()
@@ -0,0 +1,146 @@
+import argparse
+import os
+import sqlite3
+import statistics
+import tempfile
+import time
+
+import numpy as np
+
+import main
+
+# Benchmark of the schema migrations' indexes.
+# Builds a throwaway database with the base schema, fills it with generated
+# sales and transactions, then prints the query plan and timing of the hot
+# queries before and after run_migrations(), and of the same sales queries
+# served from the daily_sales rollup the migrations create.
+#
+#   python benchmark_indexes.py --sales 3000000 --products 2000
+
+QUERIES = {
+    "sales history of one product": ("""
+        SELECT sale_date, quantity FROM sales_history
+        WHERE product_id = ?
+        ORDER BY sale_date
+    """, lambda products: (products // 2,)),
+    "daily demand per product (dashboard)": ("""
+        SELECT product_id, date(sale_date) AS day,
+               SUM(quantity) AS qty, COUNT(*) AS n_rows
+        FROM sales_history
+        GROUP BY product_id, day
+    """, lambda products: ()),
+    "sales trend, last 30 days": ("""
+        SELECT sale_date, SUM(quantity) as total_qty
+        FROM sales_history
+        WHERE sale_date >= date('now', '-30 days')
+        GROUP BY sale_date
+        ORDER BY sale_date
+    """, lambda products: ()),
+    "recent transactions (dashboard)": ("""
+        SELECT t.*, p.name as product_name
+        FROM transactions t
+        JOIN products p ON t.product_id = p.id
+        ORDER BY t.transaction_date DESC
+        LIMIT 10
+    """, lambda products: ()),
+    "transactions of one product": ("""
+        SELECT t.*, p.name as product_name, p.code as product_code
+        FROM transactions t
+        JOIN products p ON t.product_id = p.id
+        WHERE t.product_id = ?
+        ORDER BY t.transaction_date DESC
+    """, lambda products: (products // 2,)),
+}
+
+ROLLUP_QUERIES = {
+    "daily series of one product (rollup)": ("""
+        SELECT day, qty, n_rows FROM daily_sales
+        WHERE product_id = ?
+        ORDER BY day
+    """, lambda products: (products // 2,)),
+    "daily demand per product (rollup)": ("""
+        SELECT product_id, SUM(n_rows) AS n_rows, SUM(qty) AS total,
+               SUM(qty * qty) AS total_sq
+        FROM daily_sales
+        GROUP BY product_id
+    """, lambda products: ()),
+    "sales trend, last 30 days (rollup)": ("""
+        SELECT day, SUM(qty) as total_qty
+        FROM daily_sales
+        WHERE day >= date('now', '-30 days')
+        GROUP BY day
+        ORDER BY day
+    """, lambda products: ()),
+}
+
+def generate_data(conn, n_products, n_sales, n_transactions, days):
+    rng = np.random.default_rng(42)
+    conn.executemany("""
+        INSERT INTO products (code, name, category, unit, unit_cost, ordering_cost,
+                              holding_cost_percentage, lead_time_days, current_stock)
+        VALUES (?, ?, 'Bench', 'ขวด', 100.0, 500.0, 0.2, 7, 1000)
+    """, [(f"BEN{i:06d}", f"Benchmark product {i}") for i in range(1, n_products + 1)])
+
+    start = np.datetime64('today') - np.timedelta64(days, 'D')
+    batch = 500_000
+    for offset in range(0, n_sales, batch):
+        size = min(batch, n_sales - offset)
+        product_ids = rng.integers(1, n_products + 1, size)
+        dates = (start + rng.integers(0, days, size).astype('timedelta64[D]')).astype(str)
+        quantities = rng.integers(1, 50, size)
+        conn.executemany("INSERT INTO sales_history (product_id, sale_date, quantity) VALUES (?, ?, ?)",
+                         zip(product_ids.tolist(), dates.tolist(), quantities.tolist()))
+
+    product_ids = rng.integers(1, n_products + 1, n_transactions)
+    seconds = rng.integers(0, days * 86400, n_transactions).astype('timedelta64[s]')
+    timestamps = np.datetime_as_string(start.astype('datetime64[s]') + seconds).tolist()
+    conn.executemany("""
+        INSERT INTO transactions (product_id, transaction_type, quantity, transaction_date, note)
+        VALUES (?, 'out', ?, replace(?, 'T', ' '), 'benchmark')
+    """, zip(product_ids.tolist(), rng.integers(1, 50, n_transactions).tolist(), timestamps))
+    conn.commit()
+
+def run_queries(conn, n_products, repeat, queries=QUERIES):
+    for name, (sql, params) in queries.items():
+        args = params(n_products)
+        plan = [row[3] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}", args)]
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            conn.execute(sql, args).fetchall()
+            timings.append(time.perf_counter() - started)
+        print(f"  {name}: {statistics.median(timings) * 1000:.2f} ms")
+        for step in plan:
+            print(f"      {step}")
+
+def main_benchmark():
+    parser = argparse.ArgumentParser(description="Query plans and timings before/after the index migrations")
+    parser.add_argument("--products", type=int, default=1000)
+    parser.add_argument("--sales", type=int, default=2_000_000)
+    parser.add_argument("--transactions", type=int, default=500_000)
+    parser.add_argument("--days", type=int, default=3 * 365)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        main.DATABASE = os.path.join(tmp, "benchmark.db")
+        main.init_db(migrate=False)
+
+        conn = sqlite3.connect(main.DATABASE)
+        print(f"Generating {args.sales:,} sales rows and {args.transactions:,} transactions...")
+        generate_data(conn, args.products, args.sales, args.transactions, args.days)
+
+        print("\nBefore migrations:")
+        run_queries(conn, args.products, args.repeat)
+
+        started = time.perf_counter()
+        main.run_migrations(conn)
+        print(f"\nMigrations applied in {time.perf_counter() - started:.1f}s")
+
+        print("\nAfter migrations:")
+        run_queries(conn, args.products, args.repeat)
+        run_queries(conn, args.products, args.repeat, ROLLUP_QUERIES)
+        conn.close()
+
+if __name__ == "__main__":
+    main_benchmark()
@@ -0,0 +1,33 @@
+import argparse
+import sys
+import time
+
+from main import db_pool, init_db, check_sales_rollups, rebuild_sales_rollups
+
+# Consistency check for the sales rollups (daily_sales and demand_stats),
+# which triggers keep in step with sales_history. Exits with status 1 when
+# they disagree with the raw sales rows.
+#   python check_rollups.py             # report mismatches
+#   python check_rollups.py --rebuild   # recompute both rollups from sales_history
+
+def main():
+    parser = argparse.ArgumentParser(description="Check or rebuild daily_sales and demand_stats")
+    parser.add_argument("--rebuild", action="store_true",
+                        help="Recompute the rollups from sales_history")
+    args = parser.parse_args()
+
+    init_db()
+    with db_pool.connection() as conn:
+        if args.rebuild:
+            started = time.time()
+            rebuild_sales_rollups(conn)
+            print(f"Rebuilt daily_sales and demand_stats in {time.time() - started:.1f}s")
+
+        mismatches = check_sales_rollups(conn)
+    for table, count in mismatches.items():
+        print(f"{table}: {count} mismatched rows")
+    db_pool.close_all()
+    sys.exit(1 if any(mismatches.values()) else 0)
+
+if __name__ == "__main__":
+    main()
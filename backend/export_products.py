@@ -1,42 +1,42 @@
-import sqlite3
-import pandas as pd
+import argparse
 import os
 
-# Database path
-DATABASE = "inventory.db"
-PRODUCT_OUTPUT = "product_data.csv"
-SALES_OUTPUT = "sales_data.csv"
+import main
+
+# Writes the same files as GET /api/export/products and /api/export/sales,
+# chunk by chunk, without going through the API server.
+#
+#   python export_products.py --format parquet
+
+PRODUCT_OUTPUT = "product_data"
+SALES_OUTPUT = "sales_data"
+
+def export_to_file(name, fmt, path):
+    with open(path, "wb") as f:
+        for chunk in main.export_chunks(name, fmt):
+            f.write(chunk)
+    return os.path.getsize(path)
 
 def export_data():
-    if not os.path.exists(DATABASE):
-        print(f"Error: Database {DATABASE} not found.")
+    parser = argparse.ArgumentParser(description="Export products and sales history")
+    parser.add_argument("--format", choices=list(main.EXPORT_FORMATS), default="csv")
+    parser.add_argument("--output-dir", default=".")
+    args = parser.parse_args()
+
+    if not os.path.exists(main.DATABASE):
+        print(f"Error: Database {main.DATABASE} not found.")
+        return
+    if args.format == "parquet" and main.pa is None:
+        print("Error: Parquet export requires pyarrow.")
         return
 
-    try:
-        conn = sqlite3.connect(DATABASE)
-        
-        # Export Products
-        print(f"Exporting products to {PRODUCT_OUTPUT}...")
-        product_query = "SELECT * FROM products"
-        product_df = pd.read_sql_query(product_query, conn)
-        product_df.to_csv(PRODUCT_OUTPUT, index=False, encoding='utf-8-sig')
-        print(f"Successfully exported {len(product_df)} products.")
-        
-        # Export Sales History (with product context)
-        print(f"Exporting sales history to {SALES_OUTPUT}...")
-        sales_query = """
-            SELECT s.id, p.code as product_code, p.name as product_name, s.sale_date, s.quantity
-            FROM sales_history s
-            JOIN products p ON s.product_id = p.id
-            ORDER BY s.sale_date DESC
-        """
-        sales_df = pd.read_sql_query(sales_query, conn)
-        sales_df.to_csv(SALES_OUTPUT, index=False, encoding='utf-8-sig')
-        print(f"Successfully exported {len(sales_df)} sales records.")
-        
-        conn.close()
-    except Exception as e:
-        print(f"An error occurred: {e}")
+    extension = main.EXPORT_FORMATS[args.format][2]
+    for name, output in (("products", PRODUCT_OUTPUT), ("sales", SALES_OUTPUT)):
+        path = os.path.join(args.output_dir, f"{output}.{extension}")
+        print(f"Exporting {name} to {path}...")
+        size = export_to_file(name, args.format, path)
+        print(f"Successfully exported {name} ({size:,} bytes).")
+    main.db_pool.close_all()
 
 if __name__ == "__main__":
     export_data()
@@ -0,0 +1,30 @@
+import argparse
+import time
+
+from main import (init_db, run_batch_forecast, shutdown_arima_pool, shutdown_forecast_batch_pool,
+                  BATCH_FORECAST_PERIODS)
+
+# Standalone entry point for the batch forecast job, e.g. from cron:
+#   0 2 * * * cd backend && ./venv/bin/python forecast_worker.py
+# Set BATCH_FORECAST_ENABLED=0 on the API server when using this instead of
+# the in-process scheduler.
+
+def main():
+    parser = argparse.ArgumentParser(description="Re-forecast products into the forecasts table")
+    parser.add_argument("--product-id", type=int, action="append", dest="product_ids",
+                        help="Only forecast this product (repeatable)")
+    parser.add_argument("--periods", type=int, default=BATCH_FORECAST_PERIODS,
+                        help="Forecast horizon in days")
+    args = parser.parse_args()
+
+    init_db()
+    started = time.time()
+    try:
+        total, failed = run_batch_forecast(args.product_ids, args.periods)
+    finally:
+        shutdown_arima_pool()
+        shutdown_forecast_batch_pool()
+    print(f"Forecasted {total} products ({failed} failed) in {time.time() - started:.1f}s")
+
+if __name__ == "__main__":
+    main()
@@ -11,6 +11,13 @@ def init_database():
     conn = sqlite3.connect(DATABASE)
     cursor = conn.cursor()
     
+    # Drop tables main.py derives from the data, so they are rebuilt on startup
+    for table in ["schema_migrations", "jobs", "daily_sales", "demand_stats",
+                  "reorder_status", "reorder_events", "forecast_cache", "forecast_models",
+                  "forecasts", "backtest_runs", "backtest_checkpoints", "backtest_results",
+                  "sales_rollup_deferred"]:
+        cursor.execute(f"DROP TABLE IF EXISTS {table}")
+    
     # Drop existing tables
     cursor.execute("DROP TABLE IF EXISTS transactions")
     cursor.execute("DROP TABLE IF EXISTS sales_history")
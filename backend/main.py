@@ -1,18 +1,41 @@
-from fastapi import FastAPI, HTTPException, UploadFile, File
+from fastapi import FastAPI, HTTPException, UploadFile, File, Depends, Request
+from fastapi.responses import StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
+from starlette.background import BackgroundTask
 from pydantic import BaseModel
 from typing import List, Optional
 import sqlite3
 import pandas as pd
 import numpy as np
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta
 import json
 import io
+import csv
+import base64
+import os
+import asyncio
+import threading
+from contextlib import contextmanager
+import time
+import hashlib
+import shutil
+import tempfile
+import uuid
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, FIRST_COMPLETED, as_completed, wait
+from concurrent.futures.process import BrokenProcessPool
 from statsmodels.tsa.arima.model import ARIMA
 from statsmodels.tsa.stattools import adfuller
+from scipy.signal import lfilter, lfiltic
 import itertools
 import warnings
+import logging
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # only needed for Parquet / Arrow uploads
+    pa = pq = None
 warnings.filterwarnings('ignore')
+logger = logging.getLogger(__name__)
 
 app = FastAPI(title="Inventory Forecasting System")
 
@@ -28,13 +51,436 @@ app.add_middleware(
 # Database setup
 DATABASE = "inventory.db"
 
-def get_db():
-    conn = sqlite3.connect(DATABASE)
-    conn.row_factory = sqlite3.Row
-    return conn
+# Connection pool settings
+DB_POOL_MAX_IDLE = int(os.environ.get("DB_POOL_MAX_IDLE", "16"))
+DB_BUSY_TIMEOUT_MS = int(os.environ.get("DB_BUSY_TIMEOUT_MS", "5000"))
+DB_CACHE_SIZE_KB = int(os.environ.get("DB_CACHE_SIZE_KB", str(64 * 1024)))
+DB_MMAP_SIZE = int(os.environ.get("DB_MMAP_SIZE", str(256 * 1024 * 1024)))
 
-def init_db():
-    conn = get_db()
+class PooledConnection(sqlite3.Connection):
+    """sqlite3 connection that remembers which database file it opened"""
+    database_path = None
+
+class ConnectionPool:
+    """Reusable SQLite connections with WAL and tuned pragmas
+    
+    A connection is used by one caller at a time. Released connections are
+    kept idle (up to max_idle) and handed back to the thread that last used
+    them when possible, otherwise to any thread.
+    """
+    
+    def __init__(self, max_idle=DB_POOL_MAX_IDLE):
+        self.max_idle = max_idle
+        self._idle = []
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._stats = {
+            "created": 0,
+            "closed": 0,
+            "acquired": 0,
+            "reused_same_thread": 0,
+            "reused_other_thread": 0,
+            "in_use": 0,
+            "lock_errors": 0,
+        }
+    
+    def _connect(self):
+        conn = sqlite3.connect(DATABASE, timeout=DB_BUSY_TIMEOUT_MS / 1000,
+                               check_same_thread=False, factory=PooledConnection)
+        conn.database_path = DATABASE
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.execute("PRAGMA synchronous = NORMAL")
+        conn.execute(f"PRAGMA busy_timeout = {DB_BUSY_TIMEOUT_MS}")
+        conn.execute(f"PRAGMA cache_size = -{DB_CACHE_SIZE_KB}")
+        conn.execute(f"PRAGMA mmap_size = {DB_MMAP_SIZE}")
+        conn.execute("PRAGMA temp_store = MEMORY")
+        return conn
+    
+    def acquire(self):
+        """Check out a connection for exclusive use"""
+        with self._lock:
+            self._stats["acquired"] += 1
+            self._stats["in_use"] += 1
+            conn = getattr(self._local, "conn", None)
+            if conn is not None and conn in self._idle:
+                self._idle.remove(conn)
+                self._stats["reused_same_thread"] += 1
+                return conn
+            while self._idle:
+                conn = self._idle.pop()
+                if conn.database_path == DATABASE:
+                    self._local.conn = conn
+                    self._stats["reused_other_thread"] += 1
+                    return conn
+                conn.close()
+                self._stats["closed"] += 1
+            self._stats["created"] += 1
+        
+        try:
+            conn = self._connect()
+        except Exception:
+            with self._lock:
+                self._stats["in_use"] -= 1
+            raise
+        self._local.conn = conn
+        return conn
+    
+    def release(self, conn):
+        """Return a connection; uncommitted work is rolled back"""
+        if conn.in_transaction:
+            conn.rollback()
+        with self._lock:
+            self._stats["in_use"] -= 1
+            if len(self._idle) < self.max_idle and conn.database_path == DATABASE:
+                self._idle.append(conn)
+                return
+            self._stats["closed"] += 1
+        conn.close()
+    
+    @contextmanager
+    def connection(self):
+        """Context manager around acquire/release"""
+        conn = self.acquire()
+        try:
+            yield conn
+        except sqlite3.OperationalError as e:
+            if "locked" in str(e):
+                with self._lock:
+                    self._stats["lock_errors"] += 1
+            raise
+        finally:
+            self.release(conn)
+    
+    def stats(self):
+        with self._lock:
+            return {**self._stats, "idle": len(self._idle), "max_idle": self.max_idle}
+    
+    def close_all(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+            self._stats["closed"] += len(idle)
+        for conn in idle:
+            conn.close()
+
+db_pool = ConnectionPool()
+
+def get_conn():
+    """FastAPI dependency that lends a pooled connection to one request"""
+    with db_pool.connection() as conn:
+        yield conn
+
+# Schema migrations
+# Each entry is (version, description, statements). Applied versions are
+# recorded in schema_migrations and run once, in order, at startup. Append new
+# migrations to the end; never edit one that has shipped.
+MIGRATIONS = [
+    (1, "Indexes for sales_history and transactions lookups", [
+        # Per-product history ordered by date; also covers the per-product
+        # daily aggregate used by the dashboard and analytics
+        """CREATE INDEX IF NOT EXISTS idx_sales_history_product_date
+           ON sales_history (product_id, sale_date, quantity)""",
+        # Date-range scans such as the last-30-days sales trend
+        """CREATE INDEX IF NOT EXISTS idx_sales_history_date
+           ON sales_history (sale_date, quantity)""",
+        # Recent transactions (ORDER BY transaction_date DESC LIMIT n)
+        """CREATE INDEX IF NOT EXISTS idx_transactions_date
+           ON transactions (transaction_date)""",
+        # Transactions of one product, newest first
+        """CREATE INDEX IF NOT EXISTS idx_transactions_product_date
+           ON transactions (product_id, transaction_date)""",
+    ]),
+    (2, "Ingestion jobs", [
+        """CREATE TABLE IF NOT EXISTS jobs (
+               id TEXT PRIMARY KEY,
+               kind TEXT NOT NULL,
+               status TEXT NOT NULL,
+               filename TEXT,
+               bytes_total INTEGER,
+               bytes_processed INTEGER DEFAULT 0,
+               rows_total INTEGER,
+               rows_processed INTEGER DEFAULT 0,
+               inserted INTEGER DEFAULT 0,
+               rejected INTEGER DEFAULT 0,
+               rejected_reasons TEXT,
+               rows_per_sec REAL,
+               error TEXT,
+               created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+               started_at TIMESTAMP,
+               finished_at TIMESTAMP
+           )""",
+        """CREATE INDEX IF NOT EXISTS idx_jobs_created
+           ON jobs (created_at)""",
+    ]),
+    (3, "Idempotent bulk sales upserts", [
+        # Rows written by /api/sales/bulk?upsert=true are unique per product
+        # and day; other sales rows may still repeat a day
+        """ALTER TABLE sales_history ADD COLUMN upserted INTEGER NOT NULL DEFAULT 0""",
+        """CREATE UNIQUE INDEX IF NOT EXISTS idx_sales_history_upsert
+           ON sales_history (product_id, sale_date) WHERE upserted = 1""",
+    ]),
+    (4, "Daily sales rollup", [
+        # One row per product and day with the day's total quantity and the
+        # number of sales_history rows behind it. Kept in step with
+        # sales_history by the triggers below, so every write path (manual
+        # 'out' transactions, bulk inserts, uploads, and product deletes,
+        # which remove the product's sales rows) updates it in the same
+        # transaction.
+        """CREATE TABLE IF NOT EXISTS daily_sales (
+               product_id INTEGER NOT NULL,
+               day DATE NOT NULL,
+               qty INTEGER NOT NULL,
+               n_rows INTEGER NOT NULL,
+               PRIMARY KEY (product_id, day)
+           ) WITHOUT ROWID""",
+        # Date-range scans such as the last-30-days sales trend
+        """CREATE INDEX IF NOT EXISTS idx_daily_sales_day
+           ON daily_sales (day, qty)""",
+        """CREATE TRIGGER IF NOT EXISTS trg_sales_history_insert_daily
+           AFTER INSERT ON sales_history
+           BEGIN
+               INSERT INTO daily_sales (product_id, day, qty, n_rows)
+               SELECT NEW.product_id, date(NEW.sale_date), NEW.quantity, 1
+               WHERE date(NEW.sale_date) IS NOT NULL
+               ON CONFLICT (product_id, day) DO UPDATE
+               SET qty = qty + excluded.qty, n_rows = n_rows + 1;
+           END""",
+        """CREATE TRIGGER IF NOT EXISTS trg_sales_history_delete_daily
+           AFTER DELETE ON sales_history
+           BEGIN
+               UPDATE daily_sales SET qty = qty - OLD.quantity, n_rows = n_rows - 1
+               WHERE product_id = OLD.product_id AND day = date(OLD.sale_date);
+               DELETE FROM daily_sales
+               WHERE product_id = OLD.product_id AND day = date(OLD.sale_date) AND n_rows <= 0;
+           END""",
+        # Also fires for quantity changes made by upserts
+        """CREATE TRIGGER IF NOT EXISTS trg_sales_history_update_daily
+           AFTER UPDATE OF product_id, sale_date, quantity ON sales_history
+           BEGIN
+               UPDATE daily_sales SET qty = qty - OLD.quantity, n_rows = n_rows - 1
+               WHERE product_id = OLD.product_id AND day = date(OLD.sale_date);
+               DELETE FROM daily_sales
+               WHERE product_id = OLD.product_id AND day = date(OLD.sale_date) AND n_rows <= 0;
+               INSERT INTO daily_sales (product_id, day, qty, n_rows)
+               SELECT NEW.product_id, date(NEW.sale_date), NEW.quantity, 1
+               WHERE date(NEW.sale_date) IS NOT NULL
+               ON CONFLICT (product_id, day) DO UPDATE
+               SET qty = qty + excluded.qty, n_rows = n_rows + 1;
+           END""",
+        """INSERT INTO daily_sales (product_id, day, qty, n_rows)
+           SELECT product_id, date(sale_date), SUM(quantity), COUNT(*)
+           FROM sales_history
+           WHERE date(sale_date) IS NOT NULL
+           GROUP BY product_id, date(sale_date)""",
+    ]),
+    (5, "Per-product demand accumulators", [
+        # Running totals over each product's daily_sales rows: raw row count,
+        # sum and sum of squares of the daily quantities, and the first and
+        # last day. With days without sales counted as 0, mean and variance of
+        # the daily series follow from these in constant time. Kept current by
+        # triggers on daily_sales, which itself follows sales_history.
+        """CREATE TABLE IF NOT EXISTS demand_stats (
+               product_id INTEGER PRIMARY KEY,
+               n_rows INTEGER NOT NULL,
+               total INTEGER NOT NULL,
+               total_sq INTEGER NOT NULL,
+               first_day DATE NOT NULL,
+               last_day DATE NOT NULL
+           )""",
+        """CREATE TRIGGER IF NOT EXISTS trg_daily_sales_insert_stats
+           AFTER INSERT ON daily_sales
+           BEGIN
+               INSERT INTO demand_stats (product_id, n_rows, total, total_sq, first_day, last_day)
+               VALUES (NEW.product_id, NEW.n_rows, NEW.qty, NEW.qty * NEW.qty, NEW.day, NEW.day)
+               ON CONFLICT (product_id) DO UPDATE
+               SET n_rows = n_rows + excluded.n_rows,
+                   total = total + excluded.total,
+                   total_sq = total_sq + excluded.total_sq,
+                   first_day = min(first_day, excluded.first_day),
+                   last_day = max(last_day, excluded.last_day);
+           END""",
+        # The rollup triggers only change qty and n_rows of an existing day
+        """CREATE TRIGGER IF NOT EXISTS trg_daily_sales_update_stats
+           AFTER UPDATE OF qty, n_rows ON daily_sales
+           BEGIN
+               UPDATE demand_stats
+               SET n_rows = n_rows - OLD.n_rows + NEW.n_rows,
+                   total = total - OLD.qty + NEW.qty,
+                   total_sq = total_sq - OLD.qty * OLD.qty + NEW.qty * NEW.qty
+               WHERE product_id = NEW.product_id;
+           END""",
+        """CREATE TRIGGER IF NOT EXISTS trg_daily_sales_delete_stats
+           AFTER DELETE ON daily_sales
+           BEGIN
+               UPDATE demand_stats
+               SET n_rows = n_rows - OLD.n_rows,
+                   total = total - OLD.qty,
+                   total_sq = total_sq - OLD.qty * OLD.qty,
+                   first_day = coalesce((SELECT MIN(day) FROM daily_sales
+                                         WHERE product_id = OLD.product_id), first_day),
+                   last_day = coalesce((SELECT MAX(day) FROM daily_sales
+                                        WHERE product_id = OLD.product_id), last_day)
+               WHERE product_id = OLD.product_id;
+               DELETE FROM demand_stats
+               WHERE product_id = OLD.product_id
+                 AND NOT EXISTS (SELECT 1 FROM daily_sales WHERE product_id = OLD.product_id);
+           END""",
+        """INSERT INTO demand_stats (product_id, n_rows, total, total_sq, first_day, last_day)
+           SELECT product_id, SUM(n_rows), SUM(qty), SUM(qty * qty), MIN(day), MAX(day)
+           FROM daily_sales
+           GROUP BY product_id""",
+    ]),
+    (6, "Materialized reorder status and its change feed", [
+        # Reorder metrics and stock health per product, refreshed by
+        # refresh_reorder_status whenever stock, demand or product settings
+        # change. needs_reorder marks the dashboard's low-stock list.
+        """CREATE TABLE IF NOT EXISTS reorder_status (
+               product_id INTEGER PRIMARY KEY,
+               current_stock INTEGER NOT NULL,
+               avg_daily_demand REAL NOT NULL,
+               demand_std REAL NOT NULL,
+               safety_stock REAL NOT NULL,
+               rop REAL NOT NULL,
+               eoq REAL NOT NULL,
+               status TEXT NOT NULL,
+               needs_reorder INTEGER NOT NULL,
+               updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+           )""",
+        """CREATE INDEX IF NOT EXISTS idx_reorder_status_needs_reorder
+           ON reorder_status (product_id) WHERE needs_reorder = 1""",
+        """CREATE INDEX IF NOT EXISTS idx_reorder_status_status
+           ON reorder_status (status)""",
+        # One row per change of a product's status or needs_reorder flag;
+        # status is NULL when the product was deleted
+        """CREATE TABLE IF NOT EXISTS reorder_events (
+               id INTEGER PRIMARY KEY AUTOINCREMENT,
+               product_id INTEGER NOT NULL,
+               previous_status TEXT,
+               status TEXT,
+               needs_reorder INTEGER NOT NULL,
+               current_stock INTEGER,
+               rop REAL,
+               created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+           )""",
+    ]),
+    (7, "Indexes for paginated transactions and sales history", [
+        # Pages and counts of /api/transactions?transaction_type=...
+        """CREATE INDEX IF NOT EXISTS idx_transactions_type_date
+           ON transactions (transaction_type, transaction_date)""",
+        # Keyset pages of /api/sales/{product_id} in (sale_date, id) order;
+        # idx_sales_history_product_date has quantity before the rowid
+        """CREATE INDEX IF NOT EXISTS idx_sales_history_product_date_id
+           ON sales_history (product_id, sale_date)""",
+    ]),
+    (8, "Forecast model of stored forecasts", [
+        # Stored forecasts may come from a fast-path model instead of ARIMA
+        """ALTER TABLE forecasts ADD COLUMN model TEXT""",
+    ]),
+    (9, "80% prediction intervals of stored forecasts", [
+        """ALTER TABLE forecasts ADD COLUMN confidence_intervals_80 TEXT""",
+    ]),
+    (10, "Backtest runs, checkpoints and results", [
+        # One row per run with its settings; runner is "api" for runs the
+        # server resumes after a restart, "cli" for runs of backtest.py
+        """CREATE TABLE IF NOT EXISTS backtest_runs (
+               id TEXT PRIMARY KEY,
+               status TEXT NOT NULL,
+               runner TEXT NOT NULL,
+               product_ids TEXT NOT NULL,
+               horizon INTEGER NOT NULL,
+               origins INTEGER NOT NULL,
+               step INTEGER NOT NULL,
+               min_train_days INTEGER NOT NULL,
+               strategy TEXT,
+               model TEXT,
+               error TEXT,
+               created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+               started_at TIMESTAMP,
+               finished_at TIMESTAMP
+           )""",
+        # Products a run has finished, written in the same transaction as
+        # their results; a resumed run skips them
+        """CREATE TABLE IF NOT EXISTS backtest_checkpoints (
+               run_id TEXT NOT NULL,
+               product_id INTEGER NOT NULL,
+               status TEXT NOT NULL,
+               folds INTEGER NOT NULL DEFAULT 0,
+               error TEXT,
+               seconds REAL,
+               finished_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+               PRIMARY KEY (run_id, product_id)
+           )""",
+        # One row per product and forecast origin
+        """CREATE TABLE IF NOT EXISTS backtest_results (
+               run_id TEXT NOT NULL,
+               product_id INTEGER NOT NULL,
+               origin_date TEXT NOT NULL,
+               model TEXT,
+               strategy TEXT,
+               fits INTEGER,
+               seconds REAL,
+               mae REAL,
+               mape REAL,
+               smape REAL,
+               mase REAL,
+               bias REAL,
+               reorder_point REAL,
+               lead_time_demand REAL,
+               rop_hit INTEGER,
+               error TEXT,
+               PRIMARY KEY (run_id, product_id, origin_date)
+           )""",
+    ]),
+    (11, "Set-based daily sales rollup for bulk inserts", [
+        # Bulk inserts hold a row here for the rest of their transaction, so
+        # the per-row insert trigger stands down and they fold their rows
+        # into daily_sales with one grouped upsert (see bulk_daily_rollup).
+        # The row is removed before commit; other connections never see it.
+        """CREATE TABLE IF NOT EXISTS sales_rollup_deferred (id INTEGER PRIMARY KEY)""",
+        """DROP TRIGGER IF EXISTS trg_sales_history_insert_daily""",
+        """CREATE TRIGGER trg_sales_history_insert_daily
+           AFTER INSERT ON sales_history
+           WHEN NOT EXISTS (SELECT 1 FROM sales_rollup_deferred)
+           BEGIN
+               INSERT INTO daily_sales (product_id, day, qty, n_rows)
+               SELECT NEW.product_id, date(NEW.sale_date), NEW.quantity, 1
+               WHERE date(NEW.sale_date) IS NOT NULL
+               ON CONFLICT (product_id, day) DO UPDATE
+               SET qty = qty + excluded.qty, n_rows = n_rows + 1;
+           END""",
+    ]),
+]
+
+def run_migrations(conn):
+    """Apply pending schema migrations, each in its own transaction"""
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INTEGER PRIMARY KEY,
+            description TEXT,
+            applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    applied = {row[0] for row in conn.execute("SELECT version FROM schema_migrations")}
+    
+    for version, description, statements in MIGRATIONS:
+        if version in applied:
+            continue
+        try:
+            conn.execute("BEGIN")
+            for statement in statements:
+                conn.execute(statement)
+            conn.execute("INSERT INTO schema_migrations (version, description) VALUES (?, ?)",
+                         (version, description))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+    
+    # Refresh planner statistics for any new indexes
+    conn.execute("PRAGMA optimize")
+
+def init_db(migrate=True):
+    conn = db_pool.acquire()
     cursor = conn.cursor()
     
     # Products table
@@ -78,145 +524,2492 @@ def init_db():
         )
     """)
     
+    # Forecast cache table
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS forecast_cache (
+            product_id INTEGER NOT NULL,
+            series_hash TEXT NOT NULL,
+            periods INTEGER NOT NULL,
+            payload TEXT NOT NULL,
+            size_bytes INTEGER NOT NULL,
+            last_accessed REAL NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (product_id, series_hash, periods)
+        )
+    """)
+    
+    # Last fitted ARIMA model per product (warm-start state)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS forecast_models (
+            product_id INTEGER PRIMARY KEY,
+            arima_p INTEGER NOT NULL,
+            arima_d INTEGER NOT NULL,
+            arima_q INTEGER NOT NULL,
+            params TEXT NOT NULL,
+            n_obs INTEGER,
+            baseline_rmse REAL,
+            rmse REAL,
+            refit TEXT,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (product_id) REFERENCES products(id)
+        )
+    """)
+    
+    # Stored batch forecasts (latest run per product)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS forecasts (
+            product_id INTEGER PRIMARY KEY,
+            periods INTEGER NOT NULL,
+            status TEXT NOT NULL,
+            error TEXT,
+            forecast_dates TEXT,
+            forecast_values TEXT,
+            confidence_intervals TEXT,
+            arima_p INTEGER,
+            arima_d INTEGER,
+            arima_q INTEGER,
+            avg_daily_demand REAL,
+            demand_std REAL,
+            annual_demand REAL,
+            eoq REAL,
+            safety_stock REAL,
+            reorder_point REAL,
+            computed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (product_id) REFERENCES products(id)
+        )
+    """)
+    
+    conn.commit()
+    if migrate:
+        run_migrations(conn)
+    db_pool.release(conn)
+
+# Pydantic models
+class Product(BaseModel):
+    code: str
+    name: str
+    category: Optional[str] = None
+    unit: str = "ขวด"
+    unit_cost: float
+    ordering_cost: float = 500.0
+    holding_cost_percentage: float = 0.2
+    lead_time_days: int = 7
+    current_stock: int = 0
+
+class ProductUpdate(BaseModel):
+    name: Optional[str] = None
+    category: Optional[str] = None
+    unit: Optional[str] = None
+    unit_cost: Optional[float] = None
+    ordering_cost: Optional[float] = None
+    holding_cost_percentage: Optional[float] = None
+    lead_time_days: Optional[int] = None
+    current_stock: Optional[int] = None
+
+class Transaction(BaseModel):
+    product_id: int
+    transaction_type: str  # 'in' or 'out'
+    quantity: int
+    note: Optional[str] = None
+
+class BatchForecastRequest(BaseModel):
+    product_ids: Optional[List[int]] = None
+    category: Optional[str] = None
+    periods: int = 30
+    strategy: Optional[str] = None
+
+class BacktestRequest(BaseModel):
+    product_ids: Optional[List[int]] = None
+    category: Optional[str] = None
+    horizon: int = 30
+    origins: int = 6
+    step: Optional[int] = None
+    min_train_days: int = 60
+    strategy: Optional[str] = None
+    model: Optional[str] = None
+
+class SalesData(BaseModel):
+    product_id: int
+    sale_date: str
+    quantity: int
+
+# ARIMA grid search pool
+# Candidate fits run on a process pool that is started once and reused by
+# every forecast request. Set ARIMA_POOL_WORKERS=1 to search serially.
+ARIMA_POOL_WORKERS = int(os.environ.get("ARIMA_POOL_WORKERS", os.cpu_count() or 1))
+# Stop waiting for the remaining candidates once the best AIC leads every other
+# finished candidate by this margin. Off by default, so the pool always picks
+# exactly the order the serial search would.
+ARIMA_EARLY_STOP_MARGIN = float(os.environ.get("ARIMA_EARLY_STOP_MARGIN", "0")) or None
+ARIMA_EARLY_STOP_MIN_FITS = int(os.environ.get("ARIMA_EARLY_STOP_MIN_FITS", "6"))
+
+# Model selection
+# exhaustive fits every (p, d, q) in the grid; stepwise is the
+# Hyndman-Khandakar search, which starts from a few orders and moves to the
+# best neighbouring (p, q) while the AIC improves; fixed skips the search and
+# uses ARIMA_FIXED_ORDER. A request may pick its own with ?strategy=.
+ARIMA_SEARCH_STRATEGIES = ("exhaustive", "stepwise", "fixed")
+ARIMA_SEARCH_STRATEGY = os.environ.get("ARIMA_SEARCH_STRATEGY", "exhaustive")
+ARIMA_FIXED_ORDER = tuple(int(x) for x in os.environ.get("ARIMA_FIXED_ORDER", "1,1,1").split(","))
+
+_search_stats_lock = threading.Lock()
+# strategy ("warm" for warm refits, the model name for fast-path models):
+# searches, fits and seconds spent
+arima_search_stats = {}
+
+_arima_pool = None
+
+def get_arima_pool():
+    """Return the shared ARIMA process pool (None when searching serially)"""
+    global _arima_pool
+    if ARIMA_POOL_WORKERS <= 1:
+        return None
+    if _arima_pool is None:
+        _arima_pool = ProcessPoolExecutor(max_workers=ARIMA_POOL_WORKERS)
+        # Start every worker now so the first forecast does not pay for it
+        for future in [_arima_pool.submit(int) for _ in range(ARIMA_POOL_WORKERS)]:
+            future.result()
+    return _arima_pool
+
+def shutdown_arima_pool():
+    """Stop the ARIMA process pool"""
+    global _arima_pool
+    if _arima_pool is not None:
+        _arima_pool.shutdown(wait=False, cancel_futures=True)
+        _arima_pool = None
+
+def _fit_arima(data, order):
+    """Fit a single ARIMA candidate (None if the fit fails or has no AIC)"""
+    try:
+        fitted_model = ARIMA(data, order=order).fit()
+    except Exception:
+        return None
+    return None if np.isnan(fitted_model.aic) else fitted_model
+
+def _fit_arima_aic(data, order):
+    """AIC and parameters of a single ARIMA candidate (None if the fit fails)
+    
+    Runs on the pool; the parameters are enough to rebuild the fitted
+    results in the parent without pickling them back.
+    """
+    fitted_model = _fit_arima(data, order)
+    return None if fitted_model is None else (fitted_model.aic, fitted_model.params)
+
+def _search_arima_serial(data, candidates):
+    """Fit candidates one after another
+    
+    Returns {index: aic} and the fitted results of the lowest AIC (ties go to
+    the earlier candidate), or None.
+    """
+    results, best = {}, None
+    for i, order in enumerate(candidates):
+        fitted_model = _fit_arima(data, order)
+        results[i] = None if fitted_model is None else fitted_model.aic
+        if fitted_model is not None and (best is None or fitted_model.aic < best.aic):
+            best = fitted_model
+    return results, best
+
+def _search_arima_parallel(pool, data, candidates):
+    """Fit candidates on the process pool, returning {index: (aic, params)}"""
+    futures = {pool.submit(_fit_arima_aic, data, order): i
+               for i, order in enumerate(candidates)}
+    results = {}
+    pending = set(futures)
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            results[futures[future]] = future.result()
+
+        if ARIMA_EARLY_STOP_MARGIN and pending:
+            aics = sorted(fit[0] for fit in results.values() if fit is not None)
+            if (len(aics) >= max(ARIMA_EARLY_STOP_MIN_FITS, 2)
+                    and aics[1] - aics[0] >= ARIMA_EARLY_STOP_MARGIN):
+                for future in pending:
+                    future.cancel()
+                break
+    return results
+
+def _fit_candidates(data, candidates, parallel=True):
+    """Fit candidate orders, on the ARIMA pool when parallel
+    
+    Returns {index: aic} and the fitted results of the best candidate, or
+    None when none could be fitted. A winner fitted on the pool is rebuilt
+    here from its parameters with one Kalman filter pass instead of a refit.
+    """
+    pool = get_arima_pool() if parallel else None
+    if pool is None:
+        return _search_arima_serial(data, candidates)
+    try:
+        results = _search_arima_parallel(pool, data, candidates)
+    except BrokenProcessPool:
+        shutdown_arima_pool()
+        return _search_arima_serial(data, candidates)
+    
+    fitted = [(fit[0], i) for i, fit in results.items() if fit is not None]
+    best = None
+    if fitted:
+        i = min(fitted)[1]
+        # The parameter covariance is not needed to forecast
+        best = ARIMA(data, order=candidates[i]).filter(results[i][1], cov_type='none')
+    return {i: None if fit is None else fit[0] for i, fit in results.items()}, best
+
+def _search_arima_stepwise(data, d, max_p, max_q, parallel=True):
+    """Hyndman-Khandakar stepwise search over (p, q) for a fixed d
+    
+    Returns the best order, its fitted results (None if nothing could be
+    fitted) and the number of candidates fitted.
+    """
+    aics = {}
+    fitted_models = {}
+    
+    def fit(orders):
+        new = [order for order in dict.fromkeys(orders)
+               if order not in aics and 0 <= order[0] <= max_p and 0 <= order[2] <= max_q
+               and not (order[0] == 0 and order[2] == 0)]
+        results, best_new = _fit_candidates(data, new, parallel)
+        aics.update({new[i]: aic for i, aic in results.items()})
+        fitted = [(aic, order) for order, aic in aics.items() if aic is not None]
+        if not fitted:
+            return None
+        best = min(fitted)[1]
+        # Only the results of the best order so far are kept
+        if best_new is not None and tuple(best_new.model.order) == best:
+            fitted_models.clear()
+            fitted_models[best] = best_new
+        return best
+    
+    best = fit([(min(2, max_p), d, min(2, max_q)), (1, d, 0), (0, d, 1)])
+    while best is not None:
+        p, _, q = best
+        step = fit([(p + dp, d, q + dq) for dp, dq in itertools.product((-1, 0, 1), repeat=2)])
+        if step == best:
+            break
+        best = step
+    if best is None:
+        return (1, 1, 1), None, len(aics)
+    return best, fitted_models.get(best), len(aics)
+
+# ARIMA Functions
+def find_best_arima_params(data, max_p=3, max_d=2, max_q=3, parallel=True, strategy="exhaustive"):
+    """Find best ARIMA parameters using AIC
+    
+    Returns the order, its fitted results and the number of candidate fits
+    it took. The results are None when the order was not fitted: the fixed
+    strategy, or no candidate could be fitted and (1, 1, 1) is returned.
+    parallel=False searches serially in this process, e.g. inside a worker
+    of another process pool.
+    """
+    if strategy == "fixed":
+        return ARIMA_FIXED_ORDER, None, 0
+    
+    # Check if data is stationary
+    adf_result = adfuller(data)
+    is_stationary = adf_result[1] < 0.05
+    
+    if strategy == "stepwise":
+        # One d instead of every d in the grid: difference again only while
+        # the series still looks non-stationary
+        d = 0
+        if not is_stationary:
+            d = 1 if max_d < 2 or adfuller(np.diff(data))[1] < 0.05 else 2
+        return _search_arima_stepwise(data, d, max_p, max_q, parallel)
+    
+    d_range = range(0, 1) if is_stationary else range(1, max_d + 1)
+    
+    candidates = [(p, d, q) for p, d, q in
+                  itertools.product(range(max_p + 1), d_range, range(max_q + 1))
+                  if not (p == 0 and q == 0)]
+    
+    results, fitted_model = _fit_candidates(data, candidates, parallel)
+    
+    # Lowest AIC wins; ties go to the earlier candidate, as in a serial scan
+    fitted = [(aic, i) for i, aic in results.items() if aic is not None]
+    if not fitted:
+        return (1, 1, 1), None, len(results)
+    return candidates[min(fitted)[1]], fitted_model, len(results)
+
+def load_daily_sales(conn, product_id):
+    """Daily sales series of a product, read from the daily_sales rollup
+    
+    Days without sales are filled with 0. Returns the series and the number of sales_history rows behind it.
+    """
+    df = pd.read_sql_query("""
+        SELECT day, qty, n_rows FROM daily_sales
+        WHERE product_id = ?
+        ORDER BY day
+    """, conn, params=(product_id,), parse_dates=['day'])
+    
+    daily_sales = df.set_index('day')['qty'].asfreq('D', fill_value=0)
+    return daily_sales, int(df['n_rows'].sum())
+
+# Warm-start refits
+# The order and parameters chosen for a product are kept in forecast_models.
+# When new sales arrive only that order is refitted, seeded with the previous
+# parameters; the full grid search runs again once the in-sample RMSE drifts
+# past ARIMA_REFIT_DRIFT_THRESHOLD times the RMSE of the last full search.
+ARIMA_REFIT_DRIFT_THRESHOLD = float(os.environ.get("ARIMA_REFIT_DRIFT_THRESHOLD", "1.2"))
+
+def in_sample_rmse(fitted_model):
+    """RMSE of one-step-ahead residuals, skipping the diffuse burn-in"""
+    resid = np.asarray(fitted_model.resid)[fitted_model.loglikelihood_burn:]
+    if len(resid) == 0:
+        return np.inf
+    return float(np.sqrt(np.mean(resid ** 2)))
+
+def fit_demand_model(daily_sales, previous_model=None, parallel=True, strategy=None):
+    """Fit the ARIMA model for a daily series, warm-starting when possible
+    
+    Returns the fitted results and the model state to keep for the next refit.
+    The state's "search" records the strategy used ("warm" for a warm refit),
+    the number of ARIMA fits and the seconds they took.
+    """
+    strategy = strategy or ARIMA_SEARCH_STRATEGY
+    started = time.perf_counter()
+    fits = 0
+    if previous_model is not None:
+        order = tuple(previous_model['order'])
+        try:
+            fits += 1
+            fitted_model = ARIMA(daily_sales, order=order).fit(
+                start_params=np.asarray(previous_model['params']))
+            rmse = in_sample_rmse(fitted_model)
+            if rmse <= previous_model['baseline_rmse'] * ARIMA_REFIT_DRIFT_THRESHOLD:
+                return fitted_model, {
+                    "order": order,
+                    "params": fitted_model.params.tolist(),
+                    "baseline_rmse": previous_model['baseline_rmse'],
+                    "rmse": rmse,
+                    "refit": "warm",
+                    "search": {"strategy": "warm", "fits": fits,
+                               "seconds": round(time.perf_counter() - started, 3)},
+                }
+        except Exception:
+            pass
+    
+    # Find best parameters; the search hands back the winner already fitted
+    best_params, fitted_model, search_fits = find_best_arima_params(
+        daily_sales.values, parallel=parallel, strategy=strategy)
+    fits += search_fits
+    
+    if fitted_model is None:
+        fitted_model = ARIMA(daily_sales.values, order=best_params).fit()
+        fits += 1
+    
+    rmse = in_sample_rmse(fitted_model)
+    return fitted_model, {
+        "order": best_params,
+        "params": fitted_model.params.tolist(),
+        "baseline_rmse": rmse,
+        "rmse": rmse,
+        "refit": "full",
+        "search": {"strategy": strategy, "fits": fits,
+                   "seconds": round(time.perf_counter() - started, 3)},
+    }
+
+# Prediction interval levels returned with every forecast and their normal
+# quantiles; the keys are strings since the intervals are stored as JSON
+FORECAST_INTERVALS = {"80": 1.2815515655446004, "95": 1.959963984540054}
+
+def prediction_intervals(mean, std):
+    """{level: [[lower, upper], ...]} for each of FORECAST_INTERVALS"""
+    return {level: np.column_stack([mean - z * std, mean + z * std]).tolist()
+            for level, z in FORECAST_INTERVALS.items()}
+
+def forecast_from_model(fitted_model, periods):
+    """Point forecasts (clipped at 0) and their prediction intervals
+    
+    One prediction pass gives the mean and its standard errors, from which
+    every interval level is derived.
+    """
+    prediction = fitted_model.get_forecast(steps=periods)
+    mean = np.asarray(prediction.predicted_mean)
+    std = np.asarray(prediction.se_mean)
+    return np.maximum(mean, 0).tolist(), prediction_intervals(mean, std)
+
+# Fast-path forecasters
+# Series that ARIMA fits poorly, or needlessly slowly, get a closed-form
+# smoothing model instead, fitted with a few linear filters and no
+# statsmodels call. Each forecaster takes the daily values and the horizon
+# and returns (values, intervals, params) like the ARIMA path.
+# select_forecaster picks one from the series' demand class (Syntetos-Boylan:
+# ADI, the average days between sales, and CV2, the squared coefficient of
+# variation of the non-zero daily totals):
+#   intermittent (ADI >= 1.32, CV2 < 0.49)   croston
+#   lumpy        (ADI >= 1.32, CV2 >= 0.49)  tsb
+#   smooth or erratic, shorter than FORECAST_ARIMA_MIN_DAYS days:
+#                holt when the series has a significant linear trend, else ses
+#   anything else                            arima
+# FORECAST_MODEL names one model to use for every series instead of "auto".
+FORECAST_MODEL = os.environ.get("FORECAST_MODEL", "auto")
+FORECAST_ARIMA_MIN_DAYS = int(os.environ.get("FORECAST_ARIMA_MIN_DAYS", "60"))
+INTERMITTENT_ADI = 1.32
+LUMPY_CV2 = 0.49
+SMOOTHING_ALPHAS = np.round(np.arange(0.05, 1.0, 0.05), 2)
+SMOOTHING_BETAS = (0.01, 0.05, 0.1, 0.2, 0.3)
+CROSTON_ALPHA = 0.1
+TSB_BETA = 0.1
+
+def _smoothed(y, alpha, initial=None):
+    """Simple exponential smoothing level after each value of y"""
+    initial = y[0] if initial is None else initial
+    return lfilter([alpha], [1.0, alpha - 1.0], y, zi=[(1.0 - alpha) * initial])[0]
+
+def _smoothing_forecast(mean, std, params):
+    """Clip the point forecast at 0 and add the prediction intervals"""
+    return np.maximum(mean, 0).tolist(), prediction_intervals(mean, std), params
+
+def forecast_ses(y, periods):
+    """Simple exponential smoothing, alpha chosen by one-step squared error"""
+    best = None
+    for alpha in SMOOTHING_ALPHAS:
+        levels = _smoothed(y, alpha)
+        errors = y[1:] - levels[:-1]
+        sse = float(errors @ errors)
+        if best is None or sse < best[0]:
+            best = (sse, alpha, levels[-1])
+    sse, alpha, level = best
+    sigma2 = sse / max(len(y) - 1, 1)
+    std = np.sqrt(sigma2 * (1 + np.arange(periods) * alpha ** 2))
+    return _smoothing_forecast(np.full(periods, level), std, {"alpha": float(alpha)})
+
+def forecast_holt(y, periods):
+    """Holt's linear trend, alpha and beta chosen by one-step squared error
+    
+    The one-step errors come from Holt's ARIMA(0,2,2) form, one filter pass
+    per (alpha, beta), starting from level y[0] and trend y[1] - y[0].
+    """
+    if len(y) < 3:
+        return forecast_ses(y, periods)
+    trend0 = y[1] - y[0]
+    # Filter state as if y[0] - trend0 and y[0] came before, with no errors
+    zi = lfiltic([1.0, -2.0, 1.0], [1.0, 0.0, 0.0], [0.0, 0.0], [y[0], y[0] - trend0])
+    best = None
+    for alpha, beta in itertools.product(SMOOTHING_ALPHAS, SMOOTHING_BETAS):
+        a = [1.0, alpha + alpha * beta - 2.0, 1.0 - alpha]
+        errors = lfilter([1.0, -2.0, 1.0], a, y[1:], zi=zi)[0]
+        sse = float(errors @ errors)
+        if best is None or sse < best[0]:
+            best = (sse, alpha, beta, errors)
+    sse, alpha, beta, errors = best
+    level = y[-1] - (1 - alpha) * errors[-1]
+    trend = trend0 + alpha * beta * errors.sum()
+    
+    steps = np.arange(1, periods + 1)
+    sigma2 = sse / max(len(y) - 2, 1)
+    # h-step variance: sigma2 * (1 + sum over j < h of (alpha * (1 + j * beta))^2)
+    weights = np.concatenate([[0.0], np.cumsum((alpha * (1 + steps[:-1] * beta)) ** 2)])
+    std = np.sqrt(sigma2 * (1 + weights))
+    return _smoothing_forecast(level + steps * trend, std,
+                               {"alpha": float(alpha), "beta": float(beta)})
+
+def _demand_forecast(y, per_day, periods, params):
+    """Flat forecast of an intermittent-demand method and its interval
+    
+    per_day[k] is the forecast made after day k; the interval width comes
+    from its one-step errors from the first sale on.
+    """
+    errors = y[1:] - per_day[:-1]
+    errors = errors[np.flatnonzero(y)[0]:] if y.any() else errors
+    std = np.sqrt(errors @ errors / len(errors)) if len(errors) else 0.0
+    return _smoothing_forecast(np.full(periods, per_day[-1]), np.full(periods, std), params)
+
+def forecast_croston(y, periods):
+    """Croston's method: smoothed demand size over smoothed interval between sales"""
+    sale_days = np.flatnonzero(y)
+    if len(sale_days) == 0:
+        return _smoothing_forecast(np.zeros(periods), np.zeros(periods), {"alpha": CROSTON_ALPHA})
+    sizes = _smoothed(y[sale_days], CROSTON_ALPHA)
+    intervals = _smoothed(np.diff(sale_days, prepend=-1).astype(np.float64), CROSTON_ALPHA)
+    # Estimates only change on days with a sale
+    last_sale = np.searchsorted(sale_days, np.arange(len(y)), side='right') - 1
+    per_day = np.where(last_sale >= 0, (sizes / intervals)[last_sale], 0.0)
+    return _demand_forecast(y, per_day, periods, {"alpha": CROSTON_ALPHA})
+
+def forecast_tsb(y, periods):
+    """Teunter-Syntetos-Babai: smoothed demand size times smoothed probability of a sale
+    
+    The probability is updated every day, so an item that stops selling
+    decays towards 0 rather than keeping its last Croston estimate.
+    """
+    sale_days = np.flatnonzero(y)
+    if len(sale_days) == 0:
+        return _smoothing_forecast(np.zeros(periods), np.zeros(periods),
+                                   {"alpha": CROSTON_ALPHA, "beta": TSB_BETA})
+    sold = (y > 0).astype(np.float64)
+    probability = _smoothed(sold, TSB_BETA, initial=sold.mean())
+    sizes = _smoothed(y[sale_days], CROSTON_ALPHA)
+    last_sale = np.searchsorted(sale_days, np.arange(len(y)), side='right') - 1
+    per_day = np.where(last_sale >= 0, probability * sizes[np.maximum(last_sale, 0)], 0.0)
+    return _demand_forecast(y, per_day, periods, {"alpha": CROSTON_ALPHA, "beta": TSB_BETA})
+
+# Fast-path forecasters by name; "arima" is the statsmodels path
+FORECASTERS = {
+    "ses": forecast_ses,
+    "holt": forecast_holt,
+    "croston": forecast_croston,
+    "tsb": forecast_tsb,
+}
+FORECAST_MODELS = ("arima", *FORECASTERS)
+
+def classify_demand(y):
+    """Demand class of a daily series: smooth, erratic, intermittent or lumpy"""
+    sizes = y[y > 0]
+    if len(sizes) == 0:
+        return "intermittent"
+    adi = len(y) / len(sizes)
+    cv2 = sizes.var() / sizes.mean() ** 2
+    if adi >= INTERMITTENT_ADI:
+        return "lumpy" if cv2 >= LUMPY_CV2 else "intermittent"
+    return "erratic" if cv2 >= LUMPY_CV2 else "smooth"
+
+def has_linear_trend(y):
+    """Whether the least-squares slope of y is more than two standard errors from 0"""
+    if len(y) < 4:
+        return False
+    t = np.arange(len(y)) - (len(y) - 1) / 2
+    slope = (t @ y) / (t @ t)
+    resid = y - y.mean() - slope * t
+    se = np.sqrt((resid @ resid) / (len(y) - 2) / (t @ t))
+    return bool(abs(slope) > 2 * se)
+
+def select_forecaster(y, model=None):
+    """Model for a daily series and its demand class; see Fast-path forecasters
+    
+    model overrides FORECAST_MODEL.
+    """
+    demand_class = classify_demand(y)
+    model = model or FORECAST_MODEL
+    if model != "auto":
+        return model, demand_class
+    if demand_class == "intermittent":
+        return "croston", demand_class
+    if demand_class == "lumpy":
+        return "tsb", demand_class
+    if len(y) < FORECAST_ARIMA_MIN_DAYS:
+        return ("holt" if has_linear_trend(y) else "ses"), demand_class
+    return "arima", demand_class
+
+def fit_and_forecast(daily_sales, periods, previous_model=None, parallel=True, strategy=None,
+                     model=None):
+    """Fit a daily series and forecast it; returns (values, intervals, model_state)
+    
+    The model comes from select_forecaster. For the fast-path models the
+    state holds their parameters, and its "search" names the model as the
+    strategy with no ARIMA fits.
+    """
+    y = np.asarray(daily_sales.values, dtype=np.float64)
+    model, demand_class = select_forecaster(y, model)
+    if model != "arima":
+        started = time.perf_counter()
+        forecast_values, intervals, params = FORECASTERS[model](y, periods)
+        return forecast_values, intervals, {
+            "model": model,
+            "demand_class": demand_class,
+            "params": params,
+            "search": {"strategy": model, "fits": 0,
+                       "seconds": round(time.perf_counter() - started, 6)},
+        }
+    
+    fitted_model, model_state = fit_demand_model(daily_sales, previous_model, parallel, strategy)
+    forecast_values, intervals = forecast_from_model(fitted_model, periods)
+    return forecast_values, intervals, {**model_state, "model": "arima", "demand_class": demand_class}
+
+def load_model_state(conn, product_id):
+    """Previously selected ARIMA order and parameters for a product"""
+    cursor = conn.cursor()
+    cursor.execute("""
+        SELECT arima_p, arima_d, arima_q, params, baseline_rmse
+        FROM forecast_models WHERE product_id = ?
+    """, (product_id,))
+    row = cursor.fetchone()
+    if not row:
+        return None
+    return {
+        "order": (row['arima_p'], row['arima_d'], row['arima_q']),
+        "params": json.loads(row['params']),
+        "baseline_rmse": row['baseline_rmse'],
+    }
+
+def save_model_state(conn, product_id, n_obs, model_state):
+    """Remember the fitted order and parameters for the next warm start"""
+    p, d, q = (int(x) for x in model_state['order'])
+    conn.execute("""
+        INSERT OR REPLACE INTO forecast_models
+            (product_id, arima_p, arima_d, arima_q, params, n_obs,
+             baseline_rmse, rmse, refit, updated_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
+    """, (product_id, p, d, q, json.dumps(model_state['params']), n_obs,
+          model_state['baseline_rmse'], model_state['rmse'], model_state['refit']))
+
+# Forecast cache
+# Forecast results are stored in the forecast_cache table keyed by product,
+# a fingerprint of the daily sales series and the forecast horizon. Entries
+# are evicted least-recently-used first once either limit is exceeded.
+FORECAST_CACHE_MAX_ENTRIES = int(os.environ.get("FORECAST_CACHE_MAX_ENTRIES", "2000"))
+FORECAST_CACHE_MAX_BYTES = int(os.environ.get("FORECAST_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+# Hits refresh last_accessed at most this often, so repeated reads stay read-only
+FORECAST_CACHE_TOUCH_SECONDS = 5
+
+def series_fingerprint(daily_sales):
+    """Hash a daily sales series (start date and values)"""
+    digest = hashlib.sha256()
+    digest.update(str(daily_sales.index[0].date()).encode())
+    digest.update(np.ascontiguousarray(daily_sales.values, dtype=np.float64).tobytes())
+    return digest.hexdigest()
+
+def get_cached_forecast(conn, product_id, series_hash, periods):
+    """Return a cached (values, intervals, model) tuple or None"""
+    cursor = conn.cursor()
+    cursor.execute("""
+        SELECT payload, last_accessed FROM forecast_cache
+        WHERE product_id = ? AND series_hash = ? AND periods = ?
+    """, (product_id, series_hash, periods))
+    row = cursor.fetchone()
+    if not row:
+        return None
+    payload = json.loads(row[0])
+    # Entries cached before the 80% intervals are refitted
+    if 'intervals' not in payload:
+        return None
+    
+    now = time.time()
+    if now - (row[1] or 0) >= FORECAST_CACHE_TOUCH_SECONDS:
+        cursor.execute("""
+            UPDATE forecast_cache SET last_accessed = ?
+            WHERE product_id = ? AND series_hash = ? AND periods = ?
+        """, (now, product_id, series_hash, periods))
+        conn.commit()
+    
+    return payload['values'], payload['intervals'], payload['model']
+
+def store_cached_forecast(conn, product_id, series_hash, periods, values, intervals, model):
+    """Save a forecast result and evict old entries over the cache limits"""
+    payload = json.dumps({
+        "values": values,
+        "intervals": intervals,
+        "model": model,
+    })
+    cursor = conn.cursor()
+    cursor.execute("""
+        INSERT OR REPLACE INTO forecast_cache
+            (product_id, series_hash, periods, payload, size_bytes, last_accessed)
+        VALUES (?, ?, ?, ?, ?, ?)
+    """, (product_id, series_hash, periods, payload, len(payload), time.time()))
+    
+    # Evict least recently used entries beyond the count or size limit
+    cursor.execute("""
+        DELETE FROM forecast_cache WHERE rowid IN (
+            SELECT rowid FROM (
+                SELECT rowid,
+                       ROW_NUMBER() OVER (ORDER BY last_accessed DESC) AS rank,
+                       SUM(size_bytes) OVER (ORDER BY last_accessed DESC) AS running_bytes
+                FROM forecast_cache
+            )
+            WHERE rank > ? OR running_bytes > ?
+        )
+    """, (FORECAST_CACHE_MAX_ENTRIES, FORECAST_CACHE_MAX_BYTES))
+    conn.commit()
+
+def invalidate_forecast_cache(conn, product_ids):
+    """Drop cached forecasts for products whose sales history changed"""
+    product_ids = list(set(product_ids))
+    if not product_ids:
+        return
+    cursor = conn.cursor()
+    cursor.executemany("DELETE FROM forecast_cache WHERE product_id = ?",
+                       [(pid,) for pid in product_ids])
+
+# Model search info of a forecast served from the cache
+CACHED_SEARCH = {"strategy": "cached", "fits": 0, "seconds": 0.0}
+
+def cached_forecast_demand(conn, product_id, daily_sales, periods=30, strategy=None):
+    """fit_and_forecast for a daily series, backed by the on-disk forecast cache
+    
+    Returns (values, intervals, model, search), model being the name, demand class
+    and ARIMA order or parameters of the model used. A cached forecast is served
+    whatever strategy it was searched with; strategy applies to new full
+    searches only, since refits keep the stored order while it still fits.
+    """
+    series_hash = series_fingerprint(daily_sales)
+    cached = get_cached_forecast(conn, product_id, series_hash, periods)
+    if cached:
+        return (*cached, CACHED_SEARCH)
+    
+    forecast_values, intervals, model_state = fit_and_forecast(
+        daily_sales, periods, load_model_state(conn, product_id), strategy=strategy)
+    return save_forecast(conn, product_id, daily_sales, series_hash, periods,
+                         forecast_values, intervals, model_state)
+
+def record_model_search(search):
+    with _search_stats_lock:
+        stats = arima_search_stats.setdefault(search["strategy"], {"searches": 0, "fits": 0, "seconds": 0.0})
+        stats["searches"] += 1
+        stats["fits"] += search["fits"]
+        stats["seconds"] = round(stats["seconds"] + search["seconds"], 3)
+
+def save_forecast(conn, product_id, daily_sales, series_hash, periods,
+                  forecast_values, intervals, model_state):
+    """Keep a fresh fit's model state and cache its forecast"""
+    model = {"name": model_state['model'], "demand_class": model_state['demand_class']}
+    record_model_search(model_state['search'])
+    if model['name'] == "arima":
+        model['order'] = [int(x) for x in model_state['order']]
+        save_model_state(conn, product_id, len(daily_sales), model_state)
+    else:
+        model['params'] = model_state['params']
+    store_cached_forecast(conn, product_id, series_hash, periods,
+                          forecast_values, intervals, model)
+    return forecast_values, intervals, model, model_state['search']
+
+def calculate_eoq(annual_demand, ordering_cost, holding_cost):
+    """Calculate Economic Order Quantity"""
+    if annual_demand <= 0 or holding_cost <= 0:
+        return 0
+    eoq = np.sqrt((2 * annual_demand * ordering_cost) / holding_cost)
+    return round(eoq, 2)
+
+def calculate_safety_stock(demand_std, lead_time_days, service_level=0.95):
+    """Calculate Safety Stock using Z-score method"""
+    from scipy import stats
+    z_score = stats.norm.ppf(service_level)
+    safety_stock = z_score * demand_std * np.sqrt(lead_time_days)
+    return round(safety_stock, 2)
+
+def calculate_rop(avg_daily_demand, lead_time_days, safety_stock):
+    """Calculate Reorder Point"""
+    lead_time_demand = avg_daily_demand * lead_time_days
+    rop = lead_time_demand + safety_stock
+    return round(rop, 2)
+
+# Demand accumulators
+# demand_stats holds, per product, the running count, sum and sum of squares
+# of its daily sales totals and the first and last day sold, maintained by
+# triggers as sales are written. Days without sales count as 0, so mean and
+# standard deviation of the daily series are a single-row lookup.
+DEMAND_STATS_SQL = """
+    SELECT product_id, n_rows, total, total_sq,
+           CAST(julianday(last_day) - julianday(first_day) AS INTEGER) + 1 AS n_days
+    FROM demand_stats
+"""
+
+def demand_from_totals(n_rows, total, total_sq, n_days):
+    """Mean and standard deviation of a daily series from its running totals
+    
+    The variance is taken from the exact integer totals, so it does not
+    drift however many sales have been added and removed.
+    """
+    if n_rows < 2:
+        return 0.0, 0.0
+    mean = total / n_days
+    if n_days < 2:
+        return mean, 0.0
+    variance = (n_days * total_sq - total * total) / (n_days * (n_days - 1))
+    return mean, float(np.sqrt(max(variance, 0.0)))
+
+def get_product_demand_metrics(product_id, conn):
+    """Calculate consistent demand metrics for a product"""
+    row = conn.execute(f"{DEMAND_STATS_SQL} WHERE product_id = ?", (product_id,)).fetchone()
+    if not row:
+        return 0.0, 0.0
+    return demand_from_totals(row['n_rows'], row['total'], row['total_sq'], row['n_days'])
+
+def get_all_demand_metrics(conn, product_ids=None):
+    """Demand metrics for every product with sales, or only product_ids
+    
+    Returns a DataFrame indexed by product_id with avg_daily_demand and
+    demand_std, matching get_product_demand_metrics for each product.
+    """
+    if product_ids is None:
+        df = pd.read_sql_query(DEMAND_STATS_SQL, conn, index_col='product_id')
+    else:
+        df = pd.read_sql_query(f"""
+            {DEMAND_STATS_SQL}
+            WHERE product_id IN (SELECT value FROM json_each(?))
+        """, conn, params=(json.dumps(list(product_ids)),), index_col='product_id')
+    
+    df = df[df['n_rows'] >= 2]
+    n_days = df['n_days'].astype(np.int64)
+    mean = df['total'] / n_days
+    variance = ((n_days * df['total_sq'] - df['total'] ** 2)
+                / (n_days * (n_days - 1)).where(n_days > 1))
+    std = np.sqrt(variance.clip(lower=0)).where(n_days > 1, 0.0)
+    
+    return pd.DataFrame({"avg_daily_demand": mean, "demand_std": std.fillna(0.0)})
+
+# Expected rollup contents, aggregated from the raw sales rows
+_EXPECTED_ROLLUPS_SQL = """
+    WITH expected_daily AS (
+        SELECT product_id, date(sale_date) AS day, SUM(quantity) AS qty, COUNT(*) AS n_rows
+        FROM sales_history
+        WHERE date(sale_date) IS NOT NULL
+        GROUP BY product_id, day
+    ),
+    expected_stats AS (
+        SELECT product_id, SUM(n_rows) AS n_rows, SUM(qty) AS total,
+               SUM(qty * qty) AS total_sq, MIN(day) AS first_day, MAX(day) AS last_day
+        FROM expected_daily
+        GROUP BY product_id
+    )
+"""
+
+def check_sales_rollups(conn):
+    """Count daily_sales and demand_stats rows that disagree with sales_history"""
+    daily_sales, demand_stats = conn.execute(f"""
+        {_EXPECTED_ROLLUPS_SQL}
+        SELECT
+            (SELECT COUNT(*) FROM (
+                SELECT * FROM expected_daily
+                EXCEPT SELECT product_id, day, qty, n_rows FROM daily_sales))
+          + (SELECT COUNT(*) FROM (
+                SELECT product_id, day, qty, n_rows FROM daily_sales
+                EXCEPT SELECT * FROM expected_daily)),
+            (SELECT COUNT(*) FROM (
+                SELECT * FROM expected_stats
+                EXCEPT SELECT product_id, n_rows, total, total_sq, first_day, last_day FROM demand_stats))
+          + (SELECT COUNT(*) FROM (
+                SELECT product_id, n_rows, total, total_sq, first_day, last_day FROM demand_stats
+                EXCEPT SELECT * FROM expected_stats))
+    """).fetchone()
+    return {"daily_sales": daily_sales, "demand_stats": demand_stats}
+
+def rebuild_sales_rollups(conn):
+    """Recompute daily_sales, demand_stats and reorder_status from sales_history and commit"""
+    try:
+        conn.execute("BEGIN")
+        conn.execute("DELETE FROM daily_sales")
+        conn.execute("DELETE FROM demand_stats")
+        conn.execute(f"""
+            {_EXPECTED_ROLLUPS_SQL}
+            INSERT INTO daily_sales (product_id, day, qty, n_rows)
+            SELECT product_id, day, qty, n_rows FROM expected_daily
+        """)
+        # The insert triggers have filled demand_stats already; replace it with
+        # a fresh aggregate anyway so the rebuild does not depend on them
+        conn.execute("DELETE FROM demand_stats")
+        conn.execute("""
+            INSERT INTO demand_stats (product_id, n_rows, total, total_sq, first_day, last_day)
+            SELECT product_id, SUM(n_rows), SUM(qty), SUM(qty * qty), MIN(day), MAX(day)
+            FROM daily_sales
+            GROUP BY product_id
+        """)
+        refresh_reorder_status(conn)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+def calculate_reorder_metrics(products, demand):
+    """Vectorized safety stock, ROP and EOQ for a products DataFrame
+    
+    `products` is indexed by product id; `demand` comes from
+    get_all_demand_metrics. Products without sales get zero demand, and
+    missing stock, lead times and costs count as zero.
+    """
+    inputs = ['current_stock', 'lead_time_days', 'unit_cost', 'ordering_cost',
+              'holding_cost_percentage']
+    metrics = products.join(demand, how='left')
+    metrics[inputs] = metrics[inputs].fillna(0)
+    metrics[['avg_daily_demand', 'demand_std']] = (
+        metrics[['avg_daily_demand', 'demand_std']].fillna(0.0))
+    
+    lead_time = metrics['lead_time_days'].astype(float)
+    metrics['safety_stock'] = calculate_safety_stock(metrics['demand_std'], lead_time)
+    metrics['rop'] = calculate_rop(metrics['avg_daily_demand'], lead_time, metrics['safety_stock'])
+    
+    annual_demand = metrics['avg_daily_demand'] * 365
+    holding_cost = metrics['unit_cost'] * metrics['holding_cost_percentage']
+    valid = (annual_demand > 0) & (holding_cost > 0)
+    eoq = np.sqrt((2 * annual_demand * metrics['ordering_cost']) / holding_cost.where(valid))
+    metrics['eoq'] = eoq.where(valid, 0.0).round(2)
+    
+    return metrics
+
+def classify_stock_health(metrics):
+    """Label each product out_of_stock, low_stock or healthy
+    
+    Products without sales data are healthy as long as they have stock.
+    """
+    status = np.select(
+        [metrics['current_stock'] <= 0,
+         (metrics['avg_daily_demand'] > 0) & (metrics['current_stock'] <= metrics['rop'])],
+        ["out_of_stock", "low_stock"],
+        default="healthy")
+    return pd.Series(status, index=metrics.index)
+
+# Reorder status
+# reorder_status materializes calculate_reorder_metrics and
+# classify_stock_health per product so the dashboard and analytics read it
+# instead of recomputing. Every change of a product's status is appended to
+# reorder_events, a change feed clients can follow by id; only the newest
+# REORDER_EVENTS_MAX_ROWS events are kept.
+REORDER_EVENTS_MAX_ROWS = int(os.environ.get("REORDER_EVENTS_MAX_ROWS", "10000"))
+
+def refresh_reorder_status(conn, product_ids=None):
+    """Recompute reorder_status for all products or only product_ids
+    
+    Rows of deleted products are removed. Status changes are logged to
+    reorder_events and returned. Nothing is committed here.
+    """
+    if product_ids is None:
+        scope, params = "", ()
+    else:
+        product_ids = [int(pid) for pid in set(product_ids)]
+        if not product_ids:
+            return []
+        scope, params = "WHERE {} IN (SELECT value FROM json_each(?))", (json.dumps(product_ids),)
+    
+    products = pd.read_sql_query(f"""
+        SELECT id, current_stock, lead_time_days, unit_cost, ordering_cost,
+               holding_cost_percentage
+        FROM products {scope.format('id')}
+    """, conn, params=params, index_col='id')
+    metrics = calculate_reorder_metrics(products, get_all_demand_metrics(conn, product_ids))
+    metrics['status'] = classify_stock_health(metrics)
+    metrics['needs_reorder'] = ((metrics['avg_daily_demand'] > 0)
+                                & (metrics['current_stock'] <= metrics['rop'])).astype(int)
+    
+    previous = {row['product_id']: (row['status'], row['needs_reorder'])
+                for row in conn.execute(f"""
+                    SELECT product_id, status, needs_reorder FROM reorder_status
+                    {scope.format('product_id')}
+                """, params)}
+    
+    conn.executemany("""
+        INSERT INTO reorder_status (product_id, current_stock, avg_daily_demand, demand_std,
+                                    safety_stock, rop, eoq, status, needs_reorder, updated_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
+        ON CONFLICT (product_id) DO UPDATE SET
+            current_stock = excluded.current_stock,
+            avg_daily_demand = excluded.avg_daily_demand,
+            demand_std = excluded.demand_std,
+            safety_stock = excluded.safety_stock,
+            rop = excluded.rop,
+            eoq = excluded.eoq,
+            status = excluded.status,
+            needs_reorder = excluded.needs_reorder,
+            updated_at = excluded.updated_at
+    """, zip(metrics.index.tolist(), metrics['current_stock'].astype(int).tolist(),
+             metrics['avg_daily_demand'].tolist(), metrics['demand_std'].tolist(),
+             metrics['safety_stock'].tolist(), metrics['rop'].tolist(), metrics['eoq'].tolist(),
+             metrics['status'].tolist(), metrics['needs_reorder'].tolist()))
+    
+    changes = [(int(product_id), previous.get(product_id, (None, 0))[0], row['status'],
+                int(row['needs_reorder']), int(row['current_stock']), float(row['rop']))
+               for product_id, row in metrics.iterrows()
+               if previous.get(product_id) != (row['status'], row['needs_reorder'])]
+    removed = [product_id for product_id in previous if product_id not in metrics.index]
+    conn.executemany("DELETE FROM reorder_status WHERE product_id = ?",
+                     [(product_id,) for product_id in removed])
+    changes += [(product_id, previous[product_id][0], None, 0, None, None)
+                for product_id in removed]
+    
+    events = []
+    for change in changes:
+        cursor = conn.execute("""
+            INSERT INTO reorder_events (product_id, previous_status, status, needs_reorder,
+                                        current_stock, rop)
+            VALUES (?, ?, ?, ?, ?, ?)
+        """, change)
+        events.append(dict(zip(("id", "product_id", "previous_status", "status",
+                                "needs_reorder", "current_stock", "rop"),
+                               (cursor.lastrowid, *change))))
+    if events:
+        conn.execute("DELETE FROM reorder_events WHERE id <= ?",
+                     (events[-1]["id"] - REORDER_EVENTS_MAX_ROWS,))
+    return events
+
+# Live events
+# Clients subscribe to GET /api/events (server-sent events) instead of
+# polling. Writers build their events inside the write transaction, so they
+# see the committed values, and publish them after the commit:
+#   stock       - a product's stock changed (delta plus a snapshot of the
+#                 product's stock, ROP, EOQ and reorder status)
+#   reorder     - a reorder_events row, with the same snapshot
+#   transaction - a transaction recorded through POST /api/transactions
+#   import      - sales were imported; lists may need reloading
+#   resync      - the client fell behind or too much changed at once and
+#                 should reload what it shows
+# Each client has a queue of SSE_QUEUE_SIZE events; a client that falls
+# further behind gets a single resync instead of the events it missed.
+SSE_QUEUE_SIZE = int(os.environ.get("SSE_QUEUE_SIZE", "256"))
+SSE_KEEPALIVE_SECONDS = float(os.environ.get("SSE_KEEPALIVE_SECONDS", "15"))
+# Writes touching more products than this publish one resync instead
+SSE_MAX_PRODUCT_EVENTS = int(os.environ.get("SSE_MAX_PRODUCT_EVENTS", "200"))
+
+class EventBroker:
+    """Fan-out of live events to the asyncio queues of connected clients"""
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = set()
+        self._loop = None
+        self.published = 0
+        self.resyncs = 0
+    
+    def bind(self, loop):
+        """Deliver events on this event loop; called at startup"""
+        self._loop = loop
+    
+    def subscribe(self):
+        queue = asyncio.Queue(maxsize=SSE_QUEUE_SIZE)
+        with self._lock:
+            self._subscribers.add(queue)
+        return queue
+    
+    def unsubscribe(self, queue):
+        with self._lock:
+            self._subscribers.discard(queue)
+    
+    def publish(self, events):
+        """Queue (event_type, data) pairs for every client; safe from any thread"""
+        loop = self._loop
+        if not events or loop is None or loop.is_closed():
+            return
+        with self._lock:
+            subscribers = list(self._subscribers)
+            self.published += len(events)
+        for queue in subscribers:
+            loop.call_soon_threadsafe(self._deliver, queue, events)
+    
+    def _deliver(self, queue, events):
+        for event in events:
+            if queue.full():
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait(("resync", {}))
+                self.resyncs += 1
+                return
+            queue.put_nowait(event)
+    
+    def close(self):
+        """End every client stream, e.g. at shutdown"""
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for queue in subscribers:
+            while not queue.empty():
+                queue.get_nowait()
+            queue.put_nowait(None)
+    
+    def stats(self):
+        with self._lock:
+            return {"clients": len(self._subscribers), "published": self.published,
+                    "resyncs": self.resyncs}
+
+event_broker = EventBroker()
+
+def product_snapshots(conn, product_ids):
+    """Stock and reorder status of products, keyed by id, for live events"""
+    cursor = conn.execute("""
+        SELECT p.id AS product_id, p.code, p.name, p.unit, p.unit_cost, p.current_stock,
+               r.rop, r.eoq, r.status, r.needs_reorder
+        FROM products p
+        LEFT JOIN reorder_status r ON r.product_id = p.id
+        WHERE p.id IN (SELECT value FROM json_each(?))
+    """, (json.dumps([int(pid) for pid in product_ids]),))
+    return {row["product_id"]: dict(row) for row in cursor.fetchall()}
+
+def change_events(conn, stock_deltas=None, reorder_events=()):
+    """'stock' and 'reorder' events for a write, built before it commits"""
+    stock_deltas = stock_deltas or {}
+    product_ids = set(stock_deltas) | {event["product_id"] for event in reorder_events}
+    if len(product_ids) > SSE_MAX_PRODUCT_EVENTS:
+        return [("resync", {})]
+    
+    snapshots = product_snapshots(conn, product_ids)
+    events = []
+    for product_id, delta in stock_deltas.items():
+        snapshot = snapshots.get(product_id)
+        if snapshot:
+            events.append(("stock", {**snapshot, "delta": delta,
+                                     "stock_value_delta": delta * (snapshot["unit_cost"] or 0)}))
+    for event in reorder_events:
+        events.append(("reorder", {**snapshots.get(event["product_id"], {}), **event}))
+    return events
+
+def build_product_forecast(conn, product, periods=30, strategy=None):
+    """Forecast a product and compute its inventory metrics
+    
+    Returns None when there is not enough sales history and raises
+    RuntimeError when the model could not be fitted.
+    """
+    product_id = product['id']
+    
+    # Get daily sales
+    daily_sales, n_rows = load_daily_sales(conn, product_id)
+    
+    if n_rows < 10:
+        return None
+    
+    # Forecast
+    forecast = cached_forecast_demand(conn, product_id, daily_sales, periods, strategy)
+    
+    if forecast[0] is None:
+        raise RuntimeError("Forecasting failed")
+    
+    return product_forecast_result(product, daily_sales, forecast,
+                                   get_product_demand_metrics(product_id, conn), periods)
+
+def product_forecast_result(product, daily_sales, forecast, demand, periods):
+    """Shape a forecast and the product's inventory metrics for the API"""
+    forecast_values, intervals, model, search = forecast
+    order = model.get("order")
+    
+    # Calculate statistics
+    avg_daily_demand, demand_std = demand
+    annual_demand = avg_daily_demand * 365
+    
+    # Calculate inventory metrics
+    holding_cost = product['unit_cost'] * product['holding_cost_percentage']
+    
+    eoq = calculate_eoq(annual_demand, product['ordering_cost'], holding_cost)
+    safety_stock = calculate_safety_stock(demand_std, product['lead_time_days'])
+    rop = calculate_rop(avg_daily_demand, product['lead_time_days'], safety_stock)
+    
+    # Prepare forecast dates
+    last_date = daily_sales.index[-1]
+    forecast_dates = [(last_date + timedelta(days=i+1)).strftime('%Y-%m-%d') 
+                     for i in range(periods)]
+    
+    return {
+        "product": product,
+        "forecast": {
+            "dates": forecast_dates,
+            "values": forecast_values,
+            "confidence_intervals": intervals["95"],
+            "confidence_intervals_80": intervals["80"],
+            "model": model["name"],
+            "demand_class": model.get("demand_class"),
+            "model_params": model.get("params"),
+            "arima_params": {"p": order[0], "d": order[1], "q": order[2]} if order else None,
+            "model_search": search
+        },
+        "metrics": {
+            "avg_daily_demand": round(avg_daily_demand, 2),
+            "demand_std": round(demand_std, 2),
+            "annual_demand": round(annual_demand, 2),
+            "eoq": eoq,
+            "safety_stock": safety_stock,
+            "reorder_point": rop,
+            "current_stock": product['current_stock'],
+            "stock_status": "ต้องสั่งซื้อ" if product['current_stock'] <= rop else "ปกติ"
+        }
+    }
+
+# Multi-product forecasting
+# Forecasting many products at once loads all their daily series with one
+# query into a dense day x product matrix, answers what it can from the
+# forecast cache and fits the rest on a process pool, one product per task
+# with the ARIMA search running serially inside the worker. It has its own
+# pool so a large batch does not queue in front of single forecasts, whose
+# candidate fits use the ARIMA pool. FORECAST_BATCH_WORKERS=1 fits in the
+# calling thread instead.
+FORECAST_BATCH_WORKERS = int(os.environ.get("FORECAST_BATCH_WORKERS", os.cpu_count() or 1))
+FORECAST_BATCH_MAX_PRODUCTS = int(os.environ.get("FORECAST_BATCH_MAX_PRODUCTS", "1000"))
+
+_forecast_batch_pool = None
+
+def get_forecast_batch_pool():
+    """Return the shared multi-product forecast pool (None when fitting in-process)"""
+    global _forecast_batch_pool
+    if FORECAST_BATCH_WORKERS <= 1:
+        return None
+    if _forecast_batch_pool is None:
+        _forecast_batch_pool = ProcessPoolExecutor(max_workers=FORECAST_BATCH_WORKERS)
+    return _forecast_batch_pool
+
+def shutdown_forecast_batch_pool():
+    global _forecast_batch_pool
+    if _forecast_batch_pool is not None:
+        _forecast_batch_pool.shutdown(wait=False, cancel_futures=True)
+        _forecast_batch_pool = None
+
+def load_daily_sales_matrix(conn, product_ids):
+    """Daily sales series of several products from one daily_sales query
+    
+    Returns {product_id: (series, n_rows)} with the same series and counts
+    load_daily_sales gives for each product; products without sales are left
+    out.
+    """
+    df = pd.read_sql_query("""
+        SELECT product_id, day, qty, n_rows FROM daily_sales
+        WHERE product_id IN (SELECT value FROM json_each(?))
+    """, conn, params=(json.dumps(list(product_ids)),))
+    if df.empty:
+        return {}
+    
+    days = df['day'].values.astype('datetime64[D]')
+    start = days.min()
+    day_index = (days - start).astype(np.int64)
+    columns, column_index = np.unique(df['product_id'].values, return_inverse=True)
+    
+    matrix = np.zeros((day_index.max() + 1, len(columns)), dtype=np.int64)
+    matrix[day_index, column_index] = df['qty'].values
+    first_day = np.full(len(columns), len(matrix))
+    last_day = np.zeros(len(columns), dtype=np.int64)
+    np.minimum.at(first_day, column_index, day_index)
+    np.maximum.at(last_day, column_index, day_index)
+    n_rows = np.bincount(column_index, weights=df['n_rows'].values).astype(np.int64)
+    
+    dates = pd.date_range(start, periods=len(matrix), freq='D', name='day')
+    return {int(product_id): (pd.Series(matrix[first:last + 1, j], index=dates[first:last + 1], name='qty'),
+                              int(n_rows[j]))
+            for j, (product_id, first, last) in enumerate(zip(columns, first_day, last_day))}
+
+def _forecast_series_task(values, start, periods, previous_model, strategy):
+    """Fit and forecast one product's daily series in a pool worker"""
+    daily_sales = pd.Series(values, index=pd.date_range(start, periods=len(values), freq='D'))
+    return fit_and_forecast(daily_sales, periods, previous_model, parallel=False, strategy=strategy)
+
+def forecast_products(conn, products, periods=30, strategy=None):
+    """Forecast several products, yielding (product, result, error) as each finishes
+    
+    result is shaped like build_product_forecast's and is None when the
+    product has too little history; error is set when the fit failed.
+    Cached forecasts and products without enough history come first.
+    """
+    product_ids = [product['id'] for product in products]
+    series = load_daily_sales_matrix(conn, product_ids)
+    demand = get_all_demand_metrics(conn, product_ids)
+    pool = get_forecast_batch_pool()
+    
+    def result(product, daily_sales, forecast):
+        product_demand = (0.0, 0.0)
+        if product['id'] in demand.index:
+            metrics = demand.loc[product['id']]
+            product_demand = (float(metrics['avg_daily_demand']), float(metrics['demand_std']))
+        return product_forecast_result(product, daily_sales, forecast, product_demand, periods)
+    
+    def fitted(product, daily_sales, series_hash, forecast):
+        return result(product, daily_sales, save_forecast(conn, product['id'], daily_sales, series_hash,
+                                                          periods, *forecast))
+    
+    ready, to_fit, futures = [], [], {}
+    for product in products:
+        daily_sales, n_rows = series.get(product['id'], (None, 0))
+        if n_rows < 10:
+            ready.append((product, None))
+            continue
+        series_hash = series_fingerprint(daily_sales)
+        cached = get_cached_forecast(conn, product['id'], series_hash, periods)
+        if cached:
+            ready.append((product, result(product, daily_sales, (*cached, CACHED_SEARCH))))
+            continue
+        job = (product, daily_sales, series_hash, load_model_state(conn, product['id']))
+        # Fast-path models take microseconds, not worth a trip to the pool
+        if pool is None or select_forecaster(daily_sales.values.astype(np.float64))[0] != "arima":
+            to_fit.append(job)
+        else:
+            futures[pool.submit(_forecast_series_task, daily_sales.values, daily_sales.index[0],
+                                periods, job[3], strategy)] = job
+    
+    try:
+        for product, forecast in ready:
+            yield product, forecast, None
+        
+        for product, daily_sales, series_hash, previous_model in to_fit:
+            try:
+                forecast = fit_and_forecast(daily_sales, periods, previous_model, strategy=strategy)
+            except Exception as e:
+                yield product, None, str(e)
+                continue
+            yield product, fitted(product, daily_sales, series_hash, forecast), None
+        
+        for future in as_completed(futures):
+            product, daily_sales, series_hash, previous_model = futures[future]
+            try:
+                try:
+                    forecast = future.result()
+                except BrokenProcessPool:
+                    shutdown_forecast_batch_pool()
+                    forecast = fit_and_forecast(daily_sales, periods, previous_model, strategy=strategy)
+            except Exception as e:
+                yield product, None, str(e)
+                continue
+            yield product, fitted(product, daily_sales, series_hash, forecast), None
+    finally:
+        # Stop queued fits when the caller gives up early
+        for future in futures:
+            future.cancel()
+
+# Batch forecasting
+# Every product is re-forecast once a night at BATCH_FORECAST_HOUR and,
+# after sales are ingested, the touched products are re-forecast once writes
+# have been quiet for BATCH_FORECAST_DEBOUNCE_SECONDS. Results go to the
+# forecasts table and are served by /api/forecasts without fitting anything.
+BATCH_FORECAST_ENABLED = os.environ.get("BATCH_FORECAST_ENABLED", "1") == "1"
+BATCH_FORECAST_HOUR = int(os.environ.get("BATCH_FORECAST_HOUR", "2"))
+BATCH_FORECAST_PERIODS = int(os.environ.get("BATCH_FORECAST_PERIODS", "30"))
+BATCH_FORECAST_DEBOUNCE_SECONDS = float(os.environ.get("BATCH_FORECAST_DEBOUNCE_SECONDS", "30"))
+
+batch_forecast_state = {
+    "running": False,
+    "pending_products": 0,
+    "last_started_at": None,
+    "last_finished_at": None,
+    "last_products": 0,
+    "last_failed": 0,
+    "last_error": None,
+}
+# Pending requests come from worker threads; guarded by _batch_forecast_lock
+_batch_forecast_lock = threading.Lock()
+_batch_forecast_pending = set()
+_batch_forecast_all = False
+_batch_forecast_wakeup = None
+_batch_forecast_loop = None
+_batch_forecast_task = None
+
+def store_forecast_result(conn, product_id, periods, result, status, error=None):
+    """Write one product's batch forecast into the forecasts table"""
+    forecast = result["forecast"] if result else None
+    metrics = result["metrics"] if result else {}
+    params = (forecast["arima_params"] or {}) if forecast else {}
+    
+    conn.execute("""
+        INSERT OR REPLACE INTO forecasts
+            (product_id, periods, status, error, forecast_dates, forecast_values,
+             confidence_intervals, confidence_intervals_80, model, arima_p, arima_d,
+             arima_q, avg_daily_demand, demand_std, annual_demand, eoq, safety_stock,
+             reorder_point, computed_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
+    """, (product_id, periods, status, error,
+          json.dumps(forecast["dates"]) if forecast else None,
+          json.dumps(forecast["values"]) if forecast else None,
+          json.dumps(forecast["confidence_intervals"]) if forecast else None,
+          json.dumps(forecast["confidence_intervals_80"]) if forecast else None,
+          forecast["model"] if forecast else None,
+          params.get("p"), params.get("d"), params.get("q"),
+          metrics.get("avg_daily_demand"), metrics.get("demand_std"),
+          metrics.get("annual_demand"),
+          float(metrics["eoq"]) if metrics else None,
+          float(metrics["safety_stock"]) if metrics else None,
+          float(metrics["reorder_point"]) if metrics else None))
+
+def stored_forecast_to_dict(row):
+    """Shape a forecasts row like the /api/forecast response"""
+    row = dict(row)
+    forecast = None
+    if row["status"] == "ok":
+        forecast = {
+            "dates": json.loads(row["forecast_dates"]),
+            "values": json.loads(row["forecast_values"]),
+            "confidence_intervals": json.loads(row["confidence_intervals"]),
+            # Rows stored before the 80% intervals have none
+            "confidence_intervals_80": json.loads(row["confidence_intervals_80"] or "null"),
+            # Rows stored before the fast-path models have no model
+            "model": row["model"] or "arima",
+            "arima_params": ({"p": row["arima_p"], "d": row["arima_d"], "q": row["arima_q"]}
+                             if row["arima_p"] is not None else None),
+        }
+    return {
+        "product_id": row["product_id"],
+        "periods": row["periods"],
+        "status": row["status"],
+        "error": row["error"],
+        "computed_at": row["computed_at"],
+        "forecast": forecast,
+        "metrics": {
+            "avg_daily_demand": row["avg_daily_demand"],
+            "demand_std": row["demand_std"],
+            "annual_demand": row["annual_demand"],
+            "eoq": row["eoq"],
+            "safety_stock": row["safety_stock"],
+            "reorder_point": row["reorder_point"],
+        }
+    }
+
+def run_batch_forecast(product_ids=None, periods=BATCH_FORECAST_PERIODS):
+    """Re-forecast the given products (or the whole catalog) into the forecasts table"""
+    conn = db_pool.acquire()
+    cursor = conn.cursor()
+    
+    if product_ids is not None:
+        cursor.execute("SELECT * FROM products WHERE id IN (SELECT value FROM json_each(?))",
+                       (json.dumps([int(pid) for pid in product_ids]),))
+    else:
+        cursor.execute("SELECT * FROM products")
+    products = [dict(row) for row in cursor.fetchall()]
+    
+    batch_forecast_state["running"] = True
+    batch_forecast_state["last_started_at"] = datetime.now().isoformat(timespec='seconds')
+    failed = 0
+    try:
+        for product, result, error in forecast_products(conn, products, periods):
+            if error:
+                failed += 1
+                store_forecast_result(conn, product['id'], periods, None, "failed", error)
+            else:
+                status = "ok" if result else "insufficient_data"
+                store_forecast_result(conn, product['id'], periods, result, status)
+            conn.commit()
+        batch_forecast_state["last_error"] = None
+    finally:
+        db_pool.release(conn)
+        batch_forecast_state["running"] = False
+        batch_forecast_state["last_finished_at"] = datetime.now().isoformat(timespec='seconds')
+        batch_forecast_state["last_products"] = len(products)
+        batch_forecast_state["last_failed"] = failed
+    
+    return len(products), failed
+
+def request_batch_forecast(product_ids=None):
+    """Ask the scheduler to re-forecast some products (None means all of them)"""
+    global _batch_forecast_all
+    if product_ids is not None and not product_ids:
+        return
+    with _batch_forecast_lock:
+        if product_ids is None:
+            _batch_forecast_all = True
+        else:
+            _batch_forecast_pending.update(product_ids)
+        batch_forecast_state["pending_products"] = len(_batch_forecast_pending)
+    # Called from endpoint worker threads, so hand the wakeup to the loop
+    if _batch_forecast_loop is not None:
+        _batch_forecast_loop.call_soon_threadsafe(_batch_forecast_wakeup.set)
+
+def _seconds_until_nightly_run():
+    now = datetime.now()
+    next_run = now.replace(hour=BATCH_FORECAST_HOUR, minute=0, second=0, microsecond=0)
+    if next_run <= now:
+        next_run += timedelta(days=1)
+    return (next_run - now).total_seconds()
+
+async def batch_forecast_scheduler():
+    """Run the nightly catalog forecast and debounced post-ingestion refreshes"""
+    global _batch_forecast_all
+    loop = asyncio.get_running_loop()
+    while True:
+        try:
+            await asyncio.wait_for(_batch_forecast_wakeup.wait(),
+                                   timeout=_seconds_until_nightly_run())
+            # Let a burst of uploads settle before forecasting
+            while True:
+                _batch_forecast_wakeup.clear()
+                try:
+                    await asyncio.wait_for(_batch_forecast_wakeup.wait(),
+                                           timeout=BATCH_FORECAST_DEBOUNCE_SECONDS)
+                except asyncio.TimeoutError:
+                    break
+        except asyncio.TimeoutError:
+            with _batch_forecast_lock:
+                _batch_forecast_all = True
+        
+        _batch_forecast_wakeup.clear()
+        with _batch_forecast_lock:
+            product_ids = None if _batch_forecast_all else set(_batch_forecast_pending)
+            _batch_forecast_all = False
+            _batch_forecast_pending.clear()
+            batch_forecast_state["pending_products"] = 0
+        
+        try:
+            await loop.run_in_executor(None, run_batch_forecast, product_ids)
+        except Exception as e:
+            # A failed run must not stop the scheduler; the next wakeup retries
+            logger.exception("Batch forecast failed")
+            batch_forecast_state["last_error"] = str(e)
+
+def start_batch_forecast_scheduler():
+    global _batch_forecast_wakeup, _batch_forecast_loop, _batch_forecast_task
+    _batch_forecast_wakeup = asyncio.Event()
+    _batch_forecast_loop = asyncio.get_running_loop()
+    _batch_forecast_task = asyncio.create_task(batch_forecast_scheduler())
+
+async def stop_batch_forecast_scheduler():
+    if _batch_forecast_task is not None:
+        _batch_forecast_task.cancel()
+        try:
+            await _batch_forecast_task
+        except asyncio.CancelledError:
+            pass
+
+# Backtesting
+# Rolling-origin evaluation: each product's history is cut at up to
+# `origins` points, `step` days apart and ending where `horizon` days (or
+# the product's lead time, if longer) of history remain. The model is fitted
+# to the days before each cut with fit_and_forecast, exactly as a forecast
+# request would, warm-starting from the previous cut like refits do, and
+# scored on the days after it:
+#   mape, smape    - percentage errors (mape skips days without sales)
+#   mase           - MAE over the in-sample MAE of the naive one-day forecast
+#   bias           - mean of forecast minus actual, units per day
+#   rop_hit        - whether the reorder point computed from the history up
+#                    to the cut covered the actual lead-time demand; its
+#                    mean is the service level achieved
+# Products are evaluated on their own process pool, one product per task
+# (BACKTEST_WORKERS=1 runs them in the runner thread). Each finished product
+# is committed with a row in backtest_checkpoints, so a run interrupted by a
+# restart picks up where it stopped; the server resumes its own runs at
+# startup and backtest.py --resume the others.
+BACKTEST_WORKERS = int(os.environ.get("BACKTEST_WORKERS", os.cpu_count() or 1))
+
+_backtest_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="backtest")
+_backtest_stop = threading.Event()
+_backtest_pool = None
+
+def get_backtest_pool():
+    """Return the backtest process pool (None when evaluating in-process)"""
+    global _backtest_pool
+    if BACKTEST_WORKERS <= 1:
+        return None
+    if _backtest_pool is None:
+        _backtest_pool = ProcessPoolExecutor(max_workers=BACKTEST_WORKERS)
+    return _backtest_pool
+
+def shutdown_backtest_pool():
+    global _backtest_pool
+    if _backtest_pool is not None:
+        _backtest_pool.shutdown(wait=False, cancel_futures=True)
+        _backtest_pool = None
+
+def forecast_accuracy(actual, forecast, train):
+    """MAE, MAPE, sMAPE, MASE and bias of a forecast against what happened"""
+    error = forecast - actual
+    abs_error = np.abs(error)
+    sold = actual != 0
+    total = np.abs(actual) + np.abs(forecast)
+    # Days where both are 0 count as perfect
+    smape = np.divide(2 * abs_error, total, out=np.zeros_like(total), where=total > 0)
+    naive_mae = np.mean(np.abs(np.diff(train))) if len(train) > 1 else 0.0
+    return {
+        "mae": float(abs_error.mean()),
+        "mape": float(np.mean(abs_error[sold] / np.abs(actual[sold])) * 100) if sold.any() else None,
+        "smape": float(smape.mean() * 100),
+        "mase": float(abs_error.mean() / naive_mae) if naive_mae > 0 else None,
+        "bias": float(error.mean()),
+    }
+
+def backtest_series(values, start, lead_time_days, horizon, origins, step, min_train_days,
+                    strategy=None, model=None):
+    """Rolling-origin evaluation of one daily series; returns a list of folds"""
+    y = np.asarray(values, dtype=np.float64)
+    dates = pd.date_range(start, periods=len(y), freq='D')
+    last = len(y) - max(horizon, lead_time_days)
+    cuts = sorted(cut for cut in (last - k * step for k in range(origins)) if cut >= min_train_days)
+    
+    folds = []
+    previous_model = None
+    for cut in cuts:
+        train = pd.Series(y[:cut], index=dates[:cut])
+        fold = {"origin_date": dates[cut].strftime('%Y-%m-%d')}
+        started = time.perf_counter()
+        try:
+            forecast_values, _, model_state = fit_and_forecast(
+                train, horizon, previous_model, parallel=False, strategy=strategy, model=model)
+        except Exception as e:
+            folds.append({**fold, "error": str(e)})
+            continue
+        if model_state["model"] == "arima":
+            previous_model = model_state
+        
+        # The reorder point as the API would have computed it at the cut
+        safety_stock = calculate_safety_stock(train.std() if cut > 1 else 0.0, lead_time_days)
+        rop = calculate_rop(train.mean(), lead_time_days, safety_stock)
+        lead_time_demand = float(y[cut:cut + lead_time_days].sum())
+        folds.append({
+            **fold,
+            "model": model_state["model"],
+            "strategy": model_state["search"]["strategy"],
+            "fits": model_state["search"]["fits"],
+            "seconds": round(time.perf_counter() - started, 3),
+            **forecast_accuracy(y[cut:cut + horizon], np.asarray(forecast_values), y[:cut]),
+            "reorder_point": float(rop),
+            "lead_time_demand": lead_time_demand,
+            "rop_hit": int(lead_time_demand <= rop),
+        })
+    return folds
+
+def _backtest_series_task(values, start, lead_time_days, settings):
+    """Backtest one product's series in a pool worker; returns (folds, seconds)"""
+    started = time.perf_counter()
+    return backtest_series(values, start, lead_time_days, **settings), time.perf_counter() - started
+
+BACKTEST_SETTINGS = ("horizon", "origins", "step", "min_train_days", "strategy", "model")
+
+def create_backtest_run(conn, product_ids, request, runner="api"):
+    """Insert a queued backtest run over product_ids and return its id"""
+    run_id = uuid.uuid4().hex
+    conn.execute("""
+        INSERT INTO backtest_runs
+            (id, status, runner, product_ids, horizon, origins, step, min_train_days, strategy, model)
+        VALUES (?, 'queued', ?, ?, ?, ?, ?, ?, ?, ?)
+    """, (run_id, runner, json.dumps(list(product_ids)), request.horizon, request.origins,
+          request.step or request.horizon, request.min_train_days, request.strategy, request.model))
+    conn.commit()
+    return run_id
+
+def save_backtest_product(conn, run_id, product_id, status, folds=(), error=None, seconds=None):
+    """Write one product's folds and its checkpoint; the caller commits"""
+    columns = ("model", "strategy", "fits", "seconds", "mae", "mape", "smape", "mase", "bias",
+               "reorder_point", "lead_time_demand", "rop_hit", "error")
+    conn.executemany(f"""
+        INSERT OR REPLACE INTO backtest_results
+            (run_id, product_id, origin_date, {', '.join(columns)})
+        VALUES (?, ?, ?, {', '.join('?' * len(columns))})
+    """, [(run_id, product_id, fold["origin_date"], *(fold.get(column) for column in columns))
+          for fold in folds])
+    conn.execute("""
+        INSERT OR REPLACE INTO backtest_checkpoints (run_id, product_id, status, folds, error, seconds)
+        VALUES (?, ?, ?, ?, ?, ?)
+    """, (run_id, product_id, status, len(folds), error,
+          round(seconds, 3) if seconds is not None else None))
+
+def run_backtest(run_id):
+    """Evaluate the products of a run that have no checkpoint yet
+    
+    Returns the run's final status, or None when it was stopped by a
+    shutdown and is left to be resumed.
+    """
+    with db_pool.connection() as conn:
+        run = conn.execute("SELECT * FROM backtest_runs WHERE id = ?", (run_id,)).fetchone()
+        if run is None:
+            return None
+        conn.execute("""
+            UPDATE backtest_runs SET status = 'running', error = NULL,
+                                     started_at = COALESCE(started_at, CURRENT_TIMESTAMP)
+            WHERE id = ?
+        """, (run_id,))
+        conn.commit()
+        
+        done = {product_id for (product_id,) in conn.execute(
+            "SELECT product_id FROM backtest_checkpoints WHERE run_id = ?", (run_id,))}
+        product_ids = [pid for pid in json.loads(run['product_ids']) if pid not in done]
+        settings = {name: run[name] for name in BACKTEST_SETTINGS}
+        
+        try:
+            stopped = False
+            for product_id, status, folds, error, seconds in backtest_products(conn, product_ids, settings):
+                if _backtest_stop.is_set():
+                    stopped = True
+                    break
+                save_backtest_product(conn, run_id, product_id, status, folds, error, seconds)
+                conn.commit()
+            if stopped:
+                return None
+            status, error = "completed", None
+        except Exception as e:
+            conn.rollback()
+            status, error = "failed", str(e)
+        conn.execute("""
+            UPDATE backtest_runs SET status = ?, error = ?, finished_at = CURRENT_TIMESTAMP
+            WHERE id = ?
+        """, (status, error, run_id))
+        conn.commit()
+        return status
+
+def backtest_products(conn, product_ids, settings):
+    """Backtest products, yielding (product_id, status, folds, error, seconds) as each finishes"""
+    lead_times = dict(conn.execute("""
+        SELECT id, lead_time_days FROM products
+        WHERE id IN (SELECT value FROM json_each(?))
+    """, (json.dumps(product_ids),)).fetchall())
+    series = load_daily_sales_matrix(conn, product_ids)
+    pool = get_backtest_pool()
+    
+    ready, to_run, futures = [], [], {}
+    for product_id in product_ids:
+        if product_id not in lead_times:
+            ready.append((product_id, "not_found"))
+            continue
+        daily_sales, n_rows = series.get(product_id, (None, 0))
+        if n_rows < 10:
+            ready.append((product_id, "insufficient_data"))
+            continue
+        args = (daily_sales.values, daily_sales.index[0], lead_times[product_id], settings)
+        if pool is None:
+            to_run.append((product_id, args))
+        else:
+            futures[pool.submit(_backtest_series_task, *args)] = (product_id, args)
+    
+    def outcome(product_id, folds, seconds):
+        status = "ok" if folds else "insufficient_data"
+        return product_id, status, folds, None, seconds
+    
+    try:
+        for product_id, status in ready:
+            yield product_id, status, [], None, None
+        
+        for product_id, args in to_run:
+            try:
+                folds, seconds = _backtest_series_task(*args)
+            except Exception as e:
+                yield product_id, "failed", [], str(e), None
+                continue
+            yield outcome(product_id, folds, seconds)
+        
+        for future in as_completed(futures):
+            product_id, args = futures[future]
+            try:
+                try:
+                    folds, seconds = future.result()
+                except BrokenProcessPool:
+                    shutdown_backtest_pool()
+                    folds, seconds = _backtest_series_task(*args)
+            except Exception as e:
+                yield product_id, "failed", [], str(e), None
+                continue
+            yield outcome(product_id, folds, seconds)
+    finally:
+        for future in futures:
+            future.cancel()
+
+def submit_backtest(run_id):
+    return _backtest_executor.submit(run_backtest, run_id)
+
+def resume_backtests(conn):
+    """Queue the server's runs that a restart interrupted"""
+    for (run_id,) in conn.execute("""
+        SELECT id FROM backtest_runs
+        WHERE status IN ('queued', 'running') AND runner = 'api'
+        ORDER BY created_at
+    """).fetchall():
+        submit_backtest(run_id)
+
+def stop_backtests():
+    """Stop the running backtest after its current product; it resumes at the next startup"""
+    _backtest_stop.set()
+    _backtest_executor.shutdown(wait=False, cancel_futures=True)
+    shutdown_backtest_pool()
+
+def backtest_summaries(conn, run_id, group_by=None):
+    """Mean accuracy of a run's folds, or {value: summary} per group_by column"""
+    rows = conn.execute(f"""
+        SELECT {group_by or 'NULL'} AS key, COUNT(*) AS folds,
+               AVG(mae) AS mae, AVG(mape) AS mape, AVG(smape) AS smape,
+               AVG(mase) AS mase, AVG(bias) AS bias, AVG(rop_hit) AS rop_hit_rate,
+               SUM(fits) AS fits, SUM(seconds) AS seconds
+        FROM backtest_results
+        WHERE run_id = ? AND error IS NULL
+        {f'GROUP BY {group_by}' if group_by else ''}
+    """, (run_id,)).fetchall()
+    summaries = {}
+    for row in rows:
+        summary = dict(row)
+        for name in ("mae", "mape", "smape", "mase", "bias", "rop_hit_rate", "seconds"):
+            if summary[name] is not None:
+                summary[name] = round(summary[name], 4)
+        summaries[summary.pop("key")] = summary
+    return summaries if group_by else summaries[None]
+
+def backtest_run_to_dict(conn, run):
+    """A backtest run with its progress and accuracy over all products"""
+    run = dict(run)
+    run["products_total"] = len(json.loads(run.pop("product_ids")))
+    run["products"] = dict(conn.execute("""
+        SELECT status, COUNT(*) FROM backtest_checkpoints
+        WHERE run_id = ? GROUP BY status
+    """, (run["id"],)).fetchall())
+    run["products_done"] = sum(run["products"].values())
+    run["summary"] = backtest_summaries(conn, run["id"])
+    return run
+
+# Sales ingestion
+# Uploaded sales are validated and written column-wise: product codes are
+# resolved through one dict, rows go in with executemany and stock is
+# deducted with one UPDATE per product.
+# Quantities must be 0..MAX_SALE_QUANTITY, so per-product sums stay within int64
+MAX_SALE_QUANTITY = np.iinfo(np.int32).max
+
+@contextmanager
+def bulk_daily_rollup(conn):
+    """Add sales_history rows inserted in the block to daily_sales in one go
+    
+    The per-row insert trigger is held off while the block runs; its rows
+    are then aggregated per product and day with one grouped upsert. Rows
+    changed by an upsert still go through the update trigger.
+    """
+    first_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM sales_history").fetchone()[0]
+    conn.execute("INSERT INTO sales_rollup_deferred DEFAULT VALUES")
+    try:
+        yield
+    finally:
+        conn.execute("DELETE FROM sales_rollup_deferred")
+    conn.execute("""
+        INSERT INTO daily_sales (product_id, day, qty, n_rows)
+        SELECT product_id, date(sale_date), SUM(quantity), COUNT(*)
+        FROM sales_history
+        WHERE id > ? AND date(sale_date) IS NOT NULL
+        GROUP BY product_id, date(sale_date)
+        ON CONFLICT (product_id, day) DO UPDATE
+        SET qty = qty + excluded.qty, n_rows = n_rows + excluded.n_rows
+    """, (first_id,))
+
+def load_product_codes(conn):
+    """Map product code -> id for the whole catalog"""
+    return {code: product_id for code, product_id in
+            conn.execute("SELECT code, id FROM products")}
+
+def ingest_sales_frame(conn, df, product_codes, note='Auto-imported from CSV'):
+    """Insert a frame of product_code/date/quantity sales rows
+    
+    Each valid row becomes a sales_history row and an 'out' transaction, and
+    stock is deducted per product. Nothing is committed here. Returns counts
+    of inserted and rejected rows and the ids of the products touched.
+    """
+    codes = df['product_code'].astype(str).str.strip()
+    product_ids = codes.map(product_codes)
+    # ISO8601 accepts dates with or without a time in the same column
+    dates = pd.to_datetime(df['date'], errors='coerce', format='ISO8601')
+    quantities = pd.to_numeric(df['quantity'], errors='coerce')
+    
+    unknown_product = product_ids.isna()
+    invalid_date = ~unknown_product & dates.isna()
+    invalid_quantity = ~unknown_product & ~invalid_date & ~(
+        np.isfinite(quantities) & (quantities >= 0) & (quantities <= MAX_SALE_QUANTITY))
+    valid = ~(unknown_product | invalid_date | invalid_quantity)
+    
+    rows = pd.DataFrame({
+        "product_id": product_ids[valid].astype(np.int64),
+        "sale_date": dates[valid].dt.strftime('%Y-%m-%d'),
+        "quantity": quantities[valid].astype(np.int64),
+    })
+    # Inserting in index order keeps the B-tree writes mostly sequential
+    rows = rows.sort_values(['product_id', 'sale_date'], kind='stable')
+    records = list(zip(rows['product_id'].tolist(), rows['sale_date'].tolist(),
+                       rows['quantity'].tolist()))
+    
+    cursor = conn.cursor()
+    # 1. Insert into sales_history (for forecasting)
+    with bulk_daily_rollup(conn):
+        cursor.executemany("""
+            INSERT INTO sales_history (product_id, sale_date, quantity)
+            VALUES (?, ?, ?)
+        """, records)
+    
+    # 2. Insert into transactions (for stock tracking history)
+    cursor.executemany("""
+        INSERT INTO transactions (product_id, transaction_type, quantity, note)
+        VALUES (?, 'out', ?, ?)
+    """, [(product_id, quantity, note) for product_id, _, quantity in records])
+    
+    # 3. Update current stock (Deduct stock), once per product
+    deductions = rows.groupby('product_id')['quantity'].sum()
+    cursor.executemany("""
+        UPDATE products 
+        SET current_stock = current_stock - ? 
+        WHERE id = ?
+    """, [(int(qty), int(product_id)) for product_id, qty in deductions.items()])
+    
+    return {
+        "inserted": len(records),
+        "rejected": int((~valid).sum()),
+        "rejected_reasons": {
+            "unknown_product": int(unknown_product.sum()),
+            "invalid_date": int(invalid_date.sum()),
+            "invalid_quantity": int(invalid_quantity.sum()),
+        },
+        "product_ids": {int(product_id) for product_id in deductions.index},
+        "stock_deltas": {int(product_id): -int(qty) for product_id, qty in deductions.items()},
+    }
+
+def insert_bulk_sales(conn, sales, upsert=False):
+    """Validate and insert SalesData rows in one executemany; nothing is committed
+    
+    Rows for unknown products, with unparseable dates or with a quantity
+    that is negative or over MAX_SALE_QUANTITY are rejected with a per-row
+    error. With upsert=True a row replaces the quantity previously
+    upserted for the same (product_id, sale_date), so client retries do not
+    double-count, and only the last of any duplicates in the request is kept.
+    """
+    product_ids = pd.Series([sale.product_id for sale in sales], dtype='int64')
+    dates = pd.to_datetime(pd.Series([sale.sale_date for sale in sales], dtype='object'),
+                           errors='coerce', format='ISO8601')
+    quantities = [sale.quantity for sale in sales]
+    # object dtype, so quantities past int64 compare instead of overflowing
+    quantity_values = pd.Series(quantities, dtype='object')
+    
+    known_ids = {row[0] for row in conn.execute("SELECT id FROM products")}
+    unknown_product = ~product_ids.isin(known_ids)
+    invalid_date = ~unknown_product & dates.isna()
+    invalid_quantity = ~unknown_product & ~invalid_date & ~(
+        (quantity_values >= 0) & (quantity_values <= MAX_SALE_QUANTITY)).astype(bool)
+    valid = ~(unknown_product | invalid_date | invalid_quantity)
+    sale_dates = pd.Series(dates.values.astype('datetime64[D]').astype(str), index=dates.index)
+    
+    duplicate = pd.Series(False, index=product_ids.index)
+    if upsert:
+        keys = pd.DataFrame({"product_id": product_ids, "sale_date": sale_dates})
+        duplicate = valid & keys[valid].duplicated(keep='last').reindex(keys.index, fill_value=False)
+        valid &= ~duplicate
+    
+    id_list = product_ids.tolist()
+    date_list = sale_dates.tolist()
+    
+    errors = []
+    for reason, mask, message in (
+            ("unknown_product", unknown_product, "Product not found"),
+            ("invalid_date", invalid_date, "Invalid sale_date"),
+            ("invalid_quantity", invalid_quantity,
+             f"Invalid quantity; must be between 0 and {MAX_SALE_QUANTITY}"),
+            ("duplicate_in_request", duplicate,
+             "Duplicate (product_id, sale_date) in request; a later row was kept")):
+        for index in np.flatnonzero(mask.values).tolist():
+            errors.append({"index": index, "product_id": id_list[index],
+                           "sale_date": sales[index].sale_date, "reason": reason,
+                           "error": message})
+    errors.sort(key=lambda error: error["index"])
+    
+    # Index order keeps the B-tree writes mostly sequential, as in ingest_sales_frame
+    records = sorted((id_list[i], date_list[i], quantities[i])
+                     for i in np.flatnonzero(valid.values).tolist())
+    with bulk_daily_rollup(conn):
+        if upsert:
+            conn.executemany("""
+                INSERT INTO sales_history (product_id, sale_date, quantity, upserted)
+                VALUES (?, ?, ?, 1)
+                ON CONFLICT (product_id, sale_date) WHERE upserted = 1
+                DO UPDATE SET quantity = excluded.quantity
+            """, records)
+        else:
+            conn.executemany("""
+                INSERT INTO sales_history (product_id, sale_date, quantity)
+                VALUES (?, ?, ?)
+            """, records)
+    
+    return {
+        "inserted": len(records),
+        "rejected": len(errors),
+        "rejected_reasons": {
+            "unknown_product": int(unknown_product.sum()),
+            "invalid_date": int(invalid_date.sum()),
+            "invalid_quantity": int(invalid_quantity.sum()),
+            "duplicate_in_request": int(duplicate.sum()),
+        },
+        "errors": errors,
+        "product_ids": {record[0] for record in records},
+    }
+
+SALES_COLUMNS = ['product_code', 'date', 'quantity']
+
+def validate_sales_columns(columns):
+    if not all(col in columns for col in SALES_COLUMNS):
+        raise HTTPException(status_code=400, 
+                          detail=f"File must contain columns: {SALES_COLUMNS}")
+
+# Columnar uploads
+# Parquet and Arrow IPC files skip text parsing entirely: only the three
+# sales columns are read, record batches are sliced without copying, and
+# numeric columns convert to pandas without a copy when they have no nulls.
+# Both need pyarrow.
+ARROW_EXTENSIONS = ('.arrow', '.arrows', '.feather', '.ipc')
+
+def sales_file_format(filename, head):
+    """'csv', 'parquet', 'arrow' (IPC file) or 'arrow_stream', from magic bytes or extension"""
+    if head[:4] == b'PAR1':
+        return 'parquet'
+    if head[:6] == b'ARROW1':
+        return 'arrow'
+    extension = os.path.splitext(filename or '')[1].lower()
+    if extension in ('.parquet', '.pq'):
+        return 'parquet'
+    if extension in ARROW_EXTENSIONS:
+        return 'arrow_stream'
+    return 'csv'
+
+def require_pyarrow():
+    if pa is None:
+        raise HTTPException(status_code=400, detail="Parquet and Arrow files require pyarrow")
+
+def open_columnar_sales(source, fmt):
+    """Open a Parquet or Arrow IPC pyarrow file
+    
+    Returns the row count, or None when it is only known at the end of an
+    Arrow stream, and an iterator of record batches of the sales columns.
+    """
+    if fmt == 'parquet':
+        parquet = pq.ParquetFile(source)
+        validate_sales_columns(parquet.schema_arrow.names)
+        return (parquet.metadata.num_rows,
+                parquet.iter_batches(batch_size=UPLOAD_CHUNK_ROWS, columns=SALES_COLUMNS))
+    
+    if fmt == 'arrow':
+        reader = pa.ipc.open_file(source)
+        batches = [reader.get_batch(i) for i in range(reader.num_record_batches)]
+        num_rows = sum(batch.num_rows for batch in batches)
+    else:
+        reader = pa.ipc.open_stream(source)
+        batches, num_rows = reader, None
+    validate_sales_columns(reader.schema.names)
+    return num_rows, (batch.select(SALES_COLUMNS) for batch in batches)
+
+def columnar_sales_frames(batches):
+    """DataFrames of at most UPLOAD_CHUNK_ROWS rows from Arrow record batches"""
+    for batch in batches:
+        for offset in range(0, batch.num_rows, UPLOAD_CHUNK_ROWS):
+            yield batch.slice(offset, UPLOAD_CHUNK_ROWS).to_pandas(date_as_object=False)
+
+def read_sales_upload(contents, filename):
+    """Whole upload as one DataFrame of product_code/date/quantity rows"""
+    fmt = sales_file_format(filename, contents[:8])
+    if fmt == 'csv':
+        df = pd.read_csv(io.BytesIO(contents))
+        validate_sales_columns(df.columns)
+        return df
+    
+    require_pyarrow()
+    _, batches = open_columnar_sales(pa.BufferReader(contents), fmt)
+    frames = list(columnar_sales_frames(batches))
+    if not frames:
+        return pd.DataFrame(columns=SALES_COLUMNS)
+    return pd.concat(frames, ignore_index=True)
+
+def ingestion_summary(result, seconds):
+    """Response body for a finished sales import"""
+    inserted = result["inserted"]
+    return {
+        "message": f"Uploaded {inserted} sales records successfully",
+        "inserted": inserted,
+        "rejected": result["rejected"],
+        "rejected_reasons": result["rejected_reasons"],
+        "seconds": round(seconds, 3),
+        "rows_per_sec": round((inserted + result["rejected"]) / seconds, 1) if seconds > 0 else None,
+    }
+
+# Ingestion jobs
+# Large imports run as jobs on a dedicated worker thread. Each job has a row
+# in the jobs table with its status, rows processed, throughput and errors,
+# served by GET /api/jobs/{job_id}. When a job finishes, the forecast cache
+# is invalidated for the products it touched and they are re-forecast.
+INGESTION_WORKERS = int(os.environ.get("INGESTION_WORKERS", "1"))
+
+# Streamed uploads are copied to a temporary file in fixed-size blocks and
+# parsed UPLOAD_CHUNK_ROWS rows at a time, each chunk in its own transaction,
+# so memory use is bounded by the chunk size rather than the file size.
+UPLOAD_CHUNK_ROWS = int(os.environ.get("UPLOAD_CHUNK_ROWS", "50000"))
+UPLOAD_COPY_BUFFER_BYTES = 1024 * 1024
+
+_ingestion_executor = ThreadPoolExecutor(max_workers=INGESTION_WORKERS,
+                                         thread_name_prefix="ingestion")
+
+class JobProgress:
+    """Running totals of an ingestion job, written to its jobs row"""
+    
+    def __init__(self, conn, job_id):
+        self.conn = conn
+        self.job_id = job_id
+        self.started = time.perf_counter()
+        self.inserted = 0
+        self.rejected = 0
+        self.rejected_reasons = {}
+        self.product_ids = set()
+        # Products whose rows are committed, kept when a later chunk fails
+        self.committed_product_ids = set()
+        self.events = []
+    
+    def commit(self):
+        """Commit the chunk and publish its live events"""
+        self.conn.commit()
+        self.committed_product_ids |= self.product_ids
+        event_broker.publish(self.events)
+        self.events = []
+    
+    def advance(self, result, **fields):
+        """Add one chunk's ingest result; the caller commits with commit()"""
+        self.events += change_events(self.conn, result.get("stock_deltas"),
+                                     refresh_reorder_status(self.conn, result["product_ids"]))
+        self.events.append(("import", {"job_id": self.job_id, "inserted": result["inserted"]}))
+        self.inserted += result["inserted"]
+        self.rejected += result["rejected"]
+        for reason, count in result["rejected_reasons"].items():
+            self.rejected_reasons[reason] = self.rejected_reasons.get(reason, 0) + count
+        self.product_ids |= result["product_ids"]
+        
+        elapsed = time.perf_counter() - self.started
+        rows = self.inserted + self.rejected
+        update_job(self.conn, self.job_id,
+                   rows_processed=rows,
+                   inserted=self.inserted,
+                   rejected=self.rejected,
+                   rejected_reasons=json.dumps(self.rejected_reasons),
+                   rows_per_sec=round(rows / elapsed, 1) if elapsed > 0 else None,
+                   **fields)
+
+def _utc_timestamp():
+    """Current time formatted like SQLite's CURRENT_TIMESTAMP"""
+    return time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime())
+
+def create_job(conn, kind, **fields):
+    """Insert a queued job and return its id"""
+    job_id = uuid.uuid4().hex
+    fields = {"id": job_id, "kind": kind, "status": "queued", **fields}
+    conn.execute(f"""
+        INSERT INTO jobs ({', '.join(fields)})
+        VALUES ({', '.join('?' * len(fields))})
+    """, list(fields.values()))
+    conn.commit()
+    return job_id
+
+def update_job(conn, job_id, **fields):
+    conn.execute(f"UPDATE jobs SET {', '.join(f'{name} = ?' for name in fields)} WHERE id = ?",
+                 [*fields.values(), job_id])
+
+def job_to_dict(row):
+    job = dict(row)
+    job["rejected_reasons"] = json.loads(job["rejected_reasons"] or "{}")
+    return job
+
+def submit_job(job_id, func, *args):
+    """Run func(progress, *args) for a job on the ingestion worker"""
+    return _ingestion_executor.submit(_run_job, job_id, func, *args)
+
+def _run_job(job_id, func, *args):
+    with db_pool.connection() as conn:
+        update_job(conn, job_id, status="running", started_at=_utc_timestamp())
+        conn.commit()
+        
+        progress = JobProgress(conn, job_id)
+        try:
+            func(progress, *args)
+            invalidate_forecast_cache(conn, progress.product_ids)
+            update_job(conn, job_id, status="completed")
+        except Exception as e:
+            conn.rollback()
+            progress.events = []
+            # Chunks committed before the failure stay in
+            progress.product_ids = progress.committed_product_ids
+            invalidate_forecast_cache(conn, progress.product_ids)
+            error = e.detail if isinstance(e, HTTPException) else str(e)
+            update_job(conn, job_id, status="failed", error=error)
+        update_job(conn, job_id, finished_at=_utc_timestamp())
+        conn.commit()
+    
+    if progress.product_ids:
+        request_batch_forecast(progress.product_ids)
+
+def fail_interrupted_jobs(conn):
+    """Jobs that were queued or running when the server stopped cannot resume"""
+    conn.execute("""
+        UPDATE jobs SET status = 'failed', error = 'Interrupted by server restart',
+                        finished_at = CURRENT_TIMESTAMP
+        WHERE status IN ('queued', 'running')
+    """)
     conn.commit()
-    conn.close()
 
-# Pydantic models
-class Product(BaseModel):
-    code: str
-    name: str
-    category: Optional[str] = None
-    unit: str = "ขวด"
-    unit_cost: float
-    ordering_cost: float = 500.0
-    holding_cost_percentage: float = 0.2
-    lead_time_days: int = 7
-    current_stock: int = 0
+def start_upload_job(conn, file):
+    """Spool an upload to disk and queue its chunked import"""
+    with tempfile.NamedTemporaryFile(delete=False) as spool:
+        shutil.copyfileobj(file.file, spool, UPLOAD_COPY_BUFFER_BYTES)
+        path = spool.name
+    with open(path, "rb") as f:
+        fmt = sales_file_format(file.filename, f.read(8))
+    
+    job_id = create_job(conn, "sales_upload", filename=file.filename,
+                        bytes_total=os.path.getsize(path))
+    if fmt == 'csv':
+        submit_job(job_id, stream_sales_csv, path)
+    else:
+        submit_job(job_id, stream_sales_columnar, path, fmt)
+    return job_id
 
-class ProductUpdate(BaseModel):
-    name: Optional[str] = None
-    category: Optional[str] = None
-    unit: Optional[str] = None
-    unit_cost: Optional[float] = None
-    ordering_cost: Optional[float] = None
-    holding_cost_percentage: Optional[float] = None
-    lead_time_days: Optional[int] = None
-    current_stock: Optional[int] = None
+def stream_sales_csv(progress, path):
+    """Import a spooled CSV file chunk by chunk, one transaction per chunk"""
+    conn = progress.conn
+    try:
+        with open(path, "rb") as f:
+            product_codes = load_product_codes(conn)
+            for chunk in pd.read_csv(f, chunksize=UPLOAD_CHUNK_ROWS):
+                validate_sales_columns(chunk.columns)
+                result = ingest_sales_frame(conn, chunk, product_codes)
+                progress.advance(result, bytes_processed=f.tell())
+                progress.commit()
+        update_job(conn, progress.job_id, bytes_processed=os.path.getsize(path))
+    finally:
+        os.remove(path)
 
-class Transaction(BaseModel):
-    product_id: int
-    transaction_type: str  # 'in' or 'out'
-    quantity: int
-    note: Optional[str] = None
+def stream_sales_columnar(progress, path, fmt):
+    """Import a spooled Parquet or Arrow file batch by batch, one transaction per batch"""
+    conn = progress.conn
+    bytes_total = os.path.getsize(path)
+    try:
+        require_pyarrow()
+        with pa.memory_map(path) as source:
+            num_rows, batches = open_columnar_sales(source, fmt)
+            update_job(conn, progress.job_id, rows_total=num_rows)
+            product_codes = load_product_codes(conn)
+            rows = 0
+            for frame in columnar_sales_frames(batches):
+                result = ingest_sales_frame(conn, frame, product_codes)
+                rows += len(frame)
+                # Progress by rows read; the byte offset of a batch is not exposed
+                progress.advance(result, bytes_processed=int(bytes_total * rows / num_rows) if num_rows else 0)
+                progress.commit()
+        update_job(conn, progress.job_id, rows_total=rows, bytes_processed=bytes_total)
+    finally:
+        os.remove(path)
 
-class SalesData(BaseModel):
-    product_id: int
-    sale_date: str
-    quantity: int
+def insert_bulk_sales_job(progress, sales, upsert=False):
+    """Background variant of POST /api/sales/bulk"""
+    result = insert_bulk_sales(progress.conn, sales, upsert)
+    progress.advance(result)
+    progress.commit()
 
-# ARIMA Functions
-def find_best_arima_params(data, max_p=3, max_d=2, max_q=3):
-    """Find best ARIMA parameters using AIC"""
-    best_aic = np.inf
-    best_params = None
-    
-    # Check if data is stationary
-    adf_result = adfuller(data)
-    is_stationary = adf_result[1] < 0.05
-    
-    d_range = range(0, 1) if is_stationary else range(1, max_d + 1)
-    
-    for p, d, q in itertools.product(range(max_p + 1), d_range, range(max_q + 1)):
-        if p == 0 and q == 0:
-            continue
+# Forecast executor
+# Forecast requests run on a bounded thread pool so model fitting never blocks
+# the event loop. At most FORECAST_MAX_CONCURRENCY forecasts run at once and
+# up to FORECAST_MAX_QUEUE more may wait; beyond that requests get a 503.
+FORECAST_MAX_CONCURRENCY = int(os.environ.get("FORECAST_MAX_CONCURRENCY", "4"))
+FORECAST_MAX_QUEUE = int(os.environ.get("FORECAST_MAX_QUEUE", "32"))
+
+_forecast_executor = ThreadPoolExecutor(max_workers=FORECAST_MAX_CONCURRENCY,
+                                        thread_name_prefix="forecast")
+_forecast_stats_lock = threading.Lock()
+forecast_executor_stats = {
+    "running": 0,
+    "queued": 0,
+    "completed": 0,
+    "failed": 0,
+    "rejected": 0,
+}
+
+async def run_forecast_task(func, *args):
+    """Run a blocking forecast call on the bounded forecast executor"""
+    with _forecast_stats_lock:
+        if forecast_executor_stats["queued"] >= FORECAST_MAX_QUEUE:
+            forecast_executor_stats["rejected"] += 1
+            raise HTTPException(status_code=503, detail="Forecast queue is full, try again later")
+        forecast_executor_stats["queued"] += 1
+    
+    started = threading.Event()
+    
+    def task():
+        with _forecast_stats_lock:
+            forecast_executor_stats["queued"] -= 1
+            forecast_executor_stats["running"] += 1
+        started.set()
         try:
-            model = ARIMA(data, order=(p, d, q))
-            fitted_model = model.fit()
-            if fitted_model.aic < best_aic:
-                best_aic = fitted_model.aic
-                best_params = (p, d, q)
-        except:
-            continue
-    
-    return best_params if best_params else (1, 1, 1)
+            return func(*args)
+        except Exception:
+            with _forecast_stats_lock:
+                forecast_executor_stats["failed"] += 1
+            raise
+        finally:
+            with _forecast_stats_lock:
+                forecast_executor_stats["running"] -= 1
+                forecast_executor_stats["completed"] += 1
+    
+    future = _forecast_executor.submit(task)
+    try:
+        return await asyncio.wrap_future(future)
+    except asyncio.CancelledError:
+        # Client went away; drop the job if it has not started yet
+        if future.cancel() and not started.is_set():
+            with _forecast_stats_lock:
+                forecast_executor_stats["queued"] -= 1
+        raise
 
-def forecast_demand(sales_data, periods=30):
-    """Forecast demand using ARIMA"""
-    if len(sales_data) < 10:
-        return None, None, None
-    
-    # Prepare data
-    df = pd.DataFrame(sales_data)
-    df['sale_date'] = pd.to_datetime(df['sale_date'])
-    df = df.sort_values('sale_date')
-    df.set_index('sale_date', inplace=True)
-    
-    # Resample to daily and fill missing dates
-    daily_sales = df.resample('D')['quantity'].sum().fillna(0)
-    
-    # Find best parameters
-    best_params = find_best_arima_params(daily_sales.values)
+def forecast_product(product_id, periods=30, strategy=None):
+    """Blocking body of GET /api/forecast/{product_id}"""
+    with db_pool.connection() as conn:
+        cursor = conn.cursor()
+        
+        # Get product info
+        cursor.execute("SELECT * FROM products WHERE id = ?", (product_id,))
+        product = cursor.fetchone()
+        
+        if not product:
+            raise HTTPException(status_code=404, detail="Product not found")
+        
+        try:
+            result = build_product_forecast(conn, dict(product), periods, strategy)
+        except RuntimeError as e:
+            raise HTTPException(status_code=500, detail=str(e))
     
-    # Fit model
-    model = ARIMA(daily_sales, order=best_params)
-    fitted_model = model.fit()
+    if result is None:
+        raise HTTPException(status_code=400, 
+                          detail="Insufficient sales data for forecasting (minimum 10 records)")
+    return result
+
+# Pagination
+# List endpoints return {"items", "next_cursor", "total"} pages. The cursor
+# is the sort key of the last item on the page, so the next page is an
+# index seek past it rather than an OFFSET scan, and pages stay stable while
+# rows are added. total is only counted when asked for (include_total=true).
+PAGE_SIZE_DEFAULT = int(os.environ.get("PAGE_SIZE_DEFAULT", "50"))
+PAGE_SIZE_MAX = int(os.environ.get("PAGE_SIZE_MAX", "1000"))
+
+def encode_cursor(row, keys):
+    return base64.urlsafe_b64encode(json.dumps([row[key] for key in keys]).encode()).decode()
+
+def decode_cursor(cursor, size):
+    """Sort key values from a cursor returned by a previous page"""
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except ValueError:
+        values = None
+    if not isinstance(values, list) or len(values) != size:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return values
+
+def page_size(limit):
+    if limit is None:
+        return PAGE_SIZE_DEFAULT
+    if not 1 <= limit <= PAGE_SIZE_MAX:
+        raise HTTPException(status_code=400, detail=f"limit must be between 1 and {PAGE_SIZE_MAX}")
+    return limit
+
+def fetch_page(conn, select, count, filters, params, keyset, cursor_params,
+               order_by, cursor_keys, limit, include_total):
+    """Run one page of a keyset-paginated query
+    
+    `filters` are the WHERE conditions shared by the page and its total;
+    `keyset` is the condition seeking past the cursor, used only when a
+    cursor was given. One extra row is fetched to tell whether there is
+    a next page.
+    """
+    where = filters + [keyset] if cursor_params else filters
+    where_sql = f"WHERE {' AND '.join(where)}" if where else ""
+    rows = conn.execute(f"{select} {where_sql} ORDER BY {order_by} LIMIT ?",
+                        [*params, *cursor_params, limit + 1]).fetchall()
+    items = [dict(row) for row in rows[:limit]]
+    next_cursor = encode_cursor(items[-1], cursor_keys) if len(rows) > limit else None
+    
+    total = None
+    if include_total:
+        filters_sql = f"WHERE {' AND '.join(filters)}" if filters else ""
+        total = conn.execute(f"{count} {filters_sql}", params).fetchone()[0]
+    return {"items": items, "next_cursor": next_cursor, "total": total}
+
+# Exports
+# /api/export/* stream a whole table from one SELECT, fetching and encoding
+# EXPORT_CHUNK_ROWS rows at a time, so memory use does not grow with the
+# table. The statement reads one WAL snapshot, so concurrent writes do not
+# tear the export.
+EXPORT_CHUNK_ROWS = int(os.environ.get("EXPORT_CHUNK_ROWS", "20000"))
+
+# name: (SELECT ... FROM ..., ORDER BY, [(column, arrow type)])
+EXPORTS = {
+    "products": (
+        """SELECT id, code, name, category, unit, unit_cost, ordering_cost,
+                  holding_cost_percentage, lead_time_days, current_stock, created_at
+           FROM products""",
+        "id",
+        [("id", "int64"), ("code", "string"), ("name", "string"), ("category", "string"),
+         ("unit", "string"), ("unit_cost", "float64"), ("ordering_cost", "float64"),
+         ("holding_cost_percentage", "float64"), ("lead_time_days", "int64"),
+         ("current_stock", "int64"), ("created_at", "string")],
+    ),
+    # Rowid order streams straight off the table; ordering by date would
+    # sort the whole history before the first row is sent
+    "sales": (
+        """SELECT s.id, p.code AS product_code, p.name AS product_name, s.sale_date, s.quantity
+           FROM sales_history s JOIN products p ON s.product_id = p.id""",
+        "s.id",
+        [("id", "int64"), ("product_code", "string"), ("product_name", "string"),
+         ("sale_date", "string"), ("quantity", "int64")],
+    ),
+}
+
+def encode_csv(batches, columns):
+    # BOM so spreadsheet apps read the Thai names as UTF-8
+    yield ("\ufeff" + ",".join(name for name, _ in columns) + "\r\n").encode("utf-8")
+    for rows in batches:
+        buffer = io.StringIO()
+        csv.writer(buffer).writerows(rows)
+        yield buffer.getvalue().encode("utf-8")
+
+def encode_ndjson(batches, columns):
+    names = [name for name, _ in columns]
+    for rows in batches:
+        yield "".join(json.dumps(dict(zip(names, row)), ensure_ascii=False) + "\n"
+                      for row in rows).encode("utf-8")
+
+class _ParquetSink(io.BytesIO):
+    """Buffer that is emptied after every row group
     
-    # Forecast
-    forecast_result = fitted_model.forecast(steps=periods)
-    forecast_values = np.maximum(forecast_result, 0)  # No negative forecasts
+    tell() keeps counting from the start of the file, which the Parquet
+    footer's offsets rely on.
+    """
+    offset = 0
     
-    # Calculate confidence intervals
-    forecast_obj = fitted_model.get_forecast(steps=periods)
-    forecast_ci = forecast_obj.conf_int()
+    def tell(self):
+        return self.offset + super().tell()
     
-    return forecast_values.tolist(), forecast_ci.values.tolist(), best_params
+    def drain(self):
+        data = self.getvalue()
+        self.offset += len(data)
+        self.seek(0)
+        self.truncate()
+        return data
 
-def calculate_eoq(annual_demand, ordering_cost, holding_cost):
-    """Calculate Economic Order Quantity"""
-    if annual_demand <= 0 or holding_cost <= 0:
-        return 0
-    eoq = np.sqrt((2 * annual_demand * ordering_cost) / holding_cost)
-    return round(eoq, 2)
+def encode_parquet(batches, columns):
+    """One row group per batch"""
+    schema = pa.schema([(name, pa.type_for_alias(kind)) for name, kind in columns])
+    sink = _ParquetSink()
+    with pq.ParquetWriter(sink, schema) as writer:
+        for rows in batches:
+            arrays = [pa.array([None if v is None else str(v) for v in values] if kind == "string" else values,
+                               type=schema.field(name).type)
+                      for (name, kind), values in zip(columns, zip(*rows))]
+            writer.write_batch(pa.RecordBatch.from_arrays(arrays, schema=schema))
+            yield sink.drain()
+    yield sink.drain()
 
-def calculate_safety_stock(demand_std, lead_time_days, service_level=0.95):
-    """Calculate Safety Stock using Z-score method"""
-    from scipy import stats
-    z_score = stats.norm.ppf(service_level)
-    safety_stock = z_score * demand_std * np.sqrt(lead_time_days)
-    return round(safety_stock, 2)
+# format: (encoder, media type, file extension)
+EXPORT_FORMATS = {
+    "csv": (encode_csv, "text/csv", "csv"),
+    "ndjson": (encode_ndjson, "application/x-ndjson", "ndjson"),
+    "parquet": (encode_parquet, "application/vnd.apache.parquet", "parquet"),
+}
 
-def calculate_rop(avg_daily_demand, lead_time_days, safety_stock):
-    """Calculate Reorder Point"""
-    lead_time_demand = avg_daily_demand * lead_time_days
-    rop = lead_time_demand + safety_stock
-    return round(rop, 2)
+def check_export_format(fmt):
+    if fmt not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"format must be one of: {', '.join(EXPORT_FORMATS)}")
+    if fmt == "parquet":
+        require_pyarrow()
 
-def get_product_demand_metrics(product_id, conn):
-    """Calculate consistent demand metrics for a product"""
-    cursor = conn.cursor()
-    cursor.execute("""
-        SELECT sale_date, quantity FROM sales_history 
-        WHERE product_id = ?
-        ORDER BY sale_date
-    """, (product_id,))
-    
-    rows = cursor.fetchall()
-    if not rows or len(rows) < 2:
-        return 0.0, 0.0
-        
-    sales_data = [dict(row) for row in rows]
-    df = pd.DataFrame(sales_data)
-    df['sale_date'] = pd.to_datetime(df['sale_date'])
+def export_chunks(name, fmt, filters=(), params=()):
+    """Yield the encoded export, one chunk of EXPORT_CHUNK_ROWS rows at a time
     
-    # Resample to daily and fill missing dates to get accurate daily stats
-    daily_sales = df.resample('D', on='sale_date')['quantity'].sum()
-    
-    return float(daily_sales.mean()), float(daily_sales.std() or 0.0)
+    Uses its own pooled connection, held until the generator is exhausted
+    or closed.
+    """
+    select, order_by, columns = EXPORTS[name]
+    where_sql = f"WHERE {' AND '.join(filters)}" if filters else ""
+    encoder = EXPORT_FORMATS[fmt][0]
+    with db_pool.connection() as conn:
+        cursor = conn.execute(f"{select} {where_sql} ORDER BY {order_by}", list(params))
+        try:
+            yield from encoder(iter(lambda: cursor.fetchmany(EXPORT_CHUNK_ROWS), []), columns)
+        finally:
+            # An abandoned download must not leave the read snapshot open
+            cursor.close()
+
+def export_response(name, fmt, filters=(), params=()):
+    check_export_format(fmt)
+    _, media_type, extension = EXPORT_FORMATS[fmt]
+    chunks = export_chunks(name, fmt, filters, params)
+    # Starlette drops the iterator of a disconnected client without closing
+    # it; the background task runs after the response either way
+    return StreamingResponse(
+        chunks,
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{name}.{extension}"'},
+        background=BackgroundTask(chunks.close),
+    )
 
 # API Endpoints
 @app.on_event("startup")
 async def startup():
+    event_broker.bind(asyncio.get_running_loop())
     init_db()
+    with db_pool.connection() as conn:
+        fail_interrupted_jobs(conn)
+        # Stock or settings may have been changed outside the API
+        refresh_reorder_status(conn)
+        conn.commit()
+        resume_backtests(conn)
+    get_arima_pool()
+    if BATCH_FORECAST_ENABLED:
+        start_batch_forecast_scheduler()
+
+@app.on_event("shutdown")
+async def shutdown():
+    event_broker.close()
+    await stop_batch_forecast_scheduler()
+    _forecast_executor.shutdown(wait=False, cancel_futures=True)
+    _ingestion_executor.shutdown(wait=False, cancel_futures=True)
+    stop_backtests()
+    shutdown_arima_pool()
+    shutdown_forecast_batch_pool()
+    db_pool.close_all()
 
 @app.get("/")
 async def root():
@@ -224,8 +3017,7 @@ async def root():
 
 # Products endpoints
 @app.post("/api/products")
-async def create_product(product: Product):
-    conn = get_db()
+def create_product(product: Product, conn: sqlite3.Connection = Depends(get_conn)):
     cursor = conn.cursor()
     try:
         cursor.execute("""
@@ -237,17 +3029,16 @@ async def create_product(product: Product):
               product.unit_cost, product.ordering_cost, 
               product.holding_cost_percentage, product.lead_time_days,
               product.current_stock))
-        conn.commit()
         product_id = cursor.lastrowid
+        events = change_events(conn, reorder_events=refresh_reorder_status(conn, [product_id]))
+        conn.commit()
+        event_broker.publish(events)
         return {"id": product_id, "message": "Product created successfully"}
     except sqlite3.IntegrityError:
         raise HTTPException(status_code=400, detail="Product code already exists")
-    finally:
-        conn.close()
 
 @app.get("/api/products")
-async def get_products(search: Optional[str] = None):
-    conn = get_db()
+def get_products(search: Optional[str] = None, conn: sqlite3.Connection = Depends(get_conn)):
     cursor = conn.cursor()
     
     if search:
@@ -259,24 +3050,20 @@ async def get_products(search: Optional[str] = None):
         cursor.execute("SELECT * FROM products")
     
     products = [dict(row) for row in cursor.fetchall()]
-    conn.close()
     return products
 
 @app.get("/api/products/{product_id}")
-async def get_product(product_id: int):
-    conn = get_db()
+def get_product(product_id: int, conn: sqlite3.Connection = Depends(get_conn)):
     cursor = conn.cursor()
     cursor.execute("SELECT * FROM products WHERE id = ?", (product_id,))
     product = cursor.fetchone()
-    conn.close()
     
     if not product:
         raise HTTPException(status_code=404, detail="Product not found")
     return dict(product)
 
 @app.put("/api/products/{product_id}")
-async def update_product(product_id: int, product: ProductUpdate):
-    conn = get_db()
+def update_product(product_id: int, product: ProductUpdate, conn: sqlite3.Connection = Depends(get_conn)):
     cursor = conn.cursor()
     
     update_fields = []
@@ -313,61 +3100,77 @@ async def update_product(product_id: int, product: ProductUpdate):
     values.append(product_id)
     query = f"UPDATE products SET {', '.join(update_fields)} WHERE id = ?"
     
+    # Take the write lock before reading, so the stock delta in the change
+    # event matches what this update replaced
+    cursor.execute("BEGIN IMMEDIATE")
+    cursor.execute("SELECT current_stock FROM products WHERE id = ?", (product_id,))
+    previous = cursor.fetchone()
     cursor.execute(query, values)
+    
+    stock_deltas = {}
+    if previous and product.current_stock is not None and product.current_stock != previous[0]:
+        stock_deltas[product_id] = product.current_stock - previous[0]
+    events = change_events(conn, stock_deltas, refresh_reorder_status(conn, [product_id]))
     conn.commit()
-    conn.close()
+    event_broker.publish(events)
     
     return {"message": "Product updated successfully"}
 
 @app.delete("/api/products/{product_id}")
-async def delete_product(product_id: int):
-    conn = get_db()
+def delete_product(product_id: int, conn: sqlite3.Connection = Depends(get_conn)):
     cursor = conn.cursor()
     cursor.execute("DELETE FROM products WHERE id = ?", (product_id,))
+    deleted = cursor.rowcount
+    # The sales_history triggers drop the product's daily_sales and demand_stats rows
+    cursor.execute("DELETE FROM sales_history WHERE product_id = ?", (product_id,))
+    invalidate_forecast_cache(conn, [product_id])
+    cursor.execute("DELETE FROM forecasts WHERE product_id = ?", (product_id,))
+    cursor.execute("DELETE FROM forecast_models WHERE product_id = ?", (product_id,))
+    events = change_events(conn, reorder_events=refresh_reorder_status(conn, [product_id]))
     conn.commit()
+    event_broker.publish(events)
     
-    if cursor.rowcount == 0:
-        conn.close()
+    if deleted == 0:
         raise HTTPException(status_code=404, detail="Product not found")
-    
-    conn.close()
     return {"message": "Product deleted successfully"}
 
 # Transactions endpoints
 @app.post("/api/transactions")
-async def create_transaction(transaction: Transaction):
-    conn = get_db()
+def create_transaction(transaction: Transaction, conn: sqlite3.Connection = Depends(get_conn)):
     cursor = conn.cursor()
     
-    # Check if product exists
-    cursor.execute("SELECT current_stock FROM products WHERE id = ?", 
-                  (transaction.product_id,))
-    result = cursor.fetchone()
-    
-    if not result:
-        conn.close()
-        raise HTTPException(status_code=404, detail="Product not found")
-    
-    current_stock = result[0]
-    
-    # Calculate new stock
+    # Update product stock in one statement, so concurrent transactions
+    # cannot overwrite each other's result
     if transaction.transaction_type == 'in':
-        new_stock = current_stock + transaction.quantity
+        cursor.execute("UPDATE products SET current_stock = current_stock + ? WHERE id = ?",
+                       (transaction.quantity, transaction.product_id))
+        stock_delta = transaction.quantity
     elif transaction.transaction_type == 'out':
-        if current_stock < transaction.quantity:
-            conn.close()
-            raise HTTPException(status_code=400, detail="Insufficient stock")
-        new_stock = current_stock - transaction.quantity
+        cursor.execute("""
+            UPDATE products SET current_stock = current_stock - ?
+            WHERE id = ? AND current_stock >= ?
+        """, (transaction.quantity, transaction.product_id, transaction.quantity))
+        stock_delta = -transaction.quantity
     else:
-        conn.close()
         raise HTTPException(status_code=400, detail="Invalid transaction type")
     
+    if cursor.rowcount == 0:
+        conn.rollback()
+        cursor.execute("SELECT 1 FROM products WHERE id = ?", (transaction.product_id,))
+        if not cursor.fetchone():
+            raise HTTPException(status_code=404, detail="Product not found")
+        raise HTTPException(status_code=400, detail="Insufficient stock")
+    
+    cursor.execute("SELECT current_stock FROM products WHERE id = ?", (transaction.product_id,))
+    new_stock = cursor.fetchone()[0]
+    
     # Insert transaction
     cursor.execute("""
         INSERT INTO transactions (product_id, transaction_type, quantity, note)
         VALUES (?, ?, ?, ?)
     """, (transaction.product_id, transaction.transaction_type, 
           transaction.quantity, transaction.note))
+    transaction_id = cursor.lastrowid
     
     # NEW: If 'out', add to sales_history for forecasting/analytics
     if transaction.transaction_type == 'out':
@@ -376,203 +3179,406 @@ async def create_transaction(transaction: Transaction):
             VALUES (?, date('now'), ?)
         """, (transaction.product_id, transaction.quantity))
     
-    # Update product stock
-    cursor.execute("UPDATE products SET current_stock = ? WHERE id = ?",
-                  (new_stock, transaction.product_id))
+    if transaction.transaction_type == 'out':
+        invalidate_forecast_cache(conn, [transaction.product_id])
+    
+    cursor.execute("""
+        SELECT t.*, p.name as product_name, p.code as product_code
+        FROM transactions t
+        JOIN products p ON t.product_id = p.id
+        WHERE t.id = ?
+    """, (transaction_id,))
+    events = [("transaction", dict(cursor.fetchone()))]
+    events += change_events(conn, {transaction.product_id: stock_delta},
+                            refresh_reorder_status(conn, [transaction.product_id]))
     
     conn.commit()
-    conn.close()
+    event_broker.publish(events)
+    
+    if transaction.transaction_type == 'out':
+        request_batch_forecast([transaction.product_id])
     
     return {"message": "Transaction recorded successfully", "new_stock": new_stock}
 
 @app.get("/api/transactions")
-async def get_transactions(product_id: Optional[int] = None):
-    conn = get_db()
-    cursor = conn.cursor()
-    
+def get_transactions(product_id: Optional[int] = None, transaction_type: Optional[str] = None,
+                     date_from: Optional[date] = None, date_to: Optional[date] = None,
+                     limit: Optional[int] = None, cursor: Optional[str] = None,
+                     include_total: bool = False, conn: sqlite3.Connection = Depends(get_conn)):
+    """Newest transactions first, one page at a time
+    
+    Pass the returned next_cursor back as `cursor` for the following page.
+    date_from and date_to are inclusive days.
+    """
+    limit = page_size(limit)
+    filters, params = [], []
     if product_id:
-        cursor.execute("""
-            SELECT t.*, p.name as product_name, p.code as product_code
-            FROM transactions t
-            JOIN products p ON t.product_id = p.id
-            WHERE t.product_id = ?
-            ORDER BY t.transaction_date DESC
-        """, (product_id,))
-    else:
-        cursor.execute("""
-            SELECT t.*, p.name as product_name, p.code as product_code
-            FROM transactions t
-            JOIN products p ON t.product_id = p.id
-            ORDER BY t.transaction_date DESC
-        """)
-    
-    transactions = [dict(row) for row in cursor.fetchall()]
-    conn.close()
-    return transactions
+        filters.append("t.product_id = ?")
+        params.append(product_id)
+    if transaction_type:
+        if transaction_type not in ('in', 'out'):
+            raise HTTPException(status_code=400, detail="transaction_type must be 'in' or 'out'")
+        filters.append("t.transaction_type = ?")
+        params.append(transaction_type)
+    if date_from:
+        filters.append("t.transaction_date >= ?")
+        params.append(date_from.isoformat())
+    if date_to:
+        filters.append("t.transaction_date < date(?, '+1 day')")
+        params.append(date_to.isoformat())
+    
+    return fetch_page(
+        conn,
+        select="""SELECT t.*, p.name as product_name, p.code as product_code
+                  FROM transactions t JOIN products p ON t.product_id = p.id""",
+        count="SELECT COUNT(*) FROM transactions t JOIN products p ON t.product_id = p.id",
+        filters=filters, params=params,
+        keyset="(t.transaction_date, t.id) < (?, ?)",
+        cursor_params=decode_cursor(cursor, 2) if cursor else [],
+        order_by="t.transaction_date DESC, t.id DESC",
+        cursor_keys=("transaction_date", "id"),
+        limit=limit, include_total=include_total,
+    )
 
 # Sales endpoints
 @app.post("/api/sales/bulk")
-async def create_bulk_sales(sales: List[SalesData]):
-    conn = get_db()
-    cursor = conn.cursor()
-    
-    for sale in sales:
-        cursor.execute("""
-            INSERT INTO sales_history (product_id, sale_date, quantity)
-            VALUES (?, ?, ?)
-        """, (sale.product_id, sale.sale_date, sale.quantity))
+def create_bulk_sales(sales: List[SalesData], upsert: bool = False, background: bool = False,
+                      conn: sqlite3.Connection = Depends(get_conn)):
+    """Insert sales rows in one transaction
     
+    Invalid rows are skipped and listed in `errors`. With upsert=true each
+    row sets the quantity for its (product_id, sale_date), so a retried
+    request is not counted twice.
+    """
+    if background:
+        job_id = create_job(conn, "sales_bulk", rows_total=len(sales))
+        submit_job(job_id, insert_bulk_sales_job, sales, upsert)
+        return {"message": "Bulk sales accepted", "job_id": job_id}
+    
+    result = insert_bulk_sales(conn, sales, upsert)
+    invalidate_forecast_cache(conn, result["product_ids"])
+    events = change_events(conn, reorder_events=refresh_reorder_status(conn, result["product_ids"]))
     conn.commit()
-    conn.close()
+    event_broker.publish(events + [("import", {"inserted": result["inserted"]})])
     
-    return {"message": f"{len(sales)} sales records created successfully"}
+    if result["inserted"]:
+        request_batch_forecast(result["product_ids"])
+    
+    return {
+        "message": f"{result['inserted']} sales records created successfully",
+        "inserted": result["inserted"],
+        "rejected": result["rejected"],
+        "errors": result["errors"],
+    }
 
 @app.post("/api/sales/upload")
-async def upload_sales_csv(file: UploadFile = File(...)):
-    """Upload sales data from CSV file
-    Expected format: product_code, date, quantity
+def upload_sales_csv(file: UploadFile = File(...), stream: bool = False,
+                     conn: sqlite3.Connection = Depends(get_conn)):
+    """Upload sales data from a CSV, Parquet or Arrow IPC file
+    Expected columns: product_code, date, quantity
+    
+    With stream=true the file is imported by a background job, chunk by
+    chunk, and the response carries a job_id for GET /api/jobs/{job_id}.
     """
+    if stream:
+        job_id = start_upload_job(conn, file)
+        return {"message": "Upload accepted", "job_id": job_id}
+    
     try:
-        contents = await file.read()
-        df = pd.read_csv(io.BytesIO(contents))
-        
-        # Validate columns
-        required_cols = ['product_code', 'date', 'quantity']
-        if not all(col in df.columns for col in required_cols):
-            raise HTTPException(status_code=400, 
-                              detail=f"CSV must contain columns: {required_cols}")
-        
-        conn = get_db()
-        cursor = conn.cursor()
+        started = time.perf_counter()
+        contents = file.file.read()
+        df = read_sales_upload(contents, file.filename)
         
-        inserted = 0
-        for _, row in df.iterrows():
-            # Get product_id from code
-            cursor.execute("SELECT id FROM products WHERE code = ?", 
-                          (row['product_code'],))
-            result = cursor.fetchone()
-            
-            if result:
-                product_id = result[0]
-                # 1. Insert into sales_history (for forecasting)
-                cursor.execute("""
-                    INSERT INTO sales_history (product_id, sale_date, quantity)
-                    VALUES (?, ?, ?)
-                """, (product_id, row['date'], int(row['quantity'])))
-
-                # 2. Insert into transactions (for stock tracking history)
-                cursor.execute("""
-                    INSERT INTO transactions (product_id, transaction_type, quantity, note)
-                    VALUES (?, 'out', ?, 'Auto-imported from CSV')
-                """, (product_id, int(row['quantity'])))
-
-                # 3. Update current stock (Deduct stock)
-                cursor.execute("""
-                    UPDATE products 
-                    SET current_stock = current_stock - ? 
-                    WHERE id = ?
-                """, (int(row['quantity']), product_id))
-                
-                inserted += 1
+        result = ingest_sales_frame(conn, df, product_codes=load_product_codes(conn))
         
+        invalidate_forecast_cache(conn, result["product_ids"])
+        events = change_events(conn, result["stock_deltas"],
+                               refresh_reorder_status(conn, result["product_ids"]))
         conn.commit()
-        conn.close()
+        event_broker.publish(events + [("import", {"inserted": result["inserted"]})])
         
-        return {"message": f"Uploaded {inserted} sales records successfully"}
+        if result["inserted"]:
+            request_batch_forecast(result["product_ids"])
+        
+        return ingestion_summary(result, time.perf_counter() - started)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
-@app.get("/api/sales/{product_id}")
-async def get_sales_history(product_id: int):
-    conn = get_db()
+@app.get("/api/jobs")
+def get_jobs(limit: int = 50, conn: sqlite3.Connection = Depends(get_conn)):
     cursor = conn.cursor()
-    cursor.execute("""
-        SELECT * FROM sales_history 
-        WHERE product_id = ?
-        ORDER BY sale_date
-    """, (product_id,))
+    cursor.execute("SELECT * FROM jobs ORDER BY created_at DESC LIMIT ?", (limit,))
+    return [job_to_dict(row) for row in cursor.fetchall()]
+
+@app.get("/api/jobs/{job_id}")
+def get_job(job_id: str, conn: sqlite3.Connection = Depends(get_conn)):
+    cursor = conn.cursor()
+    cursor.execute("SELECT * FROM jobs WHERE id = ?", (job_id,))
+    job = cursor.fetchone()
     
-    sales = [dict(row) for row in cursor.fetchall()]
-    conn.close()
-    return sales
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job_to_dict(job)
+
+@app.get("/api/sales/{product_id}")
+def get_sales_history(product_id: int, date_from: Optional[date] = None, date_to: Optional[date] = None,
+                      limit: Optional[int] = None, cursor: Optional[str] = None,
+                      include_total: bool = False, conn: sqlite3.Connection = Depends(get_conn)):
+    """Raw sales rows of a product, oldest first, one page at a time"""
+    limit = page_size(limit)
+    filters, params = ["product_id = ?"], [product_id]
+    if date_from:
+        filters.append("sale_date >= ?")
+        params.append(date_from.isoformat())
+    if date_to:
+        filters.append("sale_date < date(?, '+1 day')")
+        params.append(date_to.isoformat())
+    
+    return fetch_page(
+        conn,
+        select="SELECT id, product_id, sale_date, quantity FROM sales_history",
+        count="SELECT COUNT(*) FROM sales_history",
+        filters=filters, params=params,
+        keyset="(sale_date, id) > (?, ?)",
+        cursor_params=decode_cursor(cursor, 2) if cursor else [],
+        order_by="sale_date, id",
+        cursor_keys=("sale_date", "id"),
+        limit=limit, include_total=include_total,
+    )
+
+@app.get("/api/sales/{product_id}/daily")
+def get_daily_sales(product_id: int, date_from: Optional[date] = None, date_to: Optional[date] = None,
+                    conn: sqlite3.Connection = Depends(get_conn)):
+    """Daily sales totals of a product from the daily_sales rollup"""
+    query = "SELECT day AS sale_date, qty AS quantity FROM daily_sales WHERE product_id = ?"
+    params = [product_id]
+    if date_from:
+        query += " AND day >= ?"
+        params.append(date_from.isoformat())
+    if date_to:
+        query += " AND day <= ?"
+        params.append(date_to.isoformat())
+    
+    return [dict(row) for row in conn.execute(query + " ORDER BY day", params).fetchall()]
+
+# Export endpoints
+@app.get("/api/export/products")
+def export_products(format: str = "csv"):
+    """All products as CSV, NDJSON or Parquet"""
+    return export_response("products", format)
+
+@app.get("/api/export/sales")
+def export_sales(format: str = "csv", date_from: Optional[date] = None, date_to: Optional[date] = None):
+    """Sales history with product code and name, streamed as CSV, NDJSON or Parquet"""
+    filters, params = [], []
+    if date_from:
+        filters.append("s.sale_date >= ?")
+        params.append(date_from.isoformat())
+    if date_to:
+        filters.append("s.sale_date < date(?, '+1 day')")
+        params.append(date_to.isoformat())
+    return export_response("sales", format, filters, params)
 
 # Forecasting endpoints
+def check_search_strategy(strategy):
+    if strategy is not None and strategy not in ARIMA_SEARCH_STRATEGIES:
+        raise HTTPException(status_code=400,
+                            detail=f"strategy must be one of: {', '.join(ARIMA_SEARCH_STRATEGIES)}")
+
 @app.get("/api/forecast/{product_id}")
-async def get_forecast(product_id: int, periods: int = 30):
-    conn = get_db()
-    cursor = conn.cursor()
-    
-    # Get product info
-    cursor.execute("SELECT * FROM products WHERE id = ?", (product_id,))
-    product = cursor.fetchone()
-    
-    if not product:
-        conn.close()
-        raise HTTPException(status_code=404, detail="Product not found")
-    
-    product = dict(product)
-    
-    # Get sales history
-    cursor.execute("""
-        SELECT sale_date, quantity FROM sales_history 
-        WHERE product_id = ?
-        ORDER BY sale_date
-    """, (product_id,))
-    
-    sales_data = [dict(row) for row in cursor.fetchall()]
-    # Move conn.close() later after metrics calculation
-    
-    if len(sales_data) < 10:
-        raise HTTPException(status_code=400, 
-                          detail="Insufficient sales data for forecasting (minimum 10 records)")
-    
-    # Forecast
-    forecast_values, forecast_ci, arima_params = forecast_demand(sales_data, periods)
-    
-    if forecast_values is None:
-        raise HTTPException(status_code=500, detail="Forecasting failed")
-    
-    # Calculate statistics
-    avg_daily_demand, demand_std = get_product_demand_metrics(product_id, conn)
-    conn.close() # Now we can close it
-    annual_demand = avg_daily_demand * 365
-    
-    # Calculate inventory metrics
-    holding_cost = product['unit_cost'] * product['holding_cost_percentage']
+async def get_forecast(product_id: int, periods: int = 30, strategy: Optional[str] = None):
+    """Forecast one product; strategy overrides ARIMA_SEARCH_STRATEGY for a new model search"""
+    check_search_strategy(strategy)
+    return await run_forecast_task(forecast_product, product_id, periods, strategy)
+
+@app.post("/api/forecast/batch")
+def forecast_batch(request: BatchForecastRequest, conn: sqlite3.Connection = Depends(get_conn)):
+    """Forecast a list of products or a whole category, streamed as NDJSON
+    
+    One line per product, in the order they finish, with the fields of
+    /api/forecast/{product_id} plus product_id and status ("ok",
+    "insufficient_data", "failed" or "not_found"). With both filters,
+    requested products of another category are skipped.
+    """
+    if not request.product_ids and not request.category:
+        raise HTTPException(status_code=400, detail="Provide product_ids or category")
+    check_search_strategy(request.strategy)
+    
+    query, params = "SELECT * FROM products WHERE 1 = 1", []
+    if request.product_ids:
+        query += " AND id IN (SELECT value FROM json_each(?))"
+        params.append(json.dumps(request.product_ids))
+    if request.category:
+        query += " AND category = ?"
+        params.append(request.category)
+    products = [dict(row) for row in conn.execute(query + " ORDER BY id", params).fetchall()]
+    if len(products) > FORECAST_BATCH_MAX_PRODUCTS:
+        raise HTTPException(status_code=400,
+                            detail=f"At most {FORECAST_BATCH_MAX_PRODUCTS} products per batch")
+    # Missing means not in the catalog, whatever the category filter
+    missing = []
+    if request.product_ids:
+        existing = {row[0] for row in conn.execute(
+            "SELECT id FROM products WHERE id IN (SELECT value FROM json_each(?))",
+            (json.dumps(request.product_ids),))}
+        missing = [pid for pid in dict.fromkeys(request.product_ids) if pid not in existing]
+    
+    def lines():
+        for product_id in missing:
+            yield json.dumps({"product_id": product_id, "status": "not_found"}) + "\n"
+        with db_pool.connection() as batch_conn:
+            for product, result, error in forecast_products(batch_conn, products, request.periods, request.strategy):
+                if error:
+                    line = {"product_id": product['id'], "status": "failed", "error": error}
+                elif result is None:
+                    line = {"product_id": product['id'], "status": "insufficient_data"}
+                else:
+                    line = {"product_id": product['id'], "status": "ok", **result}
+                yield json.dumps(line, ensure_ascii=False) + "\n"
     
-    eoq = calculate_eoq(annual_demand, product['ordering_cost'], holding_cost)
-    safety_stock = calculate_safety_stock(demand_std, product['lead_time_days'])
-    rop = calculate_rop(avg_daily_demand, product['lead_time_days'], safety_stock)
+    chunks = lines()
+    return StreamingResponse(chunks, media_type="application/x-ndjson",
+                             background=BackgroundTask(chunks.close))
+
+@app.get("/api/forecasts")
+def get_stored_forecasts(status: Optional[str] = None, conn: sqlite3.Connection = Depends(get_conn)):
+    """Forecasts computed by the batch job, without running any models"""
+    cursor = conn.cursor()
     
-    # Prepare forecast dates
-    last_date = pd.to_datetime(sales_data[-1]['sale_date'])
-    forecast_dates = [(last_date + timedelta(days=i+1)).strftime('%Y-%m-%d') 
-                     for i in range(periods)]
+    if status:
+        cursor.execute("SELECT * FROM forecasts WHERE status = ? ORDER BY product_id",
+                      (status,))
+    else:
+        cursor.execute("SELECT * FROM forecasts ORDER BY product_id")
     
+    forecasts = [stored_forecast_to_dict(row) for row in cursor.fetchall()]
+    return forecasts
+
+@app.get("/api/metrics")
+async def get_metrics():
+    with _forecast_stats_lock:
+        forecast_stats = dict(forecast_executor_stats)
+    with _search_stats_lock:
+        search_stats = {strategy: dict(stats) for strategy, stats in arima_search_stats.items()}
     return {
-        "product": product,
-        "forecast": {
-            "dates": forecast_dates,
-            "values": forecast_values,
-            "confidence_intervals": forecast_ci,
-            "arima_params": {"p": arima_params[0], "d": arima_params[1], "q": arima_params[2]}
+        "forecast_executor": {
+            **forecast_stats,
+            "max_concurrency": FORECAST_MAX_CONCURRENCY,
+            "max_queue": FORECAST_MAX_QUEUE,
         },
-        "metrics": {
-            "avg_daily_demand": round(avg_daily_demand, 2),
-            "demand_std": round(demand_std, 2),
-            "annual_demand": round(annual_demand, 2),
-            "eoq": eoq,
-            "safety_stock": safety_stock,
-            "reorder_point": rop,
-            "current_stock": product['current_stock'],
-            "stock_status": "ต้องสั่งซื้อ" if product['current_stock'] <= rop else "ปกติ"
-        }
+        "batch_forecast": batch_forecast_state,
+        "model_search": search_stats,
+        "db_pool": db_pool.stats(),
+        "events": event_broker.stats(),
     }
 
+@app.get("/api/forecasts/status")
+async def get_batch_forecast_status():
+    return batch_forecast_state
+
+@app.post("/api/forecasts/run")
+async def run_stored_forecasts(product_ids: Optional[List[int]] = None):
+    """Queue a batch re-forecast (all products when no ids are given)"""
+    request_batch_forecast(product_ids)
+    return {"message": "Batch forecast scheduled", "state": batch_forecast_state}
+
+@app.get("/api/forecasts/{product_id}")
+def get_stored_forecast(product_id: int, conn: sqlite3.Connection = Depends(get_conn)):
+    cursor = conn.cursor()
+    cursor.execute("SELECT * FROM forecasts WHERE product_id = ?", (product_id,))
+    row = cursor.fetchone()
+    
+    if not row:
+        raise HTTPException(status_code=404, detail="No stored forecast for this product")
+    return stored_forecast_to_dict(row)
+
+@app.post("/api/backtest")
+def start_backtest(request: BacktestRequest, conn: sqlite3.Connection = Depends(get_conn)):
+    """Queue a rolling-origin backtest of some products (the whole catalog by default)"""
+    check_search_strategy(request.strategy)
+    models = ("auto", *FORECAST_MODELS)
+    if request.model is not None and request.model not in models:
+        raise HTTPException(status_code=400, detail=f"model must be one of: {', '.join(models)}")
+    if min(request.horizon, request.origins, request.step or 1, request.min_train_days) < 1:
+        raise HTTPException(status_code=400,
+                            detail="horizon, origins, step and min_train_days must be positive")
+    
+    query, params = "SELECT id FROM products WHERE 1 = 1", []
+    if request.product_ids:
+        query += " AND id IN (SELECT value FROM json_each(?))"
+        params.append(json.dumps(request.product_ids))
+    if request.category:
+        query += " AND category = ?"
+        params.append(request.category)
+    product_ids = [row[0] for row in conn.execute(query + " ORDER BY id", params)]
+    # Requested products that do not exist are recorded as not_found
+    if not request.category:
+        product_ids += [pid for pid in dict.fromkeys(request.product_ids or [])
+                        if pid not in set(product_ids)]
+    
+    run_id = create_backtest_run(conn, product_ids, request)
+    submit_backtest(run_id)
+    return {"run_id": run_id, "status": "queued", "products_total": len(product_ids)}
+
+@app.get("/api/backtest")
+def get_backtests(limit: int = 50, conn: sqlite3.Connection = Depends(get_conn)):
+    """Backtest runs, newest first, with progress and overall accuracy"""
+    runs = conn.execute("SELECT * FROM backtest_runs ORDER BY created_at DESC, rowid DESC LIMIT ?",
+                        (limit,)).fetchall()
+    return [backtest_run_to_dict(conn, run) for run in runs]
+
+@app.get("/api/backtest/{run_id}")
+def get_backtest(run_id: str, conn: sqlite3.Connection = Depends(get_conn)):
+    """A backtest run with its accuracy per model and per product"""
+    run = conn.execute("SELECT * FROM backtest_runs WHERE id = ?", (run_id,)).fetchone()
+    if not run:
+        raise HTTPException(status_code=404, detail="Backtest run not found")
+    
+    result = backtest_run_to_dict(conn, run)
+    result["by_model"] = backtest_summaries(conn, run_id, "model")
+    per_product = backtest_summaries(conn, run_id, "product_id")
+    result["product_results"] = []
+    for checkpoint in conn.execute("""
+        SELECT c.product_id, p.code, p.name, c.status, c.error, c.seconds
+        FROM backtest_checkpoints c
+        LEFT JOIN products p ON p.id = c.product_id
+        WHERE c.run_id = ?
+        ORDER BY c.product_id
+    """, (run_id,)).fetchall():
+        result["product_results"].append({**dict(checkpoint),
+                                          "summary": per_product.get(checkpoint["product_id"])})
+    return result
+
+@app.get("/api/backtest/{run_id}/products/{product_id}")
+def get_backtest_folds(run_id: str, product_id: int, conn: sqlite3.Connection = Depends(get_conn)):
+    """Every forecast origin of one product in a backtest run"""
+    folds = conn.execute("""
+        SELECT * FROM backtest_results
+        WHERE run_id = ? AND product_id = ?
+        ORDER BY origin_date
+    """, (run_id, product_id)).fetchall()
+    if not folds:
+        raise HTTPException(status_code=404, detail="No backtest results for this product")
+    return [dict(fold) for fold in folds]
+
+@app.post("/api/backtest/{run_id}/resume")
+def resume_backtest(run_id: str, conn: sqlite3.Connection = Depends(get_conn)):
+    """Continue a failed run from its checkpoints"""
+    run = conn.execute("SELECT status FROM backtest_runs WHERE id = ?", (run_id,)).fetchone()
+    if not run:
+        raise HTTPException(status_code=404, detail="Backtest run not found")
+    if run["status"] != "failed":
+        raise HTTPException(status_code=400, detail="Only failed backtest runs can be resumed")
+    conn.execute("UPDATE backtest_runs SET status = 'queued', runner = 'api' WHERE id = ?", (run_id,))
+    conn.commit()
+    submit_backtest(run_id)
+    return {"run_id": run_id, "status": "queued"}
+
 # Dashboard endpoint
 @app.get("/api/dashboard")
-async def get_dashboard():
-    conn = get_db()
+def get_dashboard(conn: sqlite3.Connection = Depends(get_conn)):
     cursor = conn.cursor()
     
     # 1. Total products
@@ -594,34 +3600,22 @@ async def get_dashboard():
     recent_transactions = [dict(row) for row in cursor.fetchall()]
 
     # 4. Products needing reorder (Stock <= ROP)
-    cursor.execute("SELECT * FROM products")
-    products = cursor.fetchall()
-    
-    low_stock_products = []
-    for product in products:
-        product = dict(product)
-        avg_daily, demand_std = get_product_demand_metrics(product['id'], conn)
-        
-        if avg_daily > 0:
-            safety_stock = calculate_safety_stock(demand_std, product['lead_time_days'])
-            rop = calculate_rop(avg_daily, product['lead_time_days'], safety_stock)
-            
-            if product['current_stock'] <= rop:
-                annual_demand = avg_daily * 365
-                holding_cost = product['unit_cost'] * product['holding_cost_percentage']
-                eoq = calculate_eoq(annual_demand, product['ordering_cost'], holding_cost)
-                
-                low_stock_products.append({
-                    "id": product["id"],
-                    "name": product["name"],
-                    "code": product["code"],
-                    "current_stock": product["current_stock"],
-                    "unit": product["unit"],
-                    "rop": int(rop),
-                    "eoq": int(eoq)
-                })
-    
-    conn.close()
+    cursor.execute("""
+        SELECT p.id, p.name, p.code, p.current_stock, p.unit, r.rop, r.eoq
+        FROM reorder_status r
+        JOIN products p ON p.id = r.product_id
+        WHERE r.needs_reorder = 1
+        ORDER BY r.product_id
+    """)
+    low_stock_products = [{
+        "id": row["id"],
+        "name": row["name"],
+        "code": row["code"],
+        "current_stock": row["current_stock"],
+        "unit": row["unit"],
+        "rop": int(row["rop"]),
+        "eoq": int(row["eoq"])
+    } for row in cursor.fetchall()]
     
     return {
         "total_products": total_products,
@@ -631,26 +3625,69 @@ async def get_dashboard():
         "recent_transactions": recent_transactions
     }
 
+@app.get("/api/events")
+async def stream_events(request: Request):
+    """Server-sent events for stock, reorder status, transactions and imports"""
+    queue = event_broker.subscribe()
+    
+    async def event_stream():
+        try:
+            yield "retry: 3000\n\n"
+            while not await request.is_disconnected():
+                try:
+                    event = await asyncio.wait_for(queue.get(), SSE_KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                if event is None:
+                    break
+                event_type, data = event
+                yield f"event: {event_type}\ndata: {json.dumps(data, default=str)}\n\n"
+        finally:
+            event_broker.unsubscribe(queue)
+    
+    return StreamingResponse(event_stream(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@app.get("/api/reorder/events")
+def get_reorder_events(after: int = 0, limit: int = 100, conn: sqlite3.Connection = Depends(get_conn)):
+    """Reorder status changes with id greater than `after`, oldest first
+    
+    Clients keep the last id they have seen and pass it back as `after`
+    instead of reloading the dashboard.
+    """
+    cursor = conn.cursor()
+    cursor.execute("""
+        SELECT e.*, p.name as product_name, p.code as product_code
+        FROM reorder_events e
+        LEFT JOIN products p ON p.id = e.product_id
+        WHERE e.id > ?
+        ORDER BY e.id
+        LIMIT ?
+    """, (after, limit))
+    events = [dict(row) for row in cursor.fetchall()]
+    
+    return {"events": events, "last_id": events[-1]["id"] if events else after}
+
 @app.get("/api/analytics")
-async def get_analytics():
-    conn = get_db()
+def get_analytics(conn: sqlite3.Connection = Depends(get_conn)):
     cursor = conn.cursor()
     
     # 1. Sales Trends (Last 30 days)
     cursor.execute("""
-        SELECT sale_date, SUM(quantity) as total_qty
-        FROM sales_history
-        WHERE sale_date >= date('now', '-30 days')
-        GROUP BY sale_date
-        ORDER BY sale_date
+        SELECT day as sale_date, SUM(qty) as total_qty
+        FROM daily_sales
+        WHERE day >= date('now', '-30 days')
+        GROUP BY day
+        ORDER BY day
     """)
     sales_trends = [dict(row) for row in cursor.fetchall()]
     
     # 2. Top Moving Products (Top 10 by Sales Quantity)
     cursor.execute("""
-        SELECT p.name, SUM(s.quantity) as total_qty
-        FROM sales_history s
-        JOIN products p ON s.product_id = p.id
+        SELECT p.name, SUM(d.qty) as total_qty
+        FROM daily_sales d
+        JOIN products p ON d.product_id = p.id
         GROUP BY p.id
         ORDER BY total_qty DESC
         LIMIT 10
@@ -669,7 +3706,7 @@ async def get_analytics():
     # 4. Inventory Turn Rate (Simplifed: Total Sales / Total Current Stock)
     cursor.execute("""
         SELECT 
-            (SELECT SUM(s.quantity * p.unit_cost) FROM sales_history s JOIN products p ON s.product_id = p.id) as total_sales_value,
+            (SELECT SUM(d.qty * p.unit_cost) FROM daily_sales d JOIN products p ON d.product_id = p.id) as total_sales_value,
             (SELECT SUM(current_stock * unit_cost) FROM products) as current_inv_value
     """)
     turn_metrics = dict(cursor.fetchone())
@@ -678,34 +3715,11 @@ async def get_analytics():
         turn_rate = turn_metrics['total_sales_value'] / turn_metrics['current_inv_value']
     
     # 5. Stock Health (Healthy vs Low vs Out)
-    cursor.execute("""
-        SELECT p.id, p.current_stock, p.lead_time_days,
-               (SELECT AVG(quantity) FROM sales_history WHERE product_id = p.id) as avg_sales
-        FROM products p
-    """)
-    health_check = cursor.fetchall()
+    cursor.execute("SELECT status, COUNT(*) FROM reorder_status GROUP BY status")
+    health = dict(cursor.fetchall())
     
-    stats = {"healthy": 0, "low_stock": 0, "out_of_stock": 0}
-    for p in health_check:
-        p = dict(p)
-        if p['current_stock'] <= 0:
-            stats["out_of_stock"] += 1
-        else:
-            avg_daily, demand_std = get_product_demand_metrics(p['id'], conn)
-            
-            if avg_daily > 0:
-                ss = calculate_safety_stock(demand_std, p['lead_time_days'])
-                rop = calculate_rop(avg_daily, p['lead_time_days'], ss)
-                
-                if p['current_stock'] <= rop:
-                    stats["low_stock"] += 1
-                else:
-                    stats["healthy"] += 1
-            else:
-                # No sales data, assume healthy if stock > 0
-                stats["healthy"] += 1
-
-    conn.close()
+    stats = {status: health.get(status, 0)
+             for status in ("healthy", "low_stock", "out_of_stock")}
     
     return {
         "sales_trends": sales_trends,
@@ -717,4 +3731,6 @@ async def get_analytics():
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
+    # /api/events streams stay open until the client leaves; give them a few
+    # seconds at shutdown instead of waiting for every browser tab to close
+    uvicorn.run(app, host="0.0.0.0", port=8000, timeout_graceful_shutdown=5)
\ No newline at end of file
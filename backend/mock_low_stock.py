@@ -14,6 +14,8 @@ import itertools
 import warnings
 import random
 
+import main
+
 warnings.filterwarnings('ignore')
 
 # Database setup
@@ -167,7 +169,9 @@ if __name__ == "__main__":
             print(f" - {p_name}: AvgSales={avg_daily:.2f}, ROP={rop:.2f}, Set Stock -> {new_stock}")
         else:
             print(f" - {p_name}: No sales data, skipping.")
-            
+    
+    # The dashboard and analytics read the materialized reorder status
+    main.refresh_reorder_status(conn)
     conn.commit()
     conn.close()
     print("\nMock data update complete!")
\ No newline at end of file
@@ -0,0 +1,19 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import main
+
+
+@pytest.fixture
+def conn(tmp_path, monkeypatch):
+    """A fresh migrated database with one product, P001 (id 1)"""
+    monkeypatch.setattr(main, "DATABASE", str(tmp_path / "inventory.db"))
+    monkeypatch.setattr(main, "db_pool", main.ConnectionPool())
+    main.init_db()
+    with main.db_pool.connection() as conn:
+        conn.execute("INSERT INTO products (code, name, current_stock) VALUES ('P001', 'Test', 100)")
+        conn.commit()
+        yield conn
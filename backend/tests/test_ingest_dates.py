@@ -0,0 +1,48 @@
+import pandas as pd
+
+import main
+
+
+def test_mixed_date_shapes_are_all_inserted(conn):
+    df = pd.DataFrame({
+        "product_code": ["P001", "P001", "P001"],
+        "date": ["2026-10-10", "2026-10-10 14:30:00", "2026-10-09T08:00:00"],
+        "quantity": [1, 2, 3],
+    })
+    result = main.ingest_sales_frame(conn, df, main.load_product_codes(conn))
+    
+    assert result["inserted"] == 3
+    assert result["rejected_reasons"]["invalid_date"] == 0
+    rows = conn.execute("SELECT sale_date, quantity FROM sales_history ORDER BY id").fetchall()
+    assert sorted(map(tuple, rows)) == [("2026-10-09", 3), ("2026-10-10", 1), ("2026-10-10", 2)]
+
+
+def test_negative_non_finite_and_huge_quantities_are_rejected(conn):
+    df = pd.DataFrame({
+        "product_code": ["P001"] * 5,
+        "date": ["2026-10-10"] * 5,
+        "quantity": [5, float("inf"), 1e30, "x", -2],
+    })
+    result = main.ingest_sales_frame(conn, df, main.load_product_codes(conn))
+    
+    assert result["inserted"] == 1
+    assert result["rejected_reasons"]["invalid_quantity"] == 4
+
+
+def test_bulk_sales_accept_mixed_date_shapes(conn):
+    sales = [main.SalesData(product_id=1, sale_date=sale_date, quantity=1)
+             for sale_date in ["2026-10-10", "2026-10-10 14:30:00", "2026-10-09T08:00:00"]]
+    result = main.insert_bulk_sales(conn, sales)
+    
+    assert result["inserted"] == 3
+    assert result["errors"] == []
+
+
+def test_bulk_sales_reject_negative_and_huge_quantities(conn):
+    sales = [main.SalesData(product_id=1, sale_date="2026-10-10", quantity=quantity)
+             for quantity in [5, -1, main.MAX_SALE_QUANTITY + 1, 10 ** 30]]
+    result = main.insert_bulk_sales(conn, sales)
+    
+    assert result["inserted"] == 1
+    assert result["rejected_reasons"]["invalid_quantity"] == 3
+    assert [error["index"] for error in result["errors"]] == [1, 2, 3]
@@ -0,0 +1,28 @@
+import pandas as pd
+
+import main
+
+
+def test_failed_job_keeps_committed_chunks_fresh(conn, monkeypatch):
+    monkeypatch.setattr(main, "_batch_forecast_pending", set())
+    conn.execute("INSERT INTO products (code, name, current_stock) VALUES ('P002', 'Other', 100)")
+    conn.commit()
+    main.store_cached_forecast(conn, 1, "hash", 30, [1.0], {"95": [[0.0, 2.0]]}, {"name": "ses"})
+    conn.commit()
+    
+    def ingest(progress):
+        for code in ["P001", "P002"]:
+            df = pd.DataFrame({"product_code": [code], "date": ["2026-10-10"], "quantity": [1]})
+            progress.advance(main.ingest_sales_frame(progress.conn, df,
+                                                      main.load_product_codes(progress.conn)))
+            if code == "P002":
+                raise ValueError("bad chunk")
+            progress.commit()
+    
+    job_id = main.create_job(conn, "sales_upload")
+    conn.commit()
+    main._run_job(job_id, ingest)
+    
+    assert main.get_job(job_id, conn)["status"] == "failed"
+    assert conn.execute("SELECT COUNT(*) FROM forecast_cache WHERE product_id = 1").fetchone()[0] == 0
+    assert main._batch_forecast_pending == {1}
@@ -0,0 +1,26 @@
+import main
+
+
+def reorder_row(conn, product_id):
+    return conn.execute("SELECT * FROM reorder_status WHERE product_id = ?", (product_id,)).fetchone()
+
+
+def test_product_without_lead_time_or_costs_is_healthy(conn):
+    # P001 has no lead time, costs or sales
+    main.refresh_reorder_status(conn)
+    
+    row = reorder_row(conn, 1)
+    assert row["status"] == "healthy"
+    assert (row["avg_daily_demand"], row["safety_stock"], row["rop"], row["eoq"]) == (0, 0, 0, 0)
+
+
+def test_product_without_lead_time_or_costs_with_sales(conn):
+    sales = [main.SalesData(product_id=1, sale_date=f"2026-10-{day:02d}", quantity=day)
+             for day in range(1, 11)]
+    main.insert_bulk_sales(conn, sales)
+    main.refresh_reorder_status(conn, [1])
+    
+    row = reorder_row(conn, 1)
+    assert row["avg_daily_demand"] > 0
+    assert row["status"] == "healthy"
+    assert (row["safety_stock"], row["rop"], row["eoq"]) == (0, 0, 0)
@@ -0,0 +1,26 @@
+import pandas as pd
+
+import main
+
+
+def sale(day, quantity, product_id=1):
+    return main.SalesData(product_id=product_id, sale_date=f"2026-10-{day:02d}", quantity=quantity)
+
+
+def test_bulk_paths_keep_rollups_consistent(conn):
+    conn.execute("INSERT INTO products (code, name, current_stock) VALUES ('P002', 'Other', 100)")
+    main.insert_bulk_sales(conn, [sale(1, 3), sale(1, 4), sale(2, 5, product_id=2)])
+    main.insert_bulk_sales(conn, [sale(1, 7), sale(3, 2)], upsert=True)
+    main.insert_bulk_sales(conn, [sale(1, 9), sale(4, 1, product_id=2)], upsert=True)
+    df = pd.DataFrame({"product_code": ["P001", "P002", "P002"],
+                       "date": ["2026-10-01", "2026-10-02", "2026-10-05"],
+                       "quantity": [1, 2, 3]})
+    main.ingest_sales_frame(conn, df, main.load_product_codes(conn))
+    conn.execute("INSERT INTO sales_history (product_id, sale_date, quantity) VALUES (1, '2026-10-06', 4)")
+    conn.commit()
+    
+    assert main.check_sales_rollups(conn) == {"daily_sales": 0, "demand_stats": 0}
+    assert conn.execute("SELECT COUNT(*) FROM sales_rollup_deferred").fetchone()[0] == 0
+    assert tuple(conn.execute(
+        "SELECT qty, n_rows FROM daily_sales WHERE product_id = 1 AND day = '2026-10-01'"
+    ).fetchone()) == (3 + 4 + 9 + 1, 4)
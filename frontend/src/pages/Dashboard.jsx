@@ -1,16 +1,57 @@
 import React, { useState, useEffect } from 'react';
 import { Package, AlertTriangle, DollarSign, Activity, ArrowUpCircle, ArrowDownCircle, PieChart as PieIcon } from 'lucide-react';
-import { apiCall } from '../services/api';
+import toast from 'react-hot-toast';
+import { apiCall, subscribeEvents } from '../services/api';
 import { Skeleton } from '../components/ui/Skeleton';
 import { EmptyState } from '../components/ui/EmptyState';
 import { PieChart, Pie, Cell, ResponsiveContainer, Tooltip, Legend } from 'recharts';
 
+// Put a product pushed by the server into, or take it out of, the low-stock list
+const applyProduct = (stats, product) => {
+  const others = stats.low_stock_products.filter(p => p.id !== product.product_id);
+  const lowStock = product.needs_reorder
+    ? [...others, {
+        id: product.product_id,
+        name: product.name,
+        code: product.code,
+        current_stock: product.current_stock,
+        unit: product.unit,
+        rop: product.rop,
+        eoq: product.eoq
+      }].sort((a, b) => a.id - b.id)
+    : others;
+  return { ...stats, low_stock_products: lowStock, low_stock_count: lowStock.length };
+};
+
 const Dashboard = () => {
   const [stats, setStats] = useState(null);
   const [loading, setLoading] = useState(true);
 
   useEffect(() => {
     loadDashboard();
+
+    // Update in place from pushed events instead of re-fetching the dashboard
+    return subscribeEvents({
+      stock: (product) => setStats(prev => prev && applyProduct({
+        ...prev,
+        total_stock_value: prev.total_stock_value + product.stock_value_delta
+      }, product)),
+      reorder: (event) => {
+        // A product was added or deleted, which also changes the totals
+        if (event.previous_status === null || event.status === null) {
+          loadDashboard();
+          return;
+        }
+        setStats(prev => prev && applyProduct(prev, event));
+        if (event.needs_reorder) toast.error(`${event.name} ถึงจุดสั่งซื้อแล้ว`);
+      },
+      transaction: (trans) => setStats(prev => prev && {
+        ...prev,
+        recent_transactions: [trans, ...prev.recent_transactions].slice(0, 10)
+      }),
+      import: loadDashboard,
+      resync: loadDashboard,
+    });
   }, []);
 
   const loadDashboard = async () => {
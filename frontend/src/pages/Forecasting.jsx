@@ -6,6 +6,19 @@ import {
 import { TrendingUp, Info } from 'lucide-react';
 import { apiCall } from '../services/api';
 
+const MODEL_LABELS = {
+  ses: 'Simple Exponential Smoothing',
+  holt: "Holt's Linear Trend",
+  croston: 'Croston (ยอดขายไม่สม่ำเสมอ)',
+  tsb: 'TSB (ยอดขายไม่สม่ำเสมอ)'
+};
+
+const modelLabel = (forecast) => {
+  const order = forecast.arima_params;
+  if (order) return `ARIMA(${order.p}, ${order.d}, ${order.q})`;
+  return MODEL_LABELS[forecast.model] || forecast.model;
+};
+
 const Forecasting = () => {
   const [products, setProducts] = useState([]);
   const [selectedProduct, setSelectedProduct] = useState('');
@@ -36,7 +49,7 @@ const Forecasting = () => {
     try {
       const [forecastRes, historyRes] = await Promise.all([
         apiCall(`/api/forecast/${selectedProduct}?periods=${periods}`),
-        apiCall(`/api/sales/${selectedProduct}`)
+        apiCall(`/api/sales/${selectedProduct}/daily`)
       ]);
 
       setForecastData(forecastRes);
@@ -149,10 +162,13 @@ const Forecasting = () => {
           const k = getWeekKey(d);
           buckets[k] = (buckets[k] || 0) + forecastData.forecast.values[idx];
           
-          if (!ciBuckets[k]) ciBuckets[k] = { lower: 0, upper: 0 };
+          if (!ciBuckets[k]) ciBuckets[k] = { lower: 0, upper: 0, lower80: 0, upper80: 0 };
           const ci = forecastData.forecast.confidence_intervals[idx] || [0, 0];
+          const ci80 = forecastData.forecast.confidence_intervals_80[idx] || [0, 0];
           ciBuckets[k].lower += ci[0];
           ciBuckets[k].upper += ci[1];
+          ciBuckets[k].lower80 += ci80[0];
+          ciBuckets[k].upper80 += ci80[1];
 
           bucketCounts[k] = (bucketCounts[k] || 0) + 1;
         });
@@ -165,6 +181,8 @@ const Forecasting = () => {
           const normalizedVal = Math.round((buckets[k] / daysInWeek) * 7);
           const normalizedLower = Math.max(0, Math.round((ciBuckets[k].lower / daysInWeek) * 7));
           const normalizedUpper = Math.round((ciBuckets[k].upper / daysInWeek) * 7);
+          const normalizedLower80 = Math.max(0, Math.round((ciBuckets[k].lower80 / daysInWeek) * 7));
+          const normalizedUpper80 = Math.round((ciBuckets[k].upper80 / daysInWeek) * 7);
 
           return {
             dateISO: k,
@@ -172,6 +190,8 @@ const Forecasting = () => {
             forecast: normalizedVal,
             ci_lower: normalizedLower,
             ci_upper: normalizedUpper,
+            ci80_lower: normalizedLower80,
+            ci80_upper: normalizedUpper80,
             isPartial: daysInWeek < 7
           };
         });
@@ -180,12 +200,15 @@ const Forecasting = () => {
         forecastPoints = forecastData.forecast.dates.map((date, idx) => {
           const d = new Date(date);
           const ci = forecastData.forecast.confidence_intervals[idx] || [0, 0];
+          const ci80 = forecastData.forecast.confidence_intervals_80[idx] || [0, 0];
           return {
             dateISO: date,
             date: d.toLocaleDateString('th-TH', { month: 'short', day: 'numeric' }),
             forecast: Math.round(forecastData.forecast.values[idx]),
             ci_lower: Math.max(0, Math.round(ci[0])),
-            ci_upper: Math.round(ci[1])
+            ci_upper: Math.round(ci[1]),
+            ci80_lower: Math.max(0, Math.round(ci80[0])),
+            ci80_upper: Math.round(ci80[1])
           };
         });
       }
@@ -435,7 +458,7 @@ const Forecasting = () => {
             <div className="mb-4">
               <h3 className="text-lg font-bold text-gray-900">กราฟการพยากรณ์จริง vs คาดการณ์</h3>
               <p className="text-sm font-medium text-gray-800">
-                ARIMA({forecastData.forecast.arima_params.p}, {forecastData.forecast.arima_params.d}, {forecastData.forecast.arima_params.q}) ·
+                {modelLabel(forecastData.forecast)} ·
                 <span className="ml-1 text-gray-500 font-normal">แถบสีเทาแสดงช่วงความเชื่อมั่น (Confidence Interval) ของการพยากรณ์</span>
               </p>
             </div>
@@ -444,7 +467,8 @@ const Forecasting = () => {
                 <ResponsiveContainer width="100%" height="100%">
                 <ComposedChart data={chartData.map(d => ({
                      ...d,
-                     ci_range: [d.ci_lower, d.ci_upper] 
+                     ci_range: [d.ci_lower, d.ci_upper],
+                     ci80_range: [d.ci80_lower, d.ci80_upper]
                  }))}>
                     <CartesianGrid strokeDasharray="3 3" stroke="#e5e7eb" />
                     <XAxis 
@@ -477,6 +501,15 @@ const Forecasting = () => {
                         name="ช่วงความเชื่อมั่น (95% CI)"
                     />
 
+                    <Area
+                        type="monotone"
+                        dataKey="ci80_range"
+                        stroke="none"
+                        fill="#6b7280"
+                        fillOpacity={0.25}
+                        name="ช่วงความเชื่อมั่น (80% CI)"
+                    />
+
                     <Line
                     type="monotone"
                     dataKey="actual"
@@ -4,10 +4,30 @@ import { Upload, Download } from 'lucide-react';
 import toast from 'react-hot-toast';
 
 const API_BASE_URL = 'http://localhost:8000'; 
+const POLL_INTERVAL_MS = 1000;
+
+const sleep = (ms) => new Promise((resolve) => setTimeout(resolve, ms));
 
 const SalesUpload = () => {
   const [uploading, setUploading] = useState(false);
   const [uploadResult, setUploadResult] = useState(null);
+  const [progress, setProgress] = useState(null);
+
+  // Poll the background import until it finishes
+  const waitForJob = async (jobId) => {
+    while (true) {
+      const response = await fetch(`${API_BASE_URL}/api/jobs/${jobId}`);
+      const status = await response.json();
+      if (!response.ok) {
+        throw new Error(status.detail || 'Upload failed');
+      }
+
+      setProgress(status);
+      if (status.status === 'completed') return status;
+      if (status.status === 'failed') throw new Error(status.error || 'Upload failed');
+      await sleep(POLL_INTERVAL_MS);
+    }
+  };
 
   const handleFileUpload = async (e) => {
     const file = e.target.files[0];
@@ -15,6 +35,7 @@ const SalesUpload = () => {
 
     setUploading(true);
     setUploadResult(null);
+    setProgress(null);
 
     const formData = new FormData();
     formData.append('file', file);
@@ -22,7 +43,7 @@ const SalesUpload = () => {
     try {
         // We can't use apiCall easily if we want to handle FormData without manually setting headers (fetch does it automatically).
         // So I'll just use fetch here.
-      const response = await fetch(`${API_BASE_URL}/api/sales/upload`, {
+      const response = await fetch(`${API_BASE_URL}/api/sales/upload?stream=true`, {
         method: 'POST',
         body: formData
       });
@@ -32,14 +53,20 @@ const SalesUpload = () => {
         throw new Error(error.detail || 'Upload failed');
       }
 
-      const result = await response.json();
-      setUploadResult({ success: true, message: result.message });
+      const { job_id } = await response.json();
+      const result = await waitForJob(job_id);
+      const rejected = result.rejected > 0 ? ` (ข้าม ${result.rejected.toLocaleString()} แถว)` : '';
+      setUploadResult({
+        success: true,
+        message: `Uploaded ${result.inserted.toLocaleString()} sales records successfully${rejected}`
+      });
       toast.success('อัพโหลดข้อมูลสำเร็จ');
     } catch (error) {
       setUploadResult({ success: false, message: error.message });
       toast.error('เกิดข้อผิดพลาด: ' + error.message);
     } finally {
       setUploading(false);
+      setProgress(null);
       // Reset input layout
       e.target.value = null; 
     }
@@ -63,7 +90,7 @@ const SalesUpload = () => {
         <div className="max-w-2xl mx-auto">
           <div className="text-center mb-8">
             <Upload className="w-16 h-16 text-amber-600 mx-auto mb-4" />
-            <h3 className="text-xl font-bold text-gray-900 mb-2">อัพโหลดไฟล์ CSV</h3>
+            <h3 className="text-xl font-bold text-gray-900 mb-2">อัพโหลดไฟล์ CSV / Parquet / Arrow</h3>
             <p className="text-gray-800 font-medium">
               ไฟล์ต้องมีคอลัมน์: product_code, date, quantity
             </p>
@@ -73,7 +100,7 @@ const SalesUpload = () => {
             <div className="border-2 border-dashed border-gray-300 rounded-lg p-8 text-center hover:border-amber-500 transition-colors group cursor-pointer relative">
               <input
                 type="file"
-                accept=".csv"
+                accept=".csv,.parquet,.pq,.arrow,.arrows,.feather"
                 onChange={handleFileUpload}
                 disabled={uploading}
                 className="absolute inset-0 w-full h-full opacity-0 cursor-pointer z-10"
@@ -83,6 +110,20 @@ const SalesUpload = () => {
                     <>
                         <div className="animate-spin rounded-full h-10 w-10 border-b-2 border-amber-600 mb-3"></div>
                         <p className="text-amber-800 font-medium">กำลังอัพโหลด...</p>
+                        {progress && progress.bytes_total > 0 && (
+                          <div className="w-full max-w-sm mt-3">
+                            <div className="w-full bg-amber-100 rounded-full h-2">
+                              <div
+                                className="bg-amber-600 h-2 rounded-full transition-all"
+                                style={{ width: `${Math.round((progress.bytes_processed / progress.bytes_total) * 100)}%` }}
+                              ></div>
+                            </div>
+                            <p className="text-sm text-gray-600 mt-2">
+                              {progress.inserted.toLocaleString()} แถว
+                              {progress.rows_per_sec ? ` · ${Math.round(progress.rows_per_sec).toLocaleString()} แถว/วินาที` : ''}
+                            </p>
+                          </div>
+                        )}
                     </>
                  ) : (
                     <>
@@ -90,7 +131,7 @@ const SalesUpload = () => {
                             <Upload className="w-6 h-6 text-amber-600" />
                         </div>
                         <p className="text-gray-600 font-medium">ลากไฟล์มาวางที่นี่ หรือ คลิกเพื่อเลือกไฟล์</p>
-                        <p className="text-sm text-gray-500 mt-1">รองรับไฟล์ .csv เท่านั้น</p>
+                        <p className="text-sm text-gray-500 mt-1">รองรับไฟล์ .csv, .parquet และ .arrow</p>
                     </>
                  )}
               </div>
@@ -1,6 +1,6 @@
 import React, { useState, useEffect } from 'react';
 import { Plus, ArrowUpCircle, ArrowDownCircle } from 'lucide-react';
-import { apiCall } from '../services/api';
+import { apiCall, subscribeEvents } from '../services/api';
 import TransactionModal from '../components/TransactionModal';
 import { Skeleton, TableSkeleton } from '../components/ui/Skeleton';
 import { EmptyState } from '../components/ui/EmptyState';
@@ -9,27 +9,69 @@ const Transactions = () => {
   const [products, setProducts] = useState([]);
   const [transactions, setTransactions] = useState([]);
   const [selectedProduct, setSelectedProduct] = useState('');
+  const [transactionType, setTransactionType] = useState('');
+  const [dateFrom, setDateFrom] = useState('');
+  const [dateTo, setDateTo] = useState('');
+  const [nextCursor, setNextCursor] = useState(null);
+  const [total, setTotal] = useState(null);
   const [showAddModal, setShowAddModal] = useState(false);
   const [loading, setLoading] = useState(true);
+  const [loadingMore, setLoadingMore] = useState(false);
 
   useEffect(() => {
     loadProducts();
     loadTransactions();
-  }, [selectedProduct]);
+
+    // New transactions and stock levels are pushed by the server
+    return subscribeEvents({
+      transaction: (trans) => {
+        if (selectedProduct && String(trans.product_id) !== String(selectedProduct)) return;
+        if (transactionType && trans.transaction_type !== transactionType) return;
+        if (dateTo && trans.transaction_date.slice(0, 10) > dateTo) return;
+        setTransactions(prev => prev.some(t => t.id === trans.id) ? prev : [trans, ...prev]);
+        setTotal(count => count === null ? count : count + 1);
+      },
+      stock: (product) => setProducts(prev => prev.map(p =>
+        p.id === product.product_id ? { ...p, current_stock: product.current_stock } : p
+      )),
+      import: loadTransactions,
+      resync: () => { loadProducts(); loadTransactions(); },
+    });
+  }, [selectedProduct, transactionType, dateFrom, dateTo]);
 
   const loadProducts = async () => {
     const data = await apiCall('/api/products');
     setProducts(data);
   };
 
+  // One page at a time; the server returns a cursor for the next one
+  const transactionsEndpoint = (extra = {}) => {
+    const params = new URLSearchParams(extra);
+    if (selectedProduct) params.set('product_id', selectedProduct);
+    if (transactionType) params.set('transaction_type', transactionType);
+    if (dateFrom) params.set('date_from', dateFrom);
+    if (dateTo) params.set('date_to', dateTo);
+    return `/api/transactions?${params}`;
+  };
+
+  // Counting grows with history, so it runs after the first page is shown
+  const loadTotal = async () => {
+    try {
+      const data = await apiCall(transactionsEndpoint({ limit: 1, include_total: 'true' }));
+      setTotal(data.total);
+    } catch (error) {
+       console.error("Failed to count transactions", error);
+    }
+  };
+
   const loadTransactions = async () => {
     setLoading(true);
     try {
-      const endpoint = selectedProduct 
-        ? `/api/transactions?product_id=${selectedProduct}`
-        : '/api/transactions';
-      const data = await apiCall(endpoint);
-      setTransactions(data);
+      const data = await apiCall(transactionsEndpoint());
+      setTransactions(data.items);
+      setNextCursor(data.next_cursor);
+      setTotal(null);
+      loadTotal();
     } catch (error) {
        console.error("Failed to load transactions", error);
     } finally {
@@ -37,6 +79,19 @@ const Transactions = () => {
     }
   };
 
+  const loadMoreTransactions = async () => {
+    setLoadingMore(true);
+    try {
+      const data = await apiCall(transactionsEndpoint({ cursor: nextCursor }));
+      setTransactions(prev => [...prev, ...data.items.filter(t => !prev.some(p => p.id === t.id))]);
+      setNextCursor(data.next_cursor);
+    } catch (error) {
+       console.error("Failed to load transactions", error);
+    } finally {
+      setLoadingMore(false);
+    }
+  };
+
   return (
     <div className="space-y-6 animate-in fade-in duration-500">
       <div className="flex flex-col sm:flex-row justify-between items-start sm:items-center gap-4">
@@ -50,18 +105,53 @@ const Transactions = () => {
         </button>
       </div>
 
-      <div className="bg-white p-4 rounded-xl border border-gray-200 shadow-sm">
-        <label className="block text-sm font-medium text-gray-700 mb-2">กรองตามสินค้า</label>
-        <select
-          value={selectedProduct}
-          onChange={(e) => setSelectedProduct(e.target.value)}
-          className="w-full md:w-96 px-3 py-2 border border-gray-300 rounded-lg focus:ring-2 focus:ring-amber-500"
-        >
-          <option value="">ทั้งหมด</option>
-          {products.map(p => (
-            <option key={p.id} value={p.id}>{p.code} - {p.name}</option>
-          ))}
-        </select>
+      <div className="bg-white p-4 rounded-xl border border-gray-200 shadow-sm flex flex-col md:flex-row md:items-end gap-4">
+        <div>
+          <label className="block text-sm font-medium text-gray-700 mb-2">กรองตามสินค้า</label>
+          <select
+            value={selectedProduct}
+            onChange={(e) => setSelectedProduct(e.target.value)}
+            className="w-full md:w-96 px-3 py-2 border border-gray-300 rounded-lg focus:ring-2 focus:ring-amber-500"
+          >
+            <option value="">ทั้งหมด</option>
+            {products.map(p => (
+              <option key={p.id} value={p.id}>{p.code} - {p.name}</option>
+            ))}
+          </select>
+        </div>
+        <div>
+          <label className="block text-sm font-medium text-gray-700 mb-2">ประเภท</label>
+          <select
+            value={transactionType}
+            onChange={(e) => setTransactionType(e.target.value)}
+            className="w-full md:w-40 px-3 py-2 border border-gray-300 rounded-lg focus:ring-2 focus:ring-amber-500"
+          >
+            <option value="">ทั้งหมด</option>
+            <option value="in">รับเข้า</option>
+            <option value="out">จ่ายออก</option>
+          </select>
+        </div>
+        <div>
+          <label className="block text-sm font-medium text-gray-700 mb-2">ตั้งแต่วันที่</label>
+          <input
+            type="date"
+            value={dateFrom}
+            onChange={(e) => setDateFrom(e.target.value)}
+            className="w-full px-3 py-2 border border-gray-300 rounded-lg focus:ring-2 focus:ring-amber-500"
+          />
+        </div>
+        <div>
+          <label className="block text-sm font-medium text-gray-700 mb-2">ถึงวันที่</label>
+          <input
+            type="date"
+            value={dateTo}
+            onChange={(e) => setDateTo(e.target.value)}
+            className="w-full px-3 py-2 border border-gray-300 rounded-lg focus:ring-2 focus:ring-amber-500"
+          />
+        </div>
+        {total !== null && (
+          <p className="text-sm text-gray-600 md:ml-auto">ทั้งหมด {total.toLocaleString()} รายการ</p>
+        )}
       </div>
 
       <div className="bg-white rounded-xl shadow-sm border border-gray-200 overflow-hidden">
@@ -72,7 +162,7 @@ const Transactions = () => {
         ) : transactions.length === 0 ? (
             <EmptyState 
               title="ไม่มีประวัติธุรกรรม" 
-              description={selectedProduct ? "ไม่พบธุรกรรมสำหรับสินค้านี้" : "ยังไม่มีการบันทึกธุรกรรม"}
+              description={selectedProduct || transactionType || dateFrom || dateTo ? "ไม่พบธุรกรรมตามเงื่อนไขที่เลือก" : "ยังไม่มีการบันทึกธุรกรรม"}
               action={
                 <button
                     onClick={() => setShowAddModal(true)}
@@ -130,6 +220,17 @@ const Transactions = () => {
                 ))}
               </tbody>
             </table>
+            {nextCursor && (
+              <div className="p-4 border-t border-gray-100 text-center">
+                <button
+                  onClick={loadMoreTransactions}
+                  disabled={loadingMore}
+                  className="text-amber-600 font-medium hover:text-amber-700 hover:underline disabled:opacity-50"
+                >
+                  {loadingMore ? 'กำลังโหลด...' : 'โหลดเพิ่ม'}
+                </button>
+              </div>
+            )}
           </div>
         )}
       </div>
@@ -19,3 +19,22 @@ export const apiCall = async (endpoint, options = {}) => {
         throw error;
     }
 };
+
+// Live updates pushed by the backend over server-sent events.
+// `handlers` maps event types (stock, reorder, transaction, import, resync)
+// to callbacks. `resync` is also called after a reconnect, since events sent
+// while disconnected are lost. Returns a function that closes the stream.
+export const subscribeEvents = (handlers) => {
+    const source = new EventSource(`${API_URL}/api/events`);
+    let connected = false;
+
+    source.onopen = () => {
+        if (connected && handlers.resync) handlers.resync();
+        connected = true;
+    };
+    Object.entries(handlers).forEach(([type, handler]) => {
+        source.addEventListener(type, (e) => handler(JSON.parse(e.data)));
+    });
+
+    return () => source.close();
+};